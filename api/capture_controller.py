@@ -0,0 +1,161 @@
+"""
+Adaptive rate and resolution control for the screenshot service.
+
+CaptureController decides, before every capture, whether to capture at all,
+how long to wait until the next one and at what resolution:
+
+- No viewers (dashboards subscribed to screenshots, or open desktop streams):
+  capture pauses.
+- Interacting: a boost captures at min_interval for boost_seconds, whatever
+  the budget says, so the view keeps up with the user.
+- Otherwise the interval is the configured one (screenshot.interval), slowed
+  down when the measured CPU cost per capture would exceed cpu_budget (a
+  fraction of one core). When even max_interval cannot keep within the budget,
+  frames are downscaled by 2 per side (up to max_downscale), and scaled back
+  up once there is room for it at the configured interval.
+
+The cost is an exponential moving average of the CPU seconds each capture
+takes, including the xwd/convert child processes when that backend is used.
+"""
+
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CPU_BUDGET = 0.25  # Fraction of one core the screenshot service may use
+DEFAULT_MIN_INTERVAL = 0.2  # Seconds between captures while boosted
+DEFAULT_MAX_INTERVAL = 5.0  # Longest interval before resolution is reduced instead
+DEFAULT_BOOST_SECONDS = 10.0
+DEFAULT_MAX_DOWNSCALE = 4  # Largest divisor applied to each side of the frame
+COST_SMOOTHING = 0.3  # Weight of the newest capture in the cost average
+SETTLE_CAPTURES = 5  # Captures to measure at a new scale before changing it again
+
+
+class CaptureController:
+    """
+    Thread-safe capture policy: the screenshot thread asks decide() before each
+    capture and reports its cost with record(); requests call boost().
+
+    Args:
+        cpu_budget: Fraction of one core captures may use on average.
+        min_interval: Interval while boosted (and the shortest ever used).
+        max_interval: Longest interval the budget may stretch captures to before downscaling.
+        boost_seconds: How long a boost lasts.
+        max_downscale: Largest per-side divisor (1 disables downscaling).
+        pause_without_viewers: Stop capturing while nobody watches.
+        clock: Monotonic time source (for tests).
+    """
+
+    def __init__(self, cpu_budget=DEFAULT_CPU_BUDGET, min_interval=DEFAULT_MIN_INTERVAL,
+                 max_interval=DEFAULT_MAX_INTERVAL, boost_seconds=DEFAULT_BOOST_SECONDS,
+                 max_downscale=DEFAULT_MAX_DOWNSCALE, pause_without_viewers=True, clock=time.monotonic):
+        self.cpu_budget = _positive(cpu_budget, DEFAULT_CPU_BUDGET)
+        self.min_interval = _positive(min_interval, DEFAULT_MIN_INTERVAL)
+        self.max_interval = max(self.min_interval, _positive(max_interval, DEFAULT_MAX_INTERVAL))
+        self.boost_seconds = _positive(boost_seconds, DEFAULT_BOOST_SECONDS)
+        self.max_downscale = max(1, int(_positive(max_downscale, DEFAULT_MAX_DOWNSCALE)))
+        self.pause_without_viewers = pause_without_viewers
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._boost_until = 0.0
+        self._settle = 0
+        self.downscale = 1  # Current per-side divisor
+        self.cost = None  # Average CPU seconds per capture at the current downscale
+        self.state = "starting"
+        self.interval = None
+        self.viewers = 0
+        self.boosts = 0
+
+    def boost(self, seconds=None):
+        """Capture at min_interval for a while (the user is interacting with the desktop view)."""
+        with self._lock:
+            self._boost_until = max(self._boost_until, self._clock() + (seconds or self.boost_seconds))
+            self.boosts += 1
+        self.wake()
+
+    def wake(self):
+        """End the current wait() early (a boost, or the service stopping)."""
+        self._wake.set()
+
+    def wait(self, timeout):
+        """Sleep until the next capture is due, or until a boost cuts the wait short."""
+        woken = self._wake.wait(timeout)
+        self._wake.clear()
+        return woken
+
+    def record(self, cpu_seconds):
+        """Report the CPU seconds the last capture took."""
+        with self._lock:
+            cpu_seconds = max(0.0, cpu_seconds)
+            self.cost = cpu_seconds if self.cost is None else (
+                COST_SMOOTHING * cpu_seconds + (1 - COST_SMOOTHING) * self.cost)
+            self._settle = max(0, self._settle - 1)
+
+    def decide(self, viewers, preferred_interval):
+        """
+        The (interval, downscale) for the next capture; interval is None while paused.
+
+        Args:
+            viewers: How many clients currently watch the desktop.
+            preferred_interval: The configured interval (screenshot.interval).
+        """
+        with self._lock:
+            self.viewers = viewers
+            boosting = self._clock() < self._boost_until
+            if not viewers and not boosting and self.pause_without_viewers:
+                self.state, self.interval = "paused", None
+                return None, self.downscale
+            preferred = max(self.min_interval, float(preferred_interval or 1.0))
+            if boosting:
+                self.state, self.interval = "boost", self.min_interval
+                return self.interval, self.downscale
+
+            self._adjust_downscale(preferred)
+            needed = self.cost / self.cpu_budget if self.cost else 0.0
+            self.interval = min(max(self.max_interval, preferred), max(preferred, needed))
+            self.state = "budget_limited" if needed > preferred else "normal"
+            return self.interval, self.downscale
+
+    def _adjust_downscale(self, preferred):
+        if self.cost is None or self._settle:
+            return
+        needed = self.cost / self.cpu_budget
+        if needed > self.max_interval and self.downscale < self.max_downscale:
+            self._set_downscale(self.downscale * 2, self.cost / 4)
+        elif self.downscale > 1 and (self.cost * 4) / self.cpu_budget <= preferred:
+            self._set_downscale(self.downscale // 2, self.cost * 4)
+
+    def _set_downscale(self, downscale, estimated_cost):
+        logger.info(f"Screenshot downscale {self.downscale} -> {downscale} "
+                    f"(capture cost {self.cost * 1000:.0f} ms CPU, budget {self.cpu_budget:.0%} of a core)")
+        self.downscale = downscale
+        self.cost = estimated_cost  # Pixel count scales with the square; re-measured from here
+        self._settle = SETTLE_CAPTURES
+
+    def stats(self):
+        """The current decisions and the measurements behind them."""
+        with self._lock:
+            interval = self.interval
+            return {
+                "state": self.state,
+                "viewers": self.viewers,
+                "interval": round(interval, 3) if interval else None,
+                "fps": round(1 / interval, 2) if interval else 0.0,
+                "downscale": self.downscale,
+                "capture_cpu_ms": round(self.cost * 1000, 1) if self.cost is not None else None,
+                "cpu_load": round(self.cost / interval, 3) if interval and self.cost is not None else 0.0,
+                "cpu_budget": self.cpu_budget,
+                "boost_remaining": round(max(0.0, self._boost_until - self._clock()), 1),
+                "boosts": self.boosts,
+            }
+
+
+def _positive(value, default):
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return default
+    return value if value > 0 else default
@@ -129,11 +129,4 @@ async def broadcast_container_status():
     """Broadcast container status to all connected clients."""
     containers = await get_containers()
 
-    status_data = {
-        'type': 'docker_containers',
-        'data': {
-            'containers': containers
-        }
-    }
-
-    await globals.manager.broadcast(json.dumps(status_data))
+    await globals.manager.publish('docker_containers', {'containers': containers})
@@ -0,0 +1,83 @@
+"""
+Change detection between consecutive desktop frames.
+
+FrameDiffer compares each grabbed RGB frame with the previous one: an
+identical frame (the common case while the Kick page is quiet) is detected
+with a single memcmp-speed comparison and never encoded or broadcast. A changed
+frame is reduced to a grid of tiles, and the bounding box of the changed tiles
+is reported so clients know which part of the desktop moved.
+"""
+
+import numpy as np
+
+DEFAULT_TILE_SIZE = 32  # Pixels per side of a change-detection tile
+
+
+class FrameChange:
+    """
+    How a frame differs from the previous one.
+
+    Attributes:
+        region: (x, y, width, height) of the changed tiles, clipped to the frame, or None if unchanged.
+        changed_tiles: Number of tiles with at least one changed pixel.
+        total_tiles: Number of tiles in the frame.
+    """
+
+    __slots__ = ("region", "changed_tiles", "total_tiles")
+
+    def __init__(self, region, changed_tiles, total_tiles):
+        self.region = region
+        self.changed_tiles = changed_tiles
+        self.total_tiles = total_tiles
+
+    def as_dict(self):
+        x, y, width, height = self.region or (0, 0, 0, 0)
+        return {"x": x, "y": y, "width": width, "height": height,
+                "changed_tiles": self.changed_tiles, "total_tiles": self.total_tiles}
+
+
+class FrameDiffer:
+    """
+    Tracks the previous frame and reports what changed in the next one.
+
+    The first frame, and any frame whose size differs from the previous one,
+    counts as entirely changed.
+
+    Args:
+        tile_size: Pixels per side of a tile (at least 1).
+    """
+
+    def __init__(self, tile_size=DEFAULT_TILE_SIZE):
+        self.tile_size = max(1, int(tile_size))
+        self._previous = None
+        self.unchanged = 0  # Frames found identical to their predecessor
+
+    def reset(self):
+        """Forget the previous frame, so the next one counts as entirely changed."""
+        self._previous = None
+
+    def diff(self, rgb):
+        """
+        Compare an RGB frame (height x width x 3) with the previous one and remember it.
+
+        The frame is kept by reference: callers must not modify it afterwards.
+        """
+        height, width = rgb.shape[:2]
+        size = self.tile_size
+        rows, columns = -(-height // size), -(-width // size)
+        previous, self._previous = self._previous, rgb
+        if previous is None or previous.shape != rgb.shape:
+            return FrameChange((0, 0, width, height), rows * columns, rows * columns)
+        if np.array_equal(previous, rgb):
+            self.unchanged += 1
+            return FrameChange(None, 0, rows * columns)
+
+        # Reduce per-byte differences to per-tile flags: along each row first, then down the columns
+        changed = (previous != rgb).reshape(height, width * 3)
+        changed = np.logical_or.reduceat(changed, np.arange(0, width * 3, size * 3), axis=1)
+        tiles = np.logical_or.reduceat(changed, np.arange(0, height, size), axis=0)
+        tile_rows, tile_columns = np.nonzero(tiles.any(axis=1))[0], np.nonzero(tiles.any(axis=0))[0]
+        x, y = int(tile_columns[0]) * size, int(tile_rows[0]) * size
+        right = min(width, (int(tile_columns[-1]) + 1) * size)
+        bottom = min(height, (int(tile_rows[-1]) + 1) * size)
+        return FrameChange((x, y, right - x, bottom - y), int(tiles.sum()), rows * columns)
@@ -0,0 +1,131 @@
+"""
+In-memory store of encoded desktop frames.
+
+The screenshot thread publishes each encoded frame here and /api/screenshot
+serves the bytes straight from memory, so nothing touches the disk per frame.
+Every frame gets a sequence number and an ETag derived from its bytes: a
+browser revalidating with If-None-Match gets a 304 while the desktop is
+unchanged, even across captures. A small ring of recent frames stays
+addressable by seq, so a client that was told about frame N still gets
+exactly frame N if a newer capture lands before its request does. Seqs are
+only meaningful within one store: each store has a random instance id that
+URLs carry next to the seq, so another app process (a worker behind the same
+load balancer) never serves its own frame N in place of this one.
+
+Streams (api/frame_stream.py) wait on next_frame(), which the capture thread
+wakes on each publish.
+"""
+
+import asyncio
+import collections
+import hashlib
+import threading
+import time
+import uuid
+
+DEFAULT_FRAME_HISTORY = 8  # Recent frames kept addressable by seq
+
+
+class Frame:
+    """One encoded frame (immutable once published)."""
+
+    __slots__ = ("seq", "data", "content_type", "etag", "timestamp", "change")
+
+    def __init__(self, seq, data, content_type, etag, timestamp, change=None):
+        self.seq = seq
+        self.data = data
+        self.content_type = content_type
+        self.etag = etag
+        self.timestamp = timestamp
+        self.change = change  # What changed since the previous frame (a frame_diff.FrameChange), if known
+
+
+def frame_etag(data):
+    """Strong ETag for frame bytes (identical frames share it)."""
+    return f'"{hashlib.blake2b(data, digest_size=12).hexdigest()}"'
+
+
+def etag_matches(if_none_match, etag):
+    """Whether an If-None-Match header value covers etag (weak comparison, as RFC 9110 asks for)."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    bare = etag.removeprefix("W/")
+    return any(candidate.strip().removeprefix("W/") == bare for candidate in if_none_match.split(","))
+
+
+def _resolve(future, frame):
+    if not future.done():
+        future.set_result(frame)
+
+
+class FrameStore:
+    """
+    Thread-safe ring of the latest encoded frames.
+
+    Args:
+        history: How many recent frames stay addressable by seq (at least 1).
+        instance: Id telling this store's seqs apart from other stores' (random by default).
+    """
+
+    def __init__(self, history=DEFAULT_FRAME_HISTORY, instance=None):
+        self.instance = instance or uuid.uuid4().hex[:8]
+        self._frames = collections.deque(maxlen=max(1, int(history)))
+        self._lock = threading.Lock()
+        self._waiters = []  # (event loop, future) pairs waiting in next_frame()
+        self.last_seq = 0
+
+    def publish(self, data, content_type="image/png", change=None):
+        """Store a new frame and return it."""
+        etag = frame_etag(data)
+        with self._lock:
+            self.last_seq += 1
+            frame = Frame(self.last_seq, data, content_type, etag, time.time(), change)
+            self._frames.append(frame)
+            waiters, self._waiters = self._waiters, []
+        for loop, future in waiters:
+            try:
+                loop.call_soon_threadsafe(_resolve, future, frame)
+            except RuntimeError:
+                pass  # That event loop has closed
+        return frame
+
+    async def next_frame(self, after_seq=0):
+        """The latest frame once its seq is past after_seq, waiting for a publish if needed."""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._frames and self._frames[-1].seq > after_seq:
+                return self._frames[-1]
+            future = loop.create_future()
+            # Drop waiters whose caller gave up (a timeout or a closed stream) while adding this one
+            self._waiters = [waiter for waiter in self._waiters if not waiter[1].done()]
+            self._waiters.append((loop, future))
+        return await future
+
+    def latest(self):
+        """The newest frame, or None before the first capture."""
+        with self._lock:
+            return self._frames[-1] if self._frames else None
+
+    def get(self, seq, instance=None):
+        """The frame with this seq, or None once it has left the ring (or if instance names another store)."""
+        if instance is not None and instance != self.instance:
+            return None
+        with self._lock:
+            if not self._frames or not self._frames[0].seq <= seq <= self._frames[-1].seq:
+                return None
+            return self._frames[seq - self._frames[0].seq]
+
+    def clear(self):
+        with self._lock:
+            self._frames.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "instance": self.instance,
+                "last_seq": self.last_seq,
+                "frames": len(self._frames),
+                "bytes": sum(len(frame.data) for frame in self._frames),
+            }
@@ -0,0 +1,89 @@
+"""
+Live desktop view as a multipart/x-mixed-replace stream.
+
+An <img> pointed at /api/screenshot/stream keeps one connection open and
+shows each part as it arrives, instead of fetching every frame separately
+after a screenshot_update notice. Frames come straight from the FrameStore as
+the capture loop publishes them, in the encoding they were stored in.
+
+Each client sets its own frame-rate cap (?fps=): frames published faster
+than that collapse into the newest one, so a slow or capped viewer never
+queues stale frames.
+"""
+
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+MULTIPART_BOUNDARY = "chattastic-frame"
+MULTIPART_MEDIA_TYPE = f"multipart/x-mixed-replace; boundary={MULTIPART_BOUNDARY}"
+DEFAULT_STREAM_MAX_FPS = 10.0  # Highest frame rate a client may ask for
+STREAM_RESEND_INTERVAL = 10.0  # Seconds without a new frame before the current one is sent again
+STREAM_HEADERS = {
+    "Cache-Control": "no-cache, no-store",
+    "X-Accel-Buffering": "no",  # Stop nginx from buffering the stream
+}
+
+stream_clients = 0  # Streams currently open
+
+
+def parse_fps(value, max_fps=DEFAULT_STREAM_MAX_FPS):
+    """A client's frame-rate cap: value clamped to (0, max_fps], max_fps if absent or invalid."""
+    try:
+        max_fps = float(max_fps)
+    except (TypeError, ValueError):
+        max_fps = DEFAULT_STREAM_MAX_FPS
+    try:
+        fps = float(value)
+    except (TypeError, ValueError):
+        return max_fps
+    return min(fps, max_fps) if fps > 0 else max_fps
+
+
+def multipart_part(frame):
+    """
+    One frame as a multipart body part, closed by the next boundary.
+
+    Browsers show a part once the boundary after it arrives, so sending the
+    boundary right after the data (not before the next frame) avoids showing
+    every frame one frame late.
+    """
+    headers = (f"Content-Type: {frame.content_type}\r\nContent-Length: {len(frame.data)}\r\n"
+               f"X-Frame-Seq: {frame.seq}\r\n\r\n")
+    return headers.encode() + frame.data + f"\r\n--{MULTIPART_BOUNDARY}\r\n".encode()
+
+
+async def stream_frames(store, fps=DEFAULT_STREAM_MAX_FPS, resend_interval=STREAM_RESEND_INTERVAL):
+    """
+    Yield the multipart response body for a FrameStore.
+
+    Args:
+        store: The FrameStore fed by the capture loop.
+        fps: This client's frame-rate cap.
+        resend_interval: Seconds of an unchanged desktop before the current frame is
+            sent again, so proxies do not close the idle connection.
+    """
+    global stream_clients
+    stream_clients += 1
+    loop = asyncio.get_running_loop()
+    min_gap = 1.0 / fps
+    sent_seq, next_at = 0, 0.0
+    try:
+        yield f"--{MULTIPART_BOUNDARY}\r\n".encode()
+        while True:
+            delay = next_at - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)  # The cap: frames published meanwhile collapse into the newest
+            try:
+                async with asyncio.timeout(resend_interval):
+                    frame = await store.next_frame(sent_seq)
+            except TimeoutError:
+                frame = store.latest()
+                if frame is None:
+                    continue
+            sent_seq = frame.seq
+            next_at = loop.time() + min_gap
+            yield multipart_part(frame)
+    finally:
+        stream_clients -= 1
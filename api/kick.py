@@ -5,16 +5,19 @@ import asyncio
 import os
 import random
 import threading
-from queue import Queue
+import secrets
 # Assuming config.py and globals.py exist and are configured
 import config
 # Removed proxy config import
 import globals # Import globals to access kick_emotes
 import logging
-from bs4 import BeautifulSoup, Tag # Import BeautifulSoup
 import stealth_requests as requests # Import stealth_requests
 import requests as standard_requests # Import standard requests for exceptions, Timeout
 from api import settings # Import settings module for command customization
+from api import kick_parser # Chat HTML parsing backends (lxml / BeautifulSoup)
+from api.kick_parser import _parse_kick_message_html # Kept importable from here for existing callers
+from api import kick_pusher # Browserless ingest engine (Kick's realtime WebSocket)
+from api.kick_session import KickChannelSession, KickSessionRegistry # Per-channel connection state
 
 # Set up logging
 # logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s') # Example basic config
@@ -48,29 +51,27 @@ def patched_init(self, *args, **kwargs):
 uc.ChromeOptions.__init__ = patched_init
 
 # --- Globals ---
-# Persistent Selenium driver instance for scraping the live chat DOM
-selenium_driver = None # WebDriver instance for ongoing chat polling
+# Connected channels. Each KickChannelSession holds one channel's ingest queue, dedup
+# cache, tasks, Selenium driver, push token, history and metrics, so channels can be
+# connected and disconnected independently.
+sessions = KickSessionRegistry()
 
-# Thread-safe queue and polling control
-message_queue = Queue()
-last_processed_index = -1  # Track the last processed message index
-polling_active = False
-polling_task = None
-streaming_task = None
+# Ingest pipeline defaults
+# Each session has a bounded asyncio queue of chat container HTML batches (full snapshots,
+# drained or pushed rows) or already-parsed message batches (Pusher engine) feeding the
+# parse -> dedup -> commands -> broadcast -> history pipeline in stream_messages.
+DEFAULT_INGEST_QUEUE_SIZE = 100
 
-# Keep-alive timer thread
-keep_alive_timer = None
-keep_alive_active = False
+# Selenium drivers of disconnected browser sessions, kept running for reuse by the next connection
+idle_drivers = []
 
-# Message activity tracking
-last_message_time = 0  # Timestamp of last message received
-message_activity_lock = threading.Lock()  # Lock for thread-safe updates
+# Chatroom ids from the channel API, keyed by channel id (the Pusher engine subscribes by chatroom)
+channel_chatroom_ids = {}
 
 # Message deduplication tracking
-processed_message_ids = set()  # Set to track processed message IDs
-MAX_PROCESSED_IDS = 1000  # Maximum number of message IDs to keep in memory
+MAX_PROCESSED_IDS = 1000  # Maximum number of message IDs to keep in memory (per channel)
 MAX_KICK_INDEX = 299  # Maximum index value used by Kick chat (after this, indexes are reused)
-last_processed_timestamps = {}  # Dictionary to track the last processed timestamp for each index
+DEFAULT_DEDUP_WINDOW = 120  # Seconds a message key stays remembered after it was last seen
 # --- Globals End ---
 
 # Removed get_zenrows_browser function as stealth_requests handles this internally
@@ -213,6 +214,10 @@ async def get_kick_channel_id(username):
             logger.warning(f"Channel ID key 'id' not found in JSON for username: {username}. Data: {data}")
             return None
 
+        chatroom_id = (data.get("chatroom") or {}).get("id")
+        if chatroom_id:
+            channel_chatroom_ids[str(channel_id)] = str(chatroom_id)
+
         logger.info(f"Found channel ID for {username}: {channel_id}")
         return str(channel_id)
 
@@ -298,132 +303,6 @@ async def get_latest_subscriber(channel_id):
         return None
 # --- End API Calls ---
 
-def _parse_kick_message_html(html_content: str):
-    """
-    Parses the HTML content of a Kick chat message group using BeautifulSoup
-    based on the observed structure (July 2024).
-
-    Args:
-        html_content: The raw outerHTML string of the message's <div class="group..."> element.
-
-    Returns:
-        A dictionary containing:
-        - 'sender': The username of the message sender.
-        - 'message_text': The textual content of the message, with emotes replaced by placeholders like [emote:name|id].
-        - 'emotes': A list of dictionaries, each containing 'name', 'url', and 'id' for an emote.
-        - 'timestamp': The timestamp string (e.g., '10:53 PM') or None.
-        - 'is_reply': Boolean indicating if it's a reply message.
-        Returns None if essential elements cannot be found.
-    """
-    if not html_content:
-        return None
-
-    try:
-        # If the input is already a BeautifulSoup object, use it directly
-        if isinstance(html_content, BeautifulSoup) or isinstance(html_content, Tag):
-            soup = html_content
-        else:
-            # Otherwise parse the HTML string
-            soup = BeautifulSoup(html_content, 'html.parser')
-
-        sender = "System"
-        message_parts = []
-        emotes = []
-        timestamp = None
-        is_reply = False
-        main_content_div = None # The div holding the timestamp, user, message span
-
-        # --- Detect Reply and Find Main Content Div ---
-        # Replies have a specific structure with a header div containing "Replying to"
-        # The actual message is in the *next* div sibling.
-        # Look for the reply header using a class and text content check
-        reply_header = soup.find('div', class_='text-white/40', string=lambda t: t and "Replying to" in t)
-
-        if reply_header:
-            is_reply = True
-            # In replies, the main content div is the next sibling
-            main_content_div = reply_header.find_next_sibling('div')
-            if not main_content_div:
-                 logger.warning("Detected reply structure but couldn't find the sibling content div.")
-                 # Fallback: Try finding the standard content div just in case structure is mixed
-                 main_content_div = soup.find('div', class_=lambda x: x and 'betterhover:group-hover:bg-shade-lower' in x.split())
-        else:
-            # Standard message: Find the div that wraps timestamp, user, message
-            # It has many classes, but 'betterhover:group-hover:bg-shade-lower' seems distinct enough
-            is_reply = False
-            main_content_div = soup.find('div', class_=lambda x: x and 'betterhover:group-hover:bg-shade-lower' in x.split())
-
-        # If we couldn't find the main content area, we can't proceed reliably
-        if not main_content_div:
-            logger.warning(f"Could not locate the main content div (reply={is_reply}) within the provided HTML snippet.")
-            logger.debug(f"HTML Snippet: {html_content[:500]}...")
-            return None # Indicate parsing failure
-
-        # --- Extract Timestamp (within main_content_div) ---
-        ts_el = main_content_div.find('span', class_='text-neutral')
-        if ts_el:
-            timestamp = ts_el.get_text(strip=True)
-
-        # --- Extract Sender ---
-        user_button = main_content_div.find('button', class_='inline font-bold', title=True)
-        if user_button:
-            sender = user_button['title'] # Use the title attribute
-        else:
-            # Attempt fallback if structure differs slightly (e.g., Bot messages might not use a button)
-            # This part might need adjustment based on how system/bot messages appear
-            logger.debug("Could not find standard user button. Might be system message or structure changed.")
-            # Basic fallback: Look for any element with a title nearby? Less reliable.
-
-        # --- Extract Message Content and Emotes (within main_content_div) ---
-        message_span = main_content_div.find('span', class_='font-normal leading-[1.55]')
-        if message_span:
-            for element in message_span.children:
-                if isinstance(element, Tag):
-                    # Check if it's an emote wrapper span
-                    if element.name == 'span' and element.has_attr('data-emote-id'):
-                        img_tag = element.find('img', alt=True, src=True)
-                        if img_tag:
-                            emote_name = img_tag.get('alt')
-                            emote_url = img_tag.get('src')
-                            emote_id = element.get('data-emote-id', "unknown")
-
-                            if emote_name:
-                                message_parts.append(f"[emote:{emote_name}|{emote_id}]")
-                                emotes.append({"name": emote_name, "url": emote_url, "id": emote_id})
-                            else:
-                                message_parts.append("[emote]") # Placeholder if name is missing
-                        else:
-                            # Span looks like an emote wrapper but missing img? Append placeholder.
-                            message_parts.append("[emote]")
-                    else:
-                        # Append text content of other nested tags (e.g., <a>, <b> if they appear)
-                        message_parts.append(element.get_text())
-                elif isinstance(element, str): # Check for NavigableString explicitly
-                    # It's plain text
-                    message_parts.append(str(element))
-
-        message_text = "".join(message_parts).strip()
-
-        # --- Final Check ---
-        # Ensure we have at least a sender, even if message is empty (e.g., user just posted emotes)
-        if sender == "System" and not message_text and not emotes:
-             logger.debug("Parsed message resulted in empty content and System sender. Discarding.")
-             return None # Or return a minimal dict if you want to capture system messages differently
-
-        return {
-            "sender": sender,
-            "message_text": message_text,
-            "emotes": emotes,
-            "timestamp": timestamp,
-            "is_reply": is_reply,
-        }
-
-    except Exception as e:
-        logger.exception(f"Critical error parsing message HTML: {e}")
-        logger.debug(f"Failed HTML Snippet: {html_content[:500]}...")
-        return None # Return None on major parsing errors
-
-
 def parse_kick_timestamp(time_str):
     """Placeholder for parsing Kick's chat timestamp (e.g., '08:22 PM') if needed."""
     return time_str.strip() # Currently returns as string
@@ -491,218 +370,335 @@ async def wait_for_element_with_retry(driver, by, value, max_retries=2, delay=1,
     raise last_exception or TimeoutException(f"Element '{selector_str}' not found after {max_retries} attempts.")
 
 
-async def poll_messages(channel_name):
-    """Continuously poll for new chat messages using the persistent Selenium driver."""
-    global last_processed_index, polling_active, selenium_driver, last_message_time, last_processed_timestamps
-    if not selenium_driver or not selenium_driver.session_id:
-        logger.error("Polling cannot start: Persistent Selenium driver is not initialized or session is invalid.")
-        polling_active = False
-        return
+# --- Incremental (MutationObserver) chat capture ---
+# Injected once into the Kick page. Buffers only the `div[data-index]` rows that
+# were added (or re-rendered) since the last drain, so each poll tick costs
+# O(new rows) instead of serializing the whole #chatroom-messages container.
+# When a push URL is passed as arguments[0], new rows are also forwarded straight
+# to the backend over a WebSocket as soon as they render; rows only stay buffered
+# for the polling drain while that socket is down.
+CHAT_OBSERVER_INSTALL_SCRIPT = """
+    const pushUrl = arguments[0] || null;
+    const container = document.getElementById('chatroom-messages');
+    if (!container) { return false; }
+    if (window.__chattasticObserver) { window.__chattasticObserver.disconnect(); }
+    if (window.__chattasticSocket) {
+        window.__chattasticSocket.onclose = null;
+        window.__chattasticSocket.close();
+        window.__chattasticSocket = null;
+    }
 
-    logger.info(f"Starting Kick chat DOM polling for channel: {channel_name}")
-    chat_container_selector = "#chatroom-messages"
+    const pending = new Set();
+    let flushScheduled = false;
+    const flush = () => {
+        flushScheduled = false;
+        const socket = window.__chattasticSocket;
+        if (!socket || socket.readyState !== WebSocket.OPEN || pending.size === 0) { return; }
+        const rows = [];
+        pending.forEach((el) => {
+            if (el.isConnected) { rows.push(el.outerHTML); }
+        });
+        pending.clear();
+        if (rows.length) { socket.send(JSON.stringify({ rows: rows })); }
+    };
+    const scheduleFlush = () => {
+        if (!flushScheduled && window.__chattasticSocket) {
+            flushScheduled = true;
+            queueMicrotask(flush);
+        }
+    };
+    const connectPush = () => {
+        if (!pushUrl || window.__chattasticContainer !== container) { return; }
+        let socket;
+        try {
+            socket = new WebSocket(pushUrl);
+        } catch (e) {
+            console.error('Chattastic push channel error:', e);
+            return;
+        }
+        window.__chattasticSocket = socket;
+        socket.onopen = flush;
+        socket.onclose = () => {
+            if (window.__chattasticSocket === socket) { window.__chattasticSocket = null; }
+            setTimeout(connectPush, 2000);
+        };
+    };
+    const collect = (node) => {
+        if (!node || node.nodeType !== 1) {
+            node = node && node.parentElement;
+            if (!node) { return; }
+        }
+        const row = node.closest('div[data-index]');
+        if (row && container.contains(row)) { pending.add(row); }
+        node.querySelectorAll('div[data-index]').forEach((el) => pending.add(el));
+    };
+
+    const observer = new MutationObserver((mutations) => {
+        for (const mutation of mutations) {
+            if (mutation.type === 'childList') {
+                mutation.addedNodes.forEach(collect);
+            } else {
+                collect(mutation.target);
+            }
+        }
+        scheduleFlush();
+    });
+    observer.observe(container, {
+        childList: true,
+        subtree: true,
+        characterData: true,
+        attributes: true,
+        attributeFilter: ['data-index']
+    });
+
+    // Rows already on screen count as new on the first drain
+    container.querySelectorAll('div[data-index]').forEach((el) => pending.add(el));
+
+    window.__chattasticObserver = observer;
+    window.__chattasticContainer = container;
+    window.__chattasticDrain = () => {
+        if (document.getElementById('chatroom-messages') !== window.__chattasticContainer) {
+            return null; // Container was re-mounted (e.g. page refresh), observer must be reinstalled
+        }
+        const rows = [];
+        pending.forEach((el) => {
+            if (el.isConnected) { rows.push(el.outerHTML); }
+        });
+        pending.clear();
+        return rows;
+    };
+    connectPush();
+    return true;
+"""
 
-    while polling_active:
-        try:
-            # Check driver liveness
-            try:
-                _ = await asyncio.to_thread(getattr, selenium_driver, 'current_url')
-            except WebDriverException as wd_err:
-                logger.warning(f"Polling loop detected WebDriverException (driver likely closed): {wd_err}. Stopping.")
-                polling_active = False
-                break
+CHAT_OBSERVER_DRAIN_SCRIPT = """
+    return window.__chattasticDrain ? window.__chattasticDrain() : null;
+"""
 
-            chat_container_html = None
-            try:
-                # Find the main chat container element
-                chat_container_element = await asyncio.to_thread(
-                    lambda: selenium_driver.find_element(By.CSS_SELECTOR, chat_container_selector)
-                )
-                # Get its HTML content
-                chat_container_html = await asyncio.to_thread(
-                    lambda: chat_container_element.get_attribute("outerHTML")
-                )
-                with message_activity_lock:
-                    last_message_time = time.time() # Update activity time
 
-            except Exception as container_err:
-                logger.warning(f"Error finding or getting HTML for chat container '{chat_container_selector}': {container_err}")
-                await asyncio.sleep(2)
-                continue
+def get_push_url(session):
+    """Build the backend URL the injected page script of a session pushes new rows to."""
+    base_url = settings.get_setting("kick.push_url", "ws://127.0.0.1:8000/ws/kick-ingest")
+    return f"{base_url}?token={session.push_token}"
 
-            if not chat_container_html:
-                logger.debug("No chat container HTML retrieved.")
-                await asyncio.sleep(1)
-                continue
 
-            # --- Parse with BeautifulSoup ---
-            soup = BeautifulSoup(chat_container_html, 'html.parser')
+def is_valid_push_token(token):
+    """Check the token presented by a page script connecting to the push endpoint."""
+    return sessions.find_by_push_token(token) is not None
 
-            # Select the divs with data-index directly under the chat container
-            message_index_elements = soup.select(f'{chat_container_selector} div[data-index]')
 
-            if not message_index_elements:
-                logger.debug("No message elements with 'data-index' found.")
-                await asyncio.sleep(1)
-                continue
+async def ingest_pushed_rows(session, rows):
+    """
+    Queue chat rows pushed by a session's injected page script for its ingest pipeline.
 
-            logger.debug(f"Found {len(message_index_elements)} potential message elements (with data-index).")
+    Waits for room in the bounded ingest queue, so a slow pipeline applies
+    backpressure to the push channel instead of buffering without limit.
 
-            new_messages_found_in_batch = False
-            max_index_in_batch = last_processed_index
-            messages_to_parse = []
+    Args:
+        session: The KickChannelSession the page belongs to.
+        rows: A list of outerHTML strings for `div[data-index]` rows.
 
-            # Iterate through the elements with data-index
-            for element in message_index_elements:
-                try:
-                    index_str = element.get('data-index')
-                    if not index_str: continue
+    Returns:
+        bool: True if the rows were queued.
+    """
+    if not session.active:
+        logger.debug(f"Ignoring pushed Kick chat rows for {session.channel_name}: not connected.")
+        return False
+    if not rows or not isinstance(rows, list):
+        return False
+    html_rows = "".join(row for row in rows if isinstance(row, str))
+    await session.queue.put(f'<div id="chatroom-messages">{html_rows}</div>')
+    return True
 
-                    index = int(index_str)
 
-                    # Find the inner '.group' div which contains the visible message parts
-                    message_group_element = element.find('div', class_='group')
-                    if not message_group_element:
-                        logger.warning(f"Could not find 'div.group' inside element with data-index {index}")
-                        continue
+async def ingest_parsed_messages(session, messages):
+    """
+    Queue messages from a browserless engine (already in the parsed message dict shape).
 
-                    # Extract timestamp from the message group
-                    timestamp_element = message_group_element.find('span', class_='text-neutral')
-                    current_timestamp = timestamp_element.get_text(strip=True) if timestamp_element else None
-
-                    # Extract username for additional uniqueness in message ID
-                    user_button = message_group_element.find('button', class_='inline font-bold', title=True)
-                    username = user_button['title'] if user_button else "unknown"
-
-                    # Extract message content for additional uniqueness
-                    message_span = message_group_element.find('span', class_='font-normal leading-[1.55]')
-                    message_content_preview = ""
-                    if message_span:
-                        message_content_preview = message_span.get_text(strip=True)[:20]  # First 20 chars as preview
-
-                    # Generate a more unique message ID using index, timestamp, username, and content preview
-                    message_id = f"{index}_{current_timestamp}_{username}_{message_content_preview}"
-
-                    # Check if this is a new message by checking if we've seen this ID before
-                    is_new_message = message_id not in processed_message_ids
-
-                    # Special handling for index 299 (max index) and other high indexes that might be reused
-                    if index >= MAX_KICK_INDEX - 5:  # Handle messages near the max index with extra care
-                        if current_timestamp and index in last_processed_timestamps:
-                            # Compare timestamps to determine if this is a new message
-                            last_ts = last_processed_timestamps[index]
-                            # If the timestamp is different, it's likely a new message
-                            if current_timestamp != last_ts:
-                                is_new_message = True
-                                logger.debug(f"New message detected at max index {index} by timestamp change: {last_ts} -> {current_timestamp}")
-                    # As a fallback, also check by index for messages without timestamps
-                    elif not is_new_message and index > last_processed_index:
-                        is_new_message = True
-
-                    if is_new_message:
-                        new_messages_found_in_batch = True
-                        max_index_in_batch = max(max_index_in_batch, index)
-
-                        # Add this message ID to our processed set
-                        processed_message_ids.add(message_id)
-
-                        # Update the timestamp tracking for this index
-                        if current_timestamp:
-                            last_processed_timestamps[index] = current_timestamp
-
-                        # Limit the size of our tracking set to prevent memory issues
-                        if len(processed_message_ids) > MAX_PROCESSED_IDS:
-                            # Convert to list, remove oldest entries, convert back to set
-                            processed_message_ids_list = list(processed_message_ids)
-                            processed_message_ids.clear()
-                            processed_message_ids.update(processed_message_ids_list[-MAX_PROCESSED_IDS:])
-
-                        # Limit the size of the timestamps dictionary
-                        if len(last_processed_timestamps) > MAX_PROCESSED_IDS:
-                            # Keep only the most recent entries
-                            temp_dict = {}
-                            for k in sorted(last_processed_timestamps.keys())[-MAX_PROCESSED_IDS:]:
-                                temp_dict[k] = last_processed_timestamps[k]
-                            # Assign to the global variable
-                            last_processed_timestamps = temp_dict
-
-                        # Get the HTML of this group element to pass to the parser
-                        outer_html = str(message_group_element)
-                        messages_to_parse.append({
-                            "index": index,
-                            "html": outer_html,
-                            "timestamp": current_timestamp,
-                            "message_id": message_id,
-                            "username": username
-                        })
-
-                except ValueError:
-                    logger.warning(f"Could not parse data-index '{index_str}' as integer.")
-                except Exception as e:
-                    logger.error(f"Unexpected error processing message element data-index {index_str if 'index_str' in locals() else 'N/A'}: {e}")
-
-            if not messages_to_parse and message_index_elements:
-                # Check if we have any elements with index 299 (max index)
-                max_index_elements = [el for el in message_index_elements if el.get('data-index') and int(el.get('data-index')) == MAX_KICK_INDEX]
-                if max_index_elements:
-                    logger.debug(f"Found {len(message_index_elements)} elements with {len(max_index_elements)} at max index {MAX_KICK_INDEX}, but no new messages detected by timestamp comparison")
-                else:
-                    logger.debug(f"Found {len(message_index_elements)} elements, but none had index > {last_processed_index} and no new messages at max index")
+    The batch skips the parse stage but goes through dedup, commands and broadcast
+    like DOM captures, and waits for room in the bounded ingest queue.
 
-            # --- Parse HTML and Queue Messages ---
-            for item in messages_to_parse:
-                index = item["index"]
-                group_html = item["html"] # HTML of the <div class="group...">
-                try:
-                    # Parse the specific group HTML
-                    parsed_data = _parse_kick_message_html(group_html)
-
-                    # Extract data (handle potential None returns from parser)
-                    timestamp_text = parsed_data.get("timestamp") if parsed_data else "N/A"
-                    username_text = parsed_data.get("sender") if parsed_data else "System"
-                    message_text = parsed_data.get("message_text") if parsed_data else ""
-                    emotes_list = parsed_data.get("emotes", []) if parsed_data else []
-                    is_reply = parsed_data.get("is_reply", False) if parsed_data else False
-
-                    # Queue the message if valid
-                    if username_text and (message_text or emotes_list or username_text != "System"):
-                        msg = {
-                            "data_index": index,
-                            "timestamp": timestamp_text,
-                            "sender": username_text,
-                            "content": message_text,
-                            "emotes": emotes_list,
-                            "is_reply": is_reply,
-                        }
-                        message_queue.put(msg)
-                        # logger.debug(f"Queued message index {index}")
+    Returns:
+        bool: True if the messages were queued.
+    """
+    if not session.active or not messages:
+        return False
+    session.touch()
+    await session.queue.put(list(messages))
+    return True
+
+
+async def install_chat_observer(session, push_url=None):
+    """Inject the MutationObserver capture script into a session's Kick page."""
+    try:
+        installed = await asyncio.to_thread(session.driver.execute_script, CHAT_OBSERVER_INSTALL_SCRIPT, push_url)
+        if installed:
+            logger.info(f"Installed MutationObserver chat capture on #chatroom-messages ({session.channel_name})")
+        else:
+            logger.warning(f"Could not install MutationObserver chat capture for {session.channel_name}: chat container not found")
+        return bool(installed)
+    except WebDriverException as e:
+        logger.warning(f"WebDriver error installing MutationObserver chat capture: {e}")
+        return False
+
+
+async def drain_chat_observer(session):
+    """
+    Drain the rows buffered by the injected observer with a single execute_script call.
+
+    Returns:
+        A list of outerHTML strings for new `div[data-index]` rows, or None if the
+        observer is no longer installed (page refreshed / container re-mounted).
+    """
+    return await asyncio.to_thread(session.driver.execute_script, CHAT_OBSERVER_DRAIN_SCRIPT)
+
+
+async def fetch_chat_container_html(session, chat_container_selector):
+    """Fetch the full outerHTML of the chat container (legacy snapshot capture)."""
+    driver = session.driver
+    # Find the main chat container element
+    chat_container_element = await asyncio.to_thread(
+        lambda: driver.find_element(By.CSS_SELECTOR, chat_container_selector)
+    )
+    # Get its HTML content
+    return await asyncio.to_thread(
+        lambda: chat_container_element.get_attribute("outerHTML")
+    )
+
+
+def _parse_chat_rows(chat_container_html, chat_container_selector="#chatroom-messages"):
+    """
+    Parse chat container HTML into messages with the configured backend (parse stage).
+
+    Works for both the full container snapshot and the incremental rows drained from
+    the MutationObserver or pushed by the page (wrapped in a synthetic container element).
+
+    Returns:
+        list: Message dicts, also used by the dedup stage to derive each message key.
+    """
+    parse_rows = kick_parser.get_parser(settings.get_setting("kick.parser", kick_parser.DEFAULT_PARSER))
+    messages = parse_rows(chat_container_html, chat_container_selector)
+
+    if not messages:
+        logger.debug("No message elements with 'data-index' found.")
+        return []
+
+    logger.debug(f"Parsed {len(messages)} messages from chat HTML.")
+
+    return messages
+
+
+def _select_new_messages(session, rows):
+    """
+    Filter a batch of parsed messages down to the ones the session has not seen before (dedup stage).
+
+    Each row costs one lookup of its key (kick_parser.message_key): Kick's message
+    id for Pusher messages, else (data_index, fingerprint). A row that is
+    still on screen is seen again on every snapshot, which keeps its key inside the
+    sliding window; after Kick wraps the index past MAX_KICK_INDEX, a different
+    message at the same index has a different fingerprint and is new, and an
+    identical one is new once DEDUP_SEQUENCE_WINDOW messages have arrived since its
+    copy was last seen (kick_session), however short the time window made that.
+
+    Returns:
+        list: Message dicts ({"data_index", "timestamp", "sender", "content", "emotes", "is_reply"})
+        for the rows that are new.
+    """
+    # add() records the key and reports whether it was new, in a single lookup
+    new_messages = [row for row in rows if session.dedup.add(kick_parser.message_key(row))]
+
+    if not new_messages and rows:
+        logger.debug(f"[{session.channel_name}] Found {len(rows)} elements, but all were already processed")
+
+    # Update index and activity time
+    if new_messages:
+        # Rows arrive in DOM order, so the last new row is the newest (its index may have wrapped)
+        session.last_processed_index = new_messages[-1]["data_index"]
+        logger.info(f"[{session.channel_name}] Processed {len(new_messages)} DOM messages up to index {session.last_processed_index}")
+        logger.debug(f"[{session.channel_name}] Dedup cache stats: {session.dedup.stats()}")
+        session.touch()
+
+    return new_messages
+
+
+async def poll_messages(session, poll_interval=0.8):
+    """
+    Continuously poll a session's Kick page for new chat messages using its Selenium driver.
+
+    The capture mode is read from the `kick.capture_mode` setting:
+    - "push" (default): the injected MutationObserver forwards new rows to the
+      /ws/kick-ingest endpoint as they render. Polling keeps draining whatever the
+      page could not push (e.g. while the push socket is reconnecting).
+    - "observer": a MutationObserver injected into the page buffers new rows,
+      which are drained with a single execute_script call per tick.
+    - "snapshot": the whole #chatroom-messages outerHTML is fetched and re-parsed every tick.
+    The observer modes fall back to a snapshot whenever the observer cannot be installed.
+
+    Args:
+        session: The KickChannelSession to capture.
+        poll_interval: Seconds between captures while the page is not pushing rows.
+    """
+    channel_name = session.channel_name
+    if not session.driver or not session.driver.session_id:
+        logger.error(f"Polling cannot start for {channel_name}: Selenium driver is not initialized or session is invalid.")
+        session.active = False
+        return
+
+    capture_mode = settings.get_setting("kick.capture_mode", "push")
+    push_url = get_push_url(session) if capture_mode == "push" else None
+    logger.info(f"Starting Kick chat DOM polling for channel: {channel_name} (capture mode: {capture_mode})")
+    chat_container_selector = "#chatroom-messages"
+    observer_installed = False
+
+    while session.active:
+        try:
+            # The drain (or fetch) is the tick's only WebDriver call, and doubles as the liveness check
+            chat_container_html = None
+            try:
+                if capture_mode in ("observer", "push"):
+                    rows = await drain_chat_observer(session) if observer_installed else None
+                    if rows is None:
+                        # First tick, or the page was refreshed by the keep-alive thread
+                        observer_installed = await install_chat_observer(session, push_url)
+                        rows = await drain_chat_observer(session) if observer_installed else None
+                    if rows is not None:
+                        chat_container_html = f'<div id="chatroom-messages">{"".join(rows)}</div>'
                     else:
-                         logger.debug(f"Skipping queuing message index {index} - insufficient data after parsing.")
-
-                except Exception as parse_err:
-                    logger.error(f"Error parsing or queuing message element at index {index}: {str(parse_err)}")
-                    logger.debug(f"Problematic element HTML for index {index}: {group_html[:500]}...")
-
-            # Update index and activity time
-            if new_messages_found_in_batch:
-                last_processed_index = max_index_in_batch
-                # Log the number of processed messages
-                if messages_to_parse:
-                    logger.info(f"Processed {len(messages_to_parse)} DOM messages up to index {last_processed_index}")
+                        chat_container_html = await fetch_chat_container_html(session, chat_container_selector)
                 else:
-                    logger.info(f"Processed DOM messages up to index {last_processed_index}")
+                    chat_container_html = await fetch_chat_container_html(session, chat_container_selector)
+
+                session.touch() # Update activity time
 
-                with message_activity_lock:
-                    last_message_time = time.time()
-                    # logger.debug(f"Updated last_message_time to {last_message_time}")
+            except Exception as container_err:
+                # Only now ask whether the driver itself is gone, or just the container/page script
+                try:
+                    await asyncio.to_thread(getattr, session.driver, 'current_url')
+                except WebDriverException as wd_err:
+                    logger.warning(f"Polling loop for {channel_name} detected WebDriverException (driver likely closed): {wd_err}. Stopping.")
+                    session.active = False
+                    break
+                logger.warning(f"Error finding or getting HTML for chat container '{chat_container_selector}' ({channel_name}): {container_err}")
+                observer_installed = False
+                await asyncio.sleep(2)
+                continue
+
+            if not chat_container_html:
+                logger.debug("No chat container HTML retrieved.")
+                await asyncio.sleep(1)
+                continue
 
-            await asyncio.sleep(0.8) # Polling interval
+            # Waits while the ingest queue is full (backpressure from the pipeline)
+            await session.queue.put(chat_container_html)
+
+            # While the page pushes rows itself, polling is only a safety net
+            await asyncio.sleep(2.0 if session.push_connected else poll_interval) # Polling interval
 
         # --- Exception Handling (same as before) ---
         except WebDriverException as e:
              if "disconnected" in str(e).lower() or "session deleted" in str(e).lower() or "no such window" in str(e).lower() or "unable to connect" in str(e).lower():
-                 logger.error(f"Persistent Selenium driver connection closed or lost during polling: {str(e)}")
-                 polling_active = False
+                 logger.error(f"Selenium driver connection for {channel_name} closed or lost during polling: {str(e)}")
+                 session.active = False
                  break
              else:
                  logger.error(f"Unhandled WebDriverException during DOM polling: {str(e)}")
@@ -727,26 +723,24 @@ async def handle_enter_command(username):
 
 async def broadcast_raffle_entry(username):
     """Broadcast a raffle entry to all connected clients."""
-    entry_data = {
-        "type": "raffle_entry",
-        "data": {
-            "user": username,
-            "platform": "kick",
-            "total_entries": len(config.entered_users)
-        }
-    }
-    await globals.manager.broadcast(json.dumps(entry_data))
-
-
-async def get_active_kick_viewers():
-    """Get a list of active viewers from Kick chat messages."""
-    if not config.kick_chat_connected or not config.kick_chat_messages:
+    await globals.manager.publish("raffle_entry", {
+        "user": username,
+        "platform": "kick",
+        "total_entries": len(config.entered_users)
+    })
+
+
+async def get_active_kick_viewers(channel_name=None):
+    """Get a list of active viewers from Kick chat messages (of one channel, or of all connected channels)."""
+    session = sessions.get(channel_name) if channel_name else None
+    history = session.history if session else config.kick_chat_messages
+    if not config.kick_chat_connected or not history:
         logger.warning("Cannot get active Kick viewers: Not connected or no messages")
         return []
 
     # Extract unique usernames from recent chat messages
     unique_viewers = set()
-    for msg in config.kick_chat_messages:
+    for msg in history:
         if "user" in msg and msg["user"] != "System":
             unique_viewers.add(msg["user"])
 
@@ -754,12 +748,13 @@ async def get_active_kick_viewers():
     return list(unique_viewers)
 
 
-async def select_random_kick_viewers(count=1, use_raffle=False):
+async def select_random_kick_viewers(count=1, use_raffle=False, channel_name=None):
     """Select random viewers from Kick chat.
 
     Args:
         count: Number of viewers to select
         use_raffle: If True, select from raffle entries, otherwise from active viewers
+        channel_name: Limit active viewers to one connected channel (None = all channels)
 
     Returns:
         List of selected viewer usernames
@@ -781,10 +776,7 @@ async def select_random_kick_viewers(count=1, use_raffle=False):
             logger.info(f"Selected {len(winners)} winners from raffle entries: {winners}")
             # Clear raffle entries after selection
             config.entered_users.clear()
-            await globals.manager.broadcast(json.dumps({
-                "type": "raffle_entries_cleared",
-                "data": {"message": "Raffle entries cleared after selection"}
-            }))
+            await globals.manager.publish("raffle_entries_cleared", {"message": "Raffle entries cleared after selection"})
             return winners
         except Exception as e:
             logger.error(f"Error selecting raffle winners: {e}")
@@ -792,7 +784,7 @@ async def select_random_kick_viewers(count=1, use_raffle=False):
             return []
     else:
         # Select from active viewers
-        active_viewers = await get_active_kick_viewers()
+        active_viewers = await get_active_kick_viewers(channel_name)
         if not active_viewers:
             logger.warning("No active Kick viewers to select from")
             await broadcast_error("No active Kick viewers to select from")
@@ -815,74 +807,228 @@ async def select_random_kick_viewers(count=1, use_raffle=False):
 
 async def broadcast_error(message):
     """Broadcast an error message to all connected clients."""
-    error_data = {
-        "type": "error",
-        "data": {"message": message}
-    }
-    await globals.manager.broadcast(json.dumps(error_data))
+    await globals.manager.publish("error", {"message": message})
 
 
-async def stream_messages(channel_name):
-    """Process messages from the queue and broadcast them."""
-    # (Implementation remains the same as the previous good version)
-    global polling_active
-    logger.info(f"Starting Kick chat message streaming for channel: {channel_name}")
-    while polling_active or not message_queue.empty(): # Process remaining messages after polling stops
+def get_ingest_queue_size():
+    """Get the configured bound of the ingest queue (number of pending HTML batches)."""
+    try:
+        return max(1, int(settings.get_setting("kick.queue_size", DEFAULT_INGEST_QUEUE_SIZE)))
+    except (TypeError, ValueError):
+        return DEFAULT_INGEST_QUEUE_SIZE
+
+
+def get_ingest_engine():
+    """Get the configured ingest engine: "browser" (Selenium page capture) or "pusher" (browserless)."""
+    engine = settings.get_setting("kick.engine", "browser")
+    if engine not in ("browser", "pusher"):
+        logger.warning(f"Unknown Kick ingest engine '{engine}', using 'browser'")
+        return "browser"
+    return engine
+
+
+async def run_pusher_ingest(session):
+    """Ingest task of the Pusher engine: stay subscribed and queue incoming messages."""
+    url = settings.get_setting("kick.pusher_url", "") or None
+    client = kick_pusher.PusherChatClient(
+        session.chatroom_id,
+        lambda messages: ingest_parsed_messages(session, messages),
+        url=url,
+    )
+    logger.info(f"Starting browserless Kick chat ingest for channel: {session.channel_name} (chatroom {session.chatroom_id})")
+    try:
+        await client.run()
+    finally:
+        logger.info(f"Stopped browserless Kick chat ingest for channel: {session.channel_name}")
+
+
+def new_session(channel_name, channel_id=None, engine=None):
+    """Create a KickChannelSession configured from the current settings (not yet registered)."""
+    return KickChannelSession(
+        channel_name,
+        channel_id,
+        engine=engine or get_ingest_engine(),
+        queue_size=get_ingest_queue_size(),
+        max_ids=MAX_PROCESSED_IDS,
+        dedup_window=get_dedup_window(),
+    )
+
+
+def start_session_tasks(session, poll_interval=0.8):
+    """Mark a session active and start its ingest and streaming tasks."""
+    session.active = True
+    session.connected_at = time.time()
+    session.touch()
+    if session.engine == "pusher":
+        session.ingest_task = asyncio.create_task(run_pusher_ingest(session))
+    else:
+        session.ingest_task = asyncio.create_task(poll_messages(session, poll_interval=poll_interval))
+    session.streaming_task = asyncio.create_task(stream_messages(session))
+
+
+async def stop_session_tasks(session):
+    """Stop a session's capture loop, keep-alive thread and tasks, and drop its queued batches."""
+    session.active = False # Signal polling loops to stop
+    session.keep_alive_active = False # Signal keep-alive thread to stop
+    session.push_token = None # Reject further pushes from the page script
+    tasks = [task for task in (session.ingest_task, session.streaming_task) if task and not task.done()]
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    session.ingest_task = None
+    session.streaming_task = None
+    session.keep_alive_thread = None # Daemon thread; exits on its next check of keep_alive_active
+
+    while not session.queue.empty():
         try:
-            if not message_queue.empty():
-                msg = message_queue.get()
-
-                sender = msg.get("sender", "Unknown")
-                content = msg.get("content", "")
-                timestamp = msg.get("timestamp", "N/A")
-                emotes = msg.get("emotes", []) # Get the emotes list
-
-                # Skip if message is essentially empty (no sender or just system message without content/emotes)
-                if not sender or (sender == "System" and not content and not emotes):
-                    logger.debug(f"Skipping streaming message index {msg.get('data_index')} due to missing sender/content/emotes.")
-                    message_queue.task_done()
-                    continue
-
-                # Check for enter command (using custom command name from settings)
-                enter_command = settings.get_setting("commands.enter", "!enter")
-                if content.strip().lower() == enter_command.lower():
-                    await handle_enter_command(sender)
-
-                message_data = {
-                    "type": "kick_chat_message",
-                    "data": {
-                        "channel": channel_name,
-                        "user": sender,
-                        "text": content, # Text with placeholders like [emote:name]
-                        "timestamp": timestamp,
-                        "emotes": emotes # List of {"name": "...", "url": "..."}
-                    }
-                }
-                # Broadcast for main UI (now includes emotes)
-                await globals.manager.broadcast(json.dumps(message_data))
-
-                # Add to config history (ensure thread safety if needed)
-                config.kick_chat_messages.append(message_data["data"]) # Keep original data for history
-                if len(config.kick_chat_messages) > 100:
-                    config.kick_chat_messages = config.kick_chat_messages[-100:]
-
-                message_queue.task_done()
-            else:
-                if not polling_active: break # Exit if polling stopped and queue empty
-                await asyncio.sleep(0.2)
+            session.queue.get_nowait()
+            session.queue.task_done()
+        except asyncio.QueueEmpty:
+            break
+
+
+def get_kick_channel_metrics():
+    """Return the metrics of every connected Kick channel."""
+    return [session.stats() for session in sessions]
+
+
+def _sync_config():
+    """Mirror the registry into the legacy single-channel config fields (latest connected channel)."""
+    latest = sessions.latest()
+    config.kick_chat_connected = latest is not None
+    config.kick_channel_name = latest.channel_name if latest else None
+    config.kick_channel_id = latest.channel_id if latest else None
+    config.kick_chat_stream = {"channel_id": latest.channel_id, "channel_name": latest.channel_name} if latest else None
+
+
+def get_dedup_window():
+    """Get the configured dedup sliding window in seconds (how long an unseen message key is remembered)."""
+    try:
+        return max(1.0, float(settings.get_setting("kick.dedup_window_seconds", DEFAULT_DEDUP_WINDOW)))
+    except (TypeError, ValueError):
+        return DEFAULT_DEDUP_WINDOW
+
+
+# --- Ingest pipeline stages ---
+# Each stage is an async generator awaiting the previous one, so the pipeline
+# sleeps on session.queue.get() while idle and a slow stage throttles its
+# producers through the bounded queue. Every channel runs its own pipeline.
+
+async def _chat_html_source(session):
+    """Source stage: yield chat container HTML batches as the session's producers queue them."""
+    while True:
+        chat_container_html = await session.queue.get()
+        session.counters["batches"] += 1
+        try:
+            yield chat_container_html
+        finally:
+            session.queue.task_done()
+
+
+async def _parse_stage(session, html_batches):
+    """Parse stage: turn each HTML batch into a list of row candidates (message batches pass through)."""
+    async for chat_container_html in html_batches:
+        if isinstance(chat_container_html, list):
+            # Already parsed by a browserless engine (see ingest_parsed_messages)
+            rows = chat_container_html
+        else:
+            try:
+                rows = _parse_chat_rows(chat_container_html)
+            except Exception as e:
+                session.counters["errors"] += 1
+                logger.error(f"Error parsing chat container HTML ({session.channel_name}): {str(e)}")
+                continue
+        if rows:
+            session.counters["rows_parsed"] += len(rows)
+            yield rows
+
+
+async def _dedup_stage(session, row_batches):
+    """Dedup stage: yield only the messages the session has not processed before."""
+    async for rows in row_batches:
+        try:
+            new_messages = _select_new_messages(session, rows)
         except Exception as e:
-            logger.error(f"Error streaming message: {str(e)}")
-            await asyncio.sleep(0.5)
+            session.counters["errors"] += 1
+            logger.error(f"Error deduplicating chat rows ({session.channel_name}): {str(e)}")
+            continue
+        session.counters["messages"] += len(new_messages)
+        for msg in new_messages:
+            yield msg
+
+
+async def _command_stage(messages):
+    """Command stage: drop empty messages and handle chat commands such as !enter."""
+    async for msg in messages:
+        sender = msg.get("sender", "Unknown")
+        content = msg.get("content", "")
+        emotes = msg.get("emotes", []) # Get the emotes list
+
+        # Skip if message is essentially empty (no sender or just system message without content/emotes)
+        if not sender or (sender == "System" and not content and not emotes):
+            logger.debug(f"Skipping streaming message index {msg.get('data_index')} due to missing sender/content/emotes.")
+            continue
 
-    logger.info(f"Stopped Kick chat message streaming for channel: {channel_name}")
+        try:
+            # Check for enter command (using custom command name from settings)
+            enter_command = settings.get_setting("commands.enter", "!enter")
+            if content.strip().lower() == enter_command.lower():
+                await handle_enter_command(sender)
+        except Exception as e:
+            logger.error(f"Error handling chat command from {sender}: {str(e)}")
+
+        yield msg
+
+
+async def _broadcast_stage(session, messages):
+    """Broadcast stage: send each message, tagged with its channel, to the connected clients."""
+    async for msg in messages:
+        message_data = {
+            "type": "kick_chat_message",
+            "data": {
+                "channel": session.channel_name,
+                "user": msg.get("sender", "Unknown"),
+                "text": msg.get("content", ""), # Text with placeholders like [emote:name]
+                "timestamp": msg.get("timestamp", "N/A"),
+                "emotes": msg.get("emotes", []) # List of {"name": "...", "url": "..."}
+            }
+        }
+        try:
+            # Broadcast for main UI (now includes emotes)
+            await globals.manager.publish(message_data["type"], message_data["data"])
+            session.counters["broadcast"] += 1
+        except Exception as e:
+            session.counters["errors"] += 1
+            logger.error(f"Error broadcasting chat message: {str(e)}")
+        yield message_data
 
 
-def keep_alive_thread_function(interval=10):
+async def stream_messages(session):
+    """Run a session's ingest pipeline: parse -> dedup -> commands -> broadcast -> history."""
+    channel_name = session.channel_name
+    logger.info(f"Starting Kick chat message streaming for channel: {channel_name}")
+    pipeline = _broadcast_stage(
+        session,
+        _command_stage(_dedup_stage(session, _parse_stage(session, _chat_html_source(session)))),
+    )
+    try:
+        async for message_data in pipeline:
+            # History stage: per-channel history plus the combined recent history of all channels
+            session.history.append(message_data["data"])
+            config.kick_chat_messages.append(message_data["data"]) # Keep original data for history
+            if len(config.kick_chat_messages) > 100:
+                config.kick_chat_messages = config.kick_chat_messages[-100:]
+    finally:
+        await pipeline.aclose()
+        logger.info(f"Stopped Kick chat message streaming for channel: {channel_name}")
+
+
+def keep_alive_thread_function(session, interval=10):
     """Thread function to keep the chat page alive even when minimized.
     Enhanced for Docker/Xvfb environments where window focus works differently.
-    Only refreshes the page if no messages have been received for a certain period."""
-    global selenium_driver, keep_alive_active, last_message_time
-    logger.info(f"Starting keep-alive thread with interval of {interval} seconds")
+    Only refreshes the page if no messages have been received for a certain period.
+    Runs once per browser session, on that session's driver."""
+    logger.info(f"Starting keep-alive thread for {session.channel_name} with interval of {interval} seconds")
 
     # Track time for periodic refresh
     last_refresh_time = time.time()
@@ -892,10 +1038,10 @@ def keep_alive_thread_function(interval=10):
     last_interaction_time = time.time()
     interaction_interval = 10  # Interact with the page every 10 seconds (reduced frequency)
 
-    # Initialize last_message_time if it's not set
-    with message_activity_lock:
-        if last_message_time == 0:
-            last_message_time = time.time()
+    # Initialize session.last_message_time if it's not set
+    with session.activity_lock:
+        if session.last_message_time == 0:
+            session.last_message_time = time.time()
 
     # Number of consecutive refresh failures
     consecutive_refresh_failures = 0
@@ -904,10 +1050,10 @@ def keep_alive_thread_function(interval=10):
     # Message inactivity threshold before refreshing (in seconds)
     message_inactivity_threshold = 30  # Only refresh if no messages for 30 seconds
 
-    while keep_alive_active and selenium_driver:
+    while session.keep_alive_active and session.driver:
         try:
             # Check if driver is still valid
-            if not selenium_driver or not selenium_driver.session_id:
+            if not session.driver or not session.driver.session_id:
                 logger.warning("Keep-alive thread detected invalid driver. Stopping.")
                 break
 
@@ -918,8 +1064,8 @@ def keep_alive_thread_function(interval=10):
             message_inactive_duration = 0
 
             # Check message activity with thread safety
-            with message_activity_lock:
-                message_inactive_duration = current_time - last_message_time
+            with session.activity_lock:
+                message_inactive_duration = current_time - session.last_message_time
                 # Only refresh if no messages for a while AND it's time for a refresh
                 if (message_inactive_duration >= message_inactivity_threshold and
                     current_time - last_refresh_time >= refresh_interval):
@@ -933,17 +1079,17 @@ def keep_alive_thread_function(interval=10):
 
                     # Check if chat container exists before refreshing
                     try:
-                        selenium_driver.find_element(By.CSS_SELECTOR, "#chatroom-messages")
+                        session.driver.find_element(By.CSS_SELECTOR, "#chatroom-messages")
                         logger.info("Chat container found before refresh")
                     except Exception:
                         logger.warning("Chat container not found before refresh attempt - page may need navigation instead of refresh")
 
                     # Refresh the page
-                    selenium_driver.refresh()
+                    session.driver.refresh()
 
                     # Wait for chat container to reappear with better error handling
                     try:
-                        WebDriverWait(selenium_driver, 15).until(  # Increased timeout for Docker
+                        WebDriverWait(session.driver, 15).until(  # Increased timeout for Docker
                             EC.visibility_of_element_located((By.CSS_SELECTOR, "#chatroom-messages"))
                         )
                         # Update refresh time tracking
@@ -958,9 +1104,9 @@ def keep_alive_thread_function(interval=10):
                         if consecutive_refresh_failures >= max_refresh_failures:
                             try:
                                 logger.warning(f"After {consecutive_refresh_failures} refresh failures, trying to navigate to page")
-                                current_url = selenium_driver.current_url
-                                selenium_driver.get(current_url)
-                                WebDriverWait(selenium_driver, 20).until(
+                                current_url = session.driver.current_url
+                                session.driver.get(current_url)
+                                WebDriverWait(session.driver, 20).until(
                                     EC.visibility_of_element_located((By.CSS_SELECTOR, "#chatroom-messages"))
                                 )
                                 logger.info("Successfully navigated to page and found chat container")
@@ -978,7 +1124,7 @@ def keep_alive_thread_function(interval=10):
                     # Instead of alerts, we'll use more reliable DOM interactions
 
                     # Use a more robust JavaScript interaction that's less likely to cause stale element issues
-                    selenium_driver.execute_script("""
+                    session.driver.execute_script("""
                         try {
                             // Try multiple methods to keep the page active
                             // 1. Scroll the chat container slightly
@@ -1018,7 +1164,7 @@ def keep_alive_thread_function(interval=10):
             # Execute JavaScript to prevent throttling - optimized for Docker/Xvfb
             try:
                 # Force window focus and prevent background throttling with more aggressive approach
-                selenium_driver.execute_script("""
+                session.driver.execute_script("""
                     // Keep the page active
                     window.focus();
                     document.hasFocus = function() { return true; };
@@ -1073,46 +1219,66 @@ def keep_alive_thread_function(interval=10):
     logger.info("Keep-alive thread stopped")
 
 
+async def _acquire_driver():
+    """Return a running Selenium driver: an idle one left by a disconnected channel, or a new one."""
+    while idle_drivers:
+        driver = idle_drivers.pop()
+        if driver.session_id:
+            logger.info("Reusing existing Persistent Selenium Driver.")
+            return driver
+
+    logger.info("Initializing Persistent Selenium Driver (undetected-chromedriver)...")
+    # Wrap synchronous driver initialization in asyncio.to_thread
+    def start_driver():
+        options = uc.ChromeOptions()
+        # Avoid using headless mode with undetected-chromedriver
+        # Instead, we're using a virtual display with Xvfb
+        options.add_argument("--no-sandbox")
+        options.add_argument("--disable-dev-shm-usage")
+        options.headless = False
+        # We've monkey-patched ChromeOptions to have a headless property
+        # so we don't need to pass headless=False anymore
+        # You might need to specify the driver executable path if not in PATH
+        # driver_executable_path = '/path/to/chromedriver'
+        # Updated to be compatible with newer Selenium versions
+        # Remove use_subprocess parameter which is causing compatibility issues
+        driver = uc.Chrome()
+        driver.options = options
+        return driver
+
+    driver = await asyncio.to_thread(start_driver)
+    logger.info("Persistent Selenium Driver initialized.")
+    return driver
+
+
 async def connect_kick_chat(channel_name):
-    """Connect to Kick chat: Get ID, init persistent Selenium driver, start polling."""
-    global selenium_driver # Use the Selenium driver global
-    global polling_active, last_processed_index, polling_task, streaming_task
-    global keep_alive_timer, keep_alive_active, last_message_time
+    """
+    Connect to a Kick channel's chat alongside any channels already connected.
 
+    Resolves the channel id, then starts a session with the configured engine
+    (browser: a Selenium page per channel; pusher: a browserless WebSocket).
+    Reconnecting a channel that is already connected restarts only that channel.
+    """
     if not channel_name or channel_name.isspace():
         logger.warning("Connect Kick chat request missing channel name.")
-        await globals.manager.broadcast(json.dumps({"type": "error", "data": {"message": "Please enter a Kick channel name."}}))
+        await globals.manager.publish("error", {"message": "Please enter a Kick channel name."})
         return False
 
     channel_name = channel_name.strip().lower()
     logger.info(f"Attempting to connect to Kick chat for channel: {channel_name}")
 
-    # --- Disconnect if already connected ---
-    if config.kick_chat_connected:
-        logger.info(f"Disconnecting previous Kick chat ({config.kick_channel_name}) before connecting to {channel_name}.")
-        await disconnect_kick_chat() # Ensure previous state is cleared
+    # --- Disconnect this channel if already connected (other channels keep running) ---
+    if channel_name in sessions:
+        logger.info(f"Kick chat {channel_name} is already connected; reconnecting it.")
+        await disconnect_kick_chat(channel_name) # Ensure previous state is cleared
         await asyncio.sleep(1) # Short delay
 
-    # --- Reset state ---
-    global last_processed_index, processed_message_ids, last_processed_timestamps
-    last_processed_index = -1
-    processed_message_ids.clear()  # Clear the set of processed message IDs
-    last_processed_timestamps.clear()  # Clear the timestamp tracking dictionary
-    logger.info("Cleared processed message IDs and timestamps tracking")
-    config.kick_chat_messages.clear()
-    while not message_queue.empty():
-        try: message_queue.get_nowait()
-        except: pass
-
     # --- Get Channel ID (Using stealth_requests) ---
     logger.info(f"Getting channel ID for: {channel_name} using https://github.com/jpjacobpadilla/Stealth-Requests...")
     channel_id = await get_kick_channel_id(channel_name) # Uses the stealth_requests version now
     if not channel_id:
         logger.error(f"Could not get Kick channel ID via stealth_requests for: {channel_name}")
-        await globals.manager.broadcast(json.dumps({
-            "type": "error",
-            "data": {"message": f"Could not find Kick channel or bypass protection for: {channel_name}"}
-        }))
+        await globals.manager.publish("error", {"message": f"Could not find Kick channel or bypass protection for: {channel_name}"})
         return False
     logger.info(f"Successfully obtained Kick channel ID: {channel_id}")
 
@@ -1125,48 +1291,39 @@ async def connect_kick_chat(channel_name):
         logger.warning(f"Failed to download emotes for {channel_name}. Proceeding without custom emotes.")
      # Note: We proceed even if emotes fail, chat should still work.
 
-    # --- Initialize PERSISTENT Selenium Driver (if needed) ---
+    session = new_session(channel_name, channel_id)
+
+    if session.engine == "pusher":
+        session.chatroom_id = channel_chatroom_ids.get(channel_id)
+        if not session.chatroom_id:
+            logger.warning(f"No chatroom id known for channel {channel_id}; subscribing with the channel id")
+            session.chatroom_id = channel_id
+        sessions.add(session)
+        start_session_tasks(session)
+        _sync_config()
+        await globals.manager.publish("kick_chat_connected", {"channel": channel_name})
+        logger.info(f"Successfully connected to Kick chat (browserless): {channel_name}")
+        return True
+
+    # --- Initialize the session's Selenium Driver (reusing an idle one if possible) ---
     try:
-        if not selenium_driver or not selenium_driver.session_id:
-            logger.info("Initializing Persistent Selenium Driver (undetected-chromedriver)...")
-            # Wrap synchronous driver initialization in asyncio.to_thread
-            def start_driver():
-                options = uc.ChromeOptions()
-                # Avoid using headless mode with undetected-chromedriver
-                # Instead, we're using a virtual display with Xvfb
-                options.add_argument("--no-sandbox")
-                options.add_argument("--disable-dev-shm-usage")
-                options.headless = False
-                # We've monkey-patched ChromeOptions to have a headless property
-                # so we don't need to pass headless=False anymore
-                # You might need to specify the driver executable path if not in PATH
-                # driver_executable_path = '/path/to/chromedriver'
-                # Updated to be compatible with newer Selenium versions
-                # Remove use_subprocess parameter which is causing compatibility issues
-                driver = uc.Chrome()
-                driver.options = options
-                return driver
-
-            selenium_driver = await asyncio.to_thread(start_driver)
-            logger.info("Persistent Selenium Driver initialized.")
-        else:
-            logger.info("Reusing existing Persistent Selenium Driver.")
+        session.driver = await _acquire_driver()
 
         # --- Navigate and Wait ---
         chat_url = f"https://kick.com/{channel_name}"
         connection_successful = False
         last_exception = None
-        log_prefix = "[Selenium Connect] "
+        log_prefix = f"[Selenium Connect {channel_name}] "
 
         try:
             logger.info(f"{log_prefix}Navigating to {chat_url}...")
             # Wrap synchronous driver.get in asyncio.to_thread
-            await asyncio.to_thread(selenium_driver.get, chat_url)
+            await asyncio.to_thread(session.driver.get, chat_url)
             logger.info(f"{log_prefix}Navigation complete. Waiting for chat messages container (#chatroom-messages)...")
 
             # Use the modified wait function
             await wait_for_element_with_retry(
-                selenium_driver,
+                session.driver,
                 By.CSS_SELECTOR,
                 "#chatroom-messages",
                 timeout_per_try=15, # Timeout in seconds for Selenium
@@ -1189,46 +1346,21 @@ async def connect_kick_chat(channel_name):
             error_msg = f"Selenium connection failed for {channel_name}. Last error: {type(last_exception).__name__ if last_exception else 'N/A'}"
             logger.error(error_msg)
             # Attempt to quit the driver if connection failed mid-way
-            if selenium_driver:
+            if session.driver:
                 try:
-                    await asyncio.to_thread(selenium_driver.quit)
+                    await asyncio.to_thread(session.driver.quit)
                     logger.info("Quit Selenium driver after connection failure.")
-                    selenium_driver = None
+                    session.driver = None
                 except Exception as q_err:
                     logger.error(f"Error quitting Selenium driver after connection failure: {q_err}")
             raise last_exception or WebDriverException(f"Failed to connect to {channel_name} using Selenium.")
 
         # --- Start Polling and Streaming Tasks ---
-        # Ensure previous tasks are properly handled before setting new state
-        if polling_task and not polling_task.done():
-            polling_task.cancel()
-        if streaming_task and not streaming_task.done():
-            streaming_task.cancel()
-
-        # Validate channel info before updating state
-        if not channel_id or not channel_name:
-            raise ValueError("Invalid channel ID or name received")
-
-        # Update configuration state atomically
-        config.kick_channel_id = channel_id
-        config.kick_channel_name = channel_name
-        polling_active = True  # Set flag after state is properly configured
-
-        # Initialize message activity tracking
-        with message_activity_lock:
-            last_message_time = time.time()
-            logger.info(f"Initialized last_message_time to {last_message_time}")
-
-        logger.info("Creating polling and streaming tasks...")
-        # Ensure previous tasks are properly handled if reconnecting quickly
-        if polling_task and not polling_task.done(): polling_task.cancel()
-        if streaming_task and not streaming_task.done(): streaming_task.cancel()
-
-        polling_task = asyncio.create_task(poll_messages(channel_name))
-        streaming_task = asyncio.create_task(stream_messages(channel_name))
-
-        config.kick_chat_connected = True
-        config.kick_chat_stream = {"channel_id": channel_id, "channel_name": channel_name}
+        session.push_token = secrets.token_urlsafe(16)  # New secret for the page push channel
+        sessions.add(session)
+        logger.info(f"Creating polling and streaming tasks for {channel_name}...")
+        start_session_tasks(session)
+        _sync_config()
 
         # Set a fixed window size for Docker/Xvfb environment
         # In Docker with Xvfb, window positioning doesn't matter as much
@@ -1238,25 +1370,25 @@ async def connect_kick_chat(channel_name):
 
         try:
             # Set window size using both methods for compatibility
-            await asyncio.to_thread(selenium_driver.set_window_size, width, height)
-            await asyncio.to_thread(selenium_driver.execute_script, f"window.resizeTo({width}, {height});")
+            await asyncio.to_thread(session.driver.set_window_size, width, height)
+            await asyncio.to_thread(session.driver.execute_script, f"window.resizeTo({width}, {height});")
             # Focus the window
-            await asyncio.to_thread(selenium_driver.execute_script, "window.focus();")
+            await asyncio.to_thread(session.driver.execute_script, "window.focus();")
             logger.info(f"Browser window set to fixed size ({width}x{height}) for Docker environment")
         except Exception as e:
             logger.warning(f"Failed to set window size: {e}")
 
         # Start the keep-alive timer thread with shorter interval
-        keep_alive_active = True
-        keep_alive_timer = threading.Thread(
+        session.keep_alive_active = True
+        session.keep_alive_thread = threading.Thread(
             target=keep_alive_thread_function,
-            args=(10,),  # 1-second interval for more frequent interactions
+            args=(session, 10),  # 10-second interval between interactions
             daemon=True
         )
-        keep_alive_timer.start()
-        logger.info("Started enhanced keep-alive timer thread")
+        session.keep_alive_thread.start()
+        logger.info(f"Started enhanced keep-alive timer thread for {channel_name}")
 
-        await globals.manager.broadcast(json.dumps({"type": "kick_chat_connected", "data": {"channel": channel_name}}))
+        await globals.manager.publish("kick_chat_connected", {"channel": channel_name})
         logger.info(f"Successfully connected to Kick chat: {channel_name}")
         return True
 
@@ -1266,106 +1398,83 @@ async def connect_kick_chat(channel_name):
     except (TimeoutException, WebDriverException) as e:
         logger.error(f"Selenium connection/wait failed for {channel_name}: {type(e).__name__} - {str(e)}")
         error_message = f"Failed to load Kick channel page or find chat for {channel_name} (timeout or WebDriver error). Is the channel live or blocked?"
-        await globals.manager.broadcast(json.dumps({"type": "error", "data": {"message": error_message}}))
-        # Ensure disconnect cleanup runs even if connection failed partway
-        await disconnect_kick_chat(driver_already_quit=(selenium_driver is None)) # Pass flag if driver was quit during failure handling
+        await globals.manager.publish("error", {"message": error_message})
+        # Ensure cleanup runs even if connection failed partway
+        await _close_session(session, driver_already_quit=(session.driver is None))
         return False
     except Exception as e: # Catch other unexpected errors during setup/connection
         logger.exception(f"Unexpected error during Selenium driver setup or connection for {channel_name}: {str(e)}")
         error_message = f"Unexpected error connecting to Kick chat: {str(e)}"
-        await globals.manager.broadcast(json.dumps({"type": "error", "data": {"message": error_message}}))
-        # Ensure disconnect cleanup runs
-        await disconnect_kick_chat(driver_already_quit=(selenium_driver is None))
+        await globals.manager.publish("error", {"message": error_message})
+        # Ensure cleanup runs
+        await _close_session(session, driver_already_quit=(session.driver is None))
         return False
 
 
-async def disconnect_kick_chat(driver_already_quit=False):
-    """Disconnect from Kick chat, stop tasks. Optionally keeps driver running."""
-    global selenium_driver, polling_active, polling_task, streaming_task
-    global keep_alive_active, keep_alive_timer
-    # Note: We keep the persistent driver running by default unless shutdown_selenium_driver is called.
+async def _close_session(session, driver_already_quit=False):
+    """Stop a session and unregister it. Its Selenium driver is kept running for reuse."""
+    await stop_session_tasks(session)
+    if sessions.get(session.channel_name) is session:
+        sessions.remove(session.channel_name)
+    if session.driver and not driver_already_quit:
+        idle_drivers.append(session.driver)
+    session.driver = None
+    _sync_config()
 
-    if not config.kick_chat_connected and not polling_active:
-        logger.info("No active Kick chat connection or tasks to disconnect.")
-        # Still ensure driver is handled if disconnect is called after a failed connect where driver might exist
-        if selenium_driver and not driver_already_quit:
-             logger.debug("Disconnect called with no active connection, but driver exists. Keeping driver alive.")
+
+async def disconnect_kick_chat(channel_name=None, driver_already_quit=False):
+    """
+    Disconnect Kick chat and stop its tasks. Drivers are kept running for reuse.
+
+    Args:
+        channel_name: The channel to disconnect; None disconnects every channel.
+        driver_already_quit: True if the session's Selenium driver is already gone.
+    """
+    # Note: We keep the persistent drivers running by default unless shutdown_selenium_driver is called.
+    if channel_name is None:
+        targets = list(sessions)
     else:
-        logger.info(f"Disconnecting from Kick chat: {config.kick_channel_name or 'Unknown'}")
-
-    # Stop all active tasks and threads
-    polling_active = False # Signal polling loops to stop
-    keep_alive_active = False # Signal keep-alive thread to stop
-
-    # Cancel running asyncio tasks
-    if polling_task and not polling_task.done():
-        polling_task.cancel()
-        logger.info("Polling task cancellation requested.")
-    if streaming_task and not streaming_task.done():
-        streaming_task.cancel()
-        logger.info("Streaming task cancellation requested.")
-
-    # Wait for keep-alive thread to finish if it's running
-    if keep_alive_timer and keep_alive_timer.is_alive():
-        logger.info("Waiting for keep-alive thread to stop...")
-        # We don't join the thread here as it might block if the thread is stuck
-        # The daemon=True flag ensures it will be terminated when the program exits
-
-    # Wait briefly for tasks
-    await asyncio.sleep(0.5)
-
-    # Reset Config and Globals (Do this before potentially slow driver operations)
-    disconnected_channel = config.kick_channel_name or "Unknown"
-    config.kick_chat_connected = False
-    config.kick_chat_stream = None
-    config.kick_channel_id = None
-    config.kick_channel_name = None
-    # Reset the last processed index and message tracking
-    global last_processed_index, processed_message_ids, last_processed_timestamps
-    last_processed_index = -1
-    processed_message_ids.clear()  # Clear the set of processed message IDs
-    last_processed_timestamps.clear()  # Clear the timestamp tracking dictionary
-    polling_task = None
-    streaming_task = None
-    keep_alive_timer = None
-
-    # Clear message queue
-    while not message_queue.empty():
-        try: message_queue.get_nowait()
-        except: break
-    logger.info("Message queue cleared.")
-
-    # Notify Clients
-    try:
-        await globals.manager.broadcast(json.dumps({
-            "type": "kick_chat_disconnected",
-            "data": {"channel": disconnected_channel}
-        }))
-    except Exception as broadcast_err:
-         logger.error(f"Error broadcasting disconnect message: {broadcast_err}")
-
-    logger.info(f"Successfully disconnected logic for Kick chat: {disconnected_channel}")
+        session = sessions.get(channel_name.strip().lower())
+        targets = [session] if session else []
+
+    if not targets:
+        logger.info("No active Kick chat connection or tasks to disconnect.")
+        return True
+
+    for session in targets:
+        logger.info(f"Disconnecting from Kick chat: {session.channel_name}")
+        await _close_session(session, driver_already_quit=driver_already_quit)
+
+        # Notify Clients
+        try:
+            await globals.manager.publish("kick_chat_disconnected", {"channel": session.channel_name})
+        except Exception as broadcast_err:
+             logger.error(f"Error broadcasting disconnect message: {broadcast_err}")
+
+        logger.info(f"Successfully disconnected logic for Kick chat: {session.channel_name}")
     return True
 
 
 async def shutdown_selenium_driver():
-    """Gracefully close the persistent Selenium driver."""
-    global selenium_driver
-    logger.info("Shutting down Persistent Selenium Driver...")
-
-    if selenium_driver:
+    """Gracefully close every Selenium driver (connected channels and idle ones)."""
+    logger.info("Shutting down Persistent Selenium Drivers...")
+    drivers = idle_drivers[:] + [session.driver for session in sessions if session.driver]
+    idle_drivers.clear()
+    for session in sessions:
+        session.driver = None
+
+    if not drivers:
+        logger.info("Persistent Selenium driver was already None.")
+    for driver in drivers:
         try:
             # Wrap synchronous driver.quit in asyncio.to_thread
-            await asyncio.to_thread(selenium_driver.quit)
+            await asyncio.to_thread(driver.quit)
             logger.info("Persistent Selenium driver quit successfully.")
         except WebDriverException as e:
             logger.error(f"WebDriverException during Selenium driver quit: {e}")
         except Exception as e:
             logger.error(f"Unexpected error during Selenium driver quit: {e}")
-        finally:
-            selenium_driver = None # Ensure it's marked as closed/quit
-    else:
-        logger.info("Persistent Selenium driver was already None.")
+
 
 # --- Example Usage (within an async context) ---
 # async def main():
@@ -0,0 +1,443 @@
+"""
+Kick chat HTML parsing backends for Chattastic.
+
+Turns the HTML of the Kick `#chatroom-messages` container (or a batch of
+`div[data-index]` rows wrapped in one) into the message dicts consumed by the
+ingest pipeline in api/kick.py:
+
+    {"data_index", "timestamp", "sender", "content", "emotes", "is_reply"}
+
+Backends:
+- "lxml": C-accelerated, walks each container once with lxml and extracts
+  every field directly from the parsed tree.
+- "bs4": BeautifulSoup with the pure-Python html.parser. The container is
+  parsed once and each row is extracted from the parsed tree.
+
+Both backends build one record per row; the same record provides the dedup
+key (message_key) and the broadcast payload.
+
+Kick reuses data-index values after 299, so the index alone does not identify
+a message. message_key pairs the index with a content fingerprint: the same
+index carrying a different message is a different key, while identical spam
+from one user lands on different indexes and stays distinct as well.
+
+The backend is selected with the `kick.parser` setting ("lxml" by default,
+falling back to "bs4" when lxml is not installed).
+"""
+
+import functools
+import logging
+import re
+from bs4 import BeautifulSoup, Tag
+
+try:
+    import lxml.etree
+    import lxml.html
+    LXML_AVAILABLE = True
+except ImportError:
+    LXML_AVAILABLE = False
+
+try:
+    import lxml.cssselect
+    CSSSELECT_AVAILABLE = True
+except ImportError:
+    CSSSELECT_AVAILABLE = False
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Class markers of the observed Kick chat structure (July 2024)
+MAIN_CONTENT_CLASS = 'betterhover:group-hover:bg-shade-lower'
+REPLY_HEADER_CLASS = 'text-white/40'
+TIMESTAMP_CLASS = 'text-neutral'
+USER_BUTTON_CLASS = 'inline font-bold'
+MESSAGE_SPAN_CLASS = 'font-normal leading-[1.55]'
+
+DEFAULT_PARSER = "lxml" if LXML_AVAILABLE else "bs4"
+
+
+def extract_message_bs4(group, index=None):
+    """
+    Extract a message from an already-parsed Kick message group in a single traversal.
+
+    Args:
+        group: The BeautifulSoup Tag of the message's <div class="group..."> element
+            (or a soup containing it).
+        index: The row's data-index, copied into the result.
+
+    Returns:
+        The pipeline message dict ({"data_index", "timestamp", "sender", "content",
+        "emotes", "is_reply"}), or None if essential elements cannot be found.
+    """
+    sender = "System"
+    message_parts = []
+    emotes = []
+    timestamp = None
+    is_reply = False
+    main_content_div = None # The div holding the timestamp, user, message span
+
+    # --- Detect Reply and Find Main Content Div ---
+    # Replies have a specific structure with a header div containing "Replying to"
+    # The actual message is in the *next* div sibling.
+    # Look for the reply header using a class and text content check
+    reply_header = group.find('div', class_=REPLY_HEADER_CLASS, string=lambda t: t and "Replying to" in t)
+
+    if reply_header:
+        is_reply = True
+        # In replies, the main content div is the next sibling
+        main_content_div = reply_header.find_next_sibling('div')
+        if not main_content_div:
+             logger.warning("Detected reply structure but couldn't find the sibling content div.")
+             # Fallback: Try finding the standard content div just in case structure is mixed
+             main_content_div = group.find('div', class_=lambda x: x and MAIN_CONTENT_CLASS in x.split())
+    else:
+        # Standard message: Find the div that wraps timestamp, user, message
+        # It has many classes, but 'betterhover:group-hover:bg-shade-lower' seems distinct enough
+        main_content_div = group.find('div', class_=lambda x: x and MAIN_CONTENT_CLASS in x.split())
+
+    # If we couldn't find the main content area, we can't proceed reliably
+    if not main_content_div:
+        logger.warning(f"Could not locate the main content div (reply={is_reply}) within the message group.")
+        return None # Indicate parsing failure
+
+    # --- Extract Timestamp (within main_content_div) ---
+    ts_el = main_content_div.find('span', class_=TIMESTAMP_CLASS)
+    if ts_el:
+        timestamp = ts_el.get_text(strip=True)
+
+    # --- Extract Sender ---
+    user_button = main_content_div.find('button', class_=USER_BUTTON_CLASS, title=True)
+    if user_button:
+        sender = user_button['title'] # Use the title attribute
+    else:
+        # Attempt fallback if structure differs slightly (e.g., Bot messages might not use a button)
+        logger.debug("Could not find standard user button. Might be system message or structure changed.")
+
+    # --- Extract Message Content and Emotes (within main_content_div) ---
+    message_span = main_content_div.find('span', class_=MESSAGE_SPAN_CLASS)
+    if message_span:
+        for element in message_span.children:
+            if isinstance(element, Tag):
+                # Check if it's an emote wrapper span
+                if element.name == 'span' and element.has_attr('data-emote-id'):
+                    img_tag = element.find('img', alt=True, src=True)
+                    if img_tag:
+                        emote_name = img_tag.get('alt')
+                        emote_url = img_tag.get('src')
+                        emote_id = element.get('data-emote-id', "unknown")
+
+                        if emote_name:
+                            message_parts.append(f"[emote:{emote_name}|{emote_id}]")
+                            emotes.append({"name": emote_name, "url": emote_url, "id": emote_id})
+                        else:
+                            message_parts.append("[emote]") # Placeholder if name is missing
+                    else:
+                        # Span looks like an emote wrapper but missing img? Append placeholder.
+                        message_parts.append("[emote]")
+                else:
+                    # Append text content of other nested tags (e.g., <a>, <b> if they appear)
+                    message_parts.append(element.get_text())
+            elif isinstance(element, str): # Check for NavigableString explicitly
+                # It's plain text
+                message_parts.append(str(element))
+
+    message_text = "".join(message_parts).strip()
+
+    # --- Final Check ---
+    # Ensure we have at least a sender, even if message is empty (e.g., user just posted emotes)
+    if sender == "System" and not message_text and not emotes:
+         logger.debug("Parsed message resulted in empty content and System sender. Discarding.")
+         return None
+
+    return {
+        "data_index": index,
+        "timestamp": timestamp,
+        "sender": sender,
+        "content": message_text,
+        "emotes": emotes,
+        "is_reply": is_reply,
+    }
+
+
+def _parse_kick_message_html(html_content: str):
+    """
+    Parses the HTML content of a Kick chat message group using BeautifulSoup
+    based on the observed structure (July 2024).
+
+    Args:
+        html_content: The raw outerHTML string of the message's <div class="group..."> element,
+            or an already-parsed BeautifulSoup Tag of it.
+
+    Returns:
+        A dictionary containing:
+        - 'sender': The username of the message sender.
+        - 'message_text': The textual content of the message, with emotes replaced by placeholders like [emote:name|id].
+        - 'emotes': A list of dictionaries, each containing 'name', 'url', and 'id' for an emote.
+        - 'timestamp': The timestamp string (e.g., '10:53 PM') or None.
+        - 'is_reply': Boolean indicating if it's a reply message.
+        Returns None if essential elements cannot be found.
+    """
+    if not html_content:
+        return None
+
+    try:
+        # If the input is already a BeautifulSoup object, use it directly
+        if isinstance(html_content, BeautifulSoup) or isinstance(html_content, Tag):
+            soup = html_content
+        else:
+            # Otherwise parse the HTML string
+            soup = BeautifulSoup(html_content, 'html.parser')
+        message = extract_message_bs4(soup)
+    except Exception as e:
+        logger.exception(f"Critical error parsing message HTML: {e}")
+        logger.debug(f"Failed HTML Snippet: {str(html_content)[:500]}...")
+        return None # Return None on major parsing errors
+
+    if not message:
+        return None
+    return {
+        "sender": message["sender"],
+        "message_text": message["content"],
+        "emotes": message["emotes"],
+        "timestamp": message["timestamp"],
+        "is_reply": message["is_reply"],
+    }
+
+
+def message_fingerprint(message):
+    """
+    Hash what a message says: sender, full content, emote ids and reply flag.
+
+    Uses Python's built-in tuple hash (fast, non-cryptographic, 64-bit). The value
+    is only stable within one process, which is all the in-memory dedup needs.
+    """
+    return hash((
+        message["sender"],
+        message["content"],
+        tuple(emote["id"] for emote in message["emotes"]),
+        message["is_reply"],
+    ))
+
+
+def message_key(message):
+    """
+    Build the dedup key of a parsed message.
+
+    Messages with Kick's unique id (the Pusher engine) are keyed on it; rows parsed
+    from the chat DOM, which has no id, on their data-index plus content fingerprint.
+    """
+    message_id = message.get("message_id")
+    if message_id is not None:
+        return ("id", message_id)
+    return (message["data_index"], message_fingerprint(message))
+
+
+def parse_chat_rows_bs4(chat_container_html, chat_container_selector="#chatroom-messages"):
+    """Parse chat rows with BeautifulSoup (html.parser), extracting each row from the parsed tree."""
+    soup = BeautifulSoup(chat_container_html, 'html.parser')
+    messages = []
+
+    for element in soup.select(f'{chat_container_selector} div[data-index]'):
+        index_str = element.get('data-index')
+        try:
+            index = int(index_str)
+        except (TypeError, ValueError):
+            logger.warning(f"Could not parse data-index '{index_str}' as integer.")
+            continue
+
+        # Find the inner '.group' div which contains the visible message parts
+        message_group_element = element.find('div', class_='group')
+        if not message_group_element:
+            logger.warning(f"Could not find 'div.group' inside element with data-index {index}")
+            continue
+
+        try:
+            message = extract_message_bs4(message_group_element, index)
+        except Exception as e:
+            logger.error(f"Error parsing message element at index {index}: {e}")
+            continue
+        if message:
+            messages.append(message)
+
+    return messages
+
+
+# --- lxml backend ---
+
+def _class_matches(element, class_name):
+    """Match a class the way BeautifulSoup's class_ filter does (whole attribute or single token)."""
+    classes = element.get('class')
+    if not classes:
+        return False
+    return classes == class_name or class_name in classes.split()
+
+
+def _find_first(element, tag, class_name):
+    """Return the first descendant `tag` element carrying `class_name`, or None."""
+    for child in element.iter(tag):
+        if child is not element and _class_matches(child, class_name):
+            return child
+    return None
+
+
+def extract_message_lxml(group, index=None):
+    """Extract a message from a parsed `div.group` lxml element (same result as extract_message_bs4)."""
+    sender = "System"
+    message_parts = []
+    emotes = []
+    timestamp = None
+    is_reply = False
+    main_content_div = None
+
+    # --- Detect Reply and Find Main Content Div ---
+    for div in group.iter('div'):
+        if div is group:
+            continue
+        if (_class_matches(div, REPLY_HEADER_CLASS) and len(div) == 0
+                and div.text and "Replying to" in div.text):
+            is_reply = True
+            # In replies, the main content div is the next div sibling
+            sibling = div.getnext()
+            while sibling is not None and sibling.tag != 'div':
+                sibling = sibling.getnext()
+            main_content_div = sibling
+            break
+
+    if main_content_div is None:
+        main_content_div = _find_first(group, 'div', MAIN_CONTENT_CLASS)
+
+    if main_content_div is None:
+        logger.warning(f"Could not locate the main content div (reply={is_reply}) within the message group.")
+        return None
+
+    # --- Extract Timestamp ---
+    ts_el = _find_first(main_content_div, 'span', TIMESTAMP_CLASS)
+    if ts_el is not None:
+        timestamp = ts_el.text_content().strip()
+
+    # --- Extract Sender ---
+    for button in main_content_div.iter('button'):
+        if _class_matches(button, USER_BUTTON_CLASS) and button.get('title'):
+            sender = button.get('title')
+            break
+
+    # --- Extract Message Content and Emotes ---
+    message_span = _find_first(main_content_div, 'span', MESSAGE_SPAN_CLASS)
+    if message_span is not None:
+        if message_span.text:
+            message_parts.append(message_span.text)
+        for element in message_span:
+            if element.tag == 'span' and element.get('data-emote-id') is not None:
+                img_tag = None
+                for img in element.iter('img'):
+                    if img.get('alt') is not None and img.get('src') is not None:
+                        img_tag = img
+                        break
+                emote_name = img_tag.get('alt') if img_tag is not None else None
+                if emote_name:
+                    emote_id = element.get('data-emote-id') or "unknown"
+                    message_parts.append(f"[emote:{emote_name}|{emote_id}]")
+                    emotes.append({"name": emote_name, "url": img_tag.get('src'), "id": emote_id})
+                else:
+                    message_parts.append("[emote]")
+            elif isinstance(element.tag, str):
+                message_parts.append(element.text_content())
+            if element.tail:
+                message_parts.append(element.tail)
+
+    message_text = "".join(message_parts).strip()
+
+    if sender == "System" and not message_text and not emotes:
+        return None
+
+    return {
+        "data_index": index,
+        "timestamp": timestamp,
+        "sender": sender,
+        "content": message_text,
+        "emotes": emotes,
+        "is_reply": is_reply,
+    }
+
+
+# A compound selector of an optional tag and any #id/.class parts, e.g. "div#chatroom-messages.chat"
+_SIMPLE_SELECTOR = re.compile(r'([a-zA-Z][\w-]*)?((?:[#.][\w-]+)*)')
+
+
+def _simple_selector_xpath(selector):
+    """XPath for a simple compound CSS selector (see _SIMPLE_SELECTOR), or None for anything else."""
+    match = _SIMPLE_SELECTOR.fullmatch(selector.strip())
+    if not match or not selector.strip():
+        return None
+    tag, parts = match.groups()
+    conditions = []
+    for part in re.findall(r'[#.][\w-]+', parts):
+        if part[0] == '#':
+            conditions.append(f"@id='{part[1:]}'")
+        else:
+            conditions.append(f"contains(concat(' ', normalize-space(@class), ' '), ' {part[1:]} ')")
+    return f"descendant-or-self::{tag or '*'}" + "".join(f"[{condition}]" for condition in conditions)
+
+
+@functools.lru_cache(maxsize=16)
+def _chat_rows_xpath(chat_container_selector):
+    """Compiled XPath matching the div[data-index] rows under the container selector, like bs4's select()."""
+    container = _simple_selector_xpath(chat_container_selector)
+    if container is None:
+        if not CSSSELECT_AVAILABLE:
+            raise ValueError(f"Chat container selector '{chat_container_selector}' needs the cssselect package with the lxml parser")
+        container = lxml.cssselect.CSSSelector(chat_container_selector, translator='html').path
+    return lxml.etree.XPath(f"({container})//div[@data-index]")
+
+
+def parse_chat_rows_lxml(chat_container_html, chat_container_selector="#chatroom-messages"):
+    """Parse chat rows with lxml in a single pass over the container."""
+    if not chat_container_html:
+        return []
+    root = lxml.html.fragment_fromstring(chat_container_html, create_parent='div')
+    messages = []
+
+    for element in _chat_rows_xpath(chat_container_selector)(root):
+        index_str = element.get('data-index')
+        try:
+            index = int(index_str)
+        except ValueError:
+            logger.warning(f"Could not parse data-index '{index_str}' as integer.")
+            continue
+
+        message_group_element = _find_first(element, 'div', 'group')
+        if message_group_element is None:
+            logger.warning(f"Could not find 'div.group' inside element with data-index {index}")
+            continue
+
+        try:
+            message = extract_message_lxml(message_group_element, index)
+        except Exception as e:
+            logger.error(f"Error parsing message element at index {index}: {e}")
+            continue
+        if message:
+            messages.append(message)
+
+    return messages
+
+
+PARSERS = {
+    "bs4": parse_chat_rows_bs4,
+}
+if LXML_AVAILABLE:
+    PARSERS["lxml"] = parse_chat_rows_lxml
+
+
+def get_parser(name=None):
+    """
+    Get a chat row parser by backend name.
+
+    Args:
+        name: "lxml" or "bs4". Unknown or unavailable backends fall back to the default.
+
+    Returns:
+        A callable taking (chat_container_html, chat_container_selector) and returning message dicts.
+    """
+    if name and name not in PARSERS:
+        logger.warning(f"Kick chat parser '{name}' is not available, using '{DEFAULT_PARSER}'")
+    return PARSERS.get(name) or PARSERS[DEFAULT_PARSER]
@@ -0,0 +1,214 @@
+"""
+Browserless Kick chat ingest over Kick's public realtime (Pusher) WebSocket.
+
+Kick's web client receives chat through Pusher: it subscribes to the public
+channel `chatrooms.{chatroom_id}.v2` and gets one `App\\Events\\ChatMessageEvent`
+per message. PusherChatClient speaks that protocol directly, so reading chat
+needs no Chrome, Xvfb or keep-alive thread.
+
+Each event is converted to the same message dict the DOM parsers produce
+({"data_index", "timestamp", "sender", "content", "emotes", "is_reply"}), so the
+rest of the ingest pipeline (dedup, commands, broadcast) is shared. It also
+carries Kick's unique message id as "message_id", which dedup keys on instead
+of the synthetic index: identical messages stay distinct, and an event Pusher
+delivers again after a reconnect is recognized.
+"""
+
+import asyncio
+import datetime
+import json
+import logging
+import re
+
+import websockets
+
+logger = logging.getLogger(__name__)
+
+PUSHER_APP_KEY = "32cbd69e4b950bf97679"  # Public key used by kick.com's web client
+DEFAULT_PUSHER_URL = f"wss://ws-us2.pusher.com/app/{PUSHER_APP_KEY}?protocol=7&client=js&version=8.4.0&flash=false"
+CHAT_MESSAGE_EVENT = "App\\Events\\ChatMessageEvent"
+MAX_KICK_INDEX = 299  # Mirrors api.kick.MAX_KICK_INDEX; synthetic indexes wrap the same way
+DEFAULT_ACTIVITY_TIMEOUT = 120  # Seconds of silence before we ping (the server may announce its own)
+PONG_TIMEOUT = 30  # Seconds to wait for any frame after our ping before reconnecting
+RECONNECT_DELAYS = (1, 2, 5, 10, 30)  # Backoff between reconnect attempts (last value repeats)
+
+# Kick encodes emotes in message content as [emote:ID:NAME]
+EMOTE_PATTERN = re.compile(r"\[emote:(\d+):([^\]]+)\]")
+EMOTE_URL = "https://files.kick.com/emotes/{id}/fullsize"
+
+
+class PusherProtocolError(Exception):
+    """Raised when the server reports an error that reconnecting will not fix."""
+
+
+def chatroom_channel(chatroom_id):
+    """Name of the public Pusher channel carrying a chatroom's messages."""
+    return f"chatrooms.{chatroom_id}.v2"
+
+
+def format_timestamp(created_at):
+    """Format an ISO `created_at` like the chat UI shows it (local time, e.g. '10:53 PM')."""
+    if not created_at:
+        return None
+    try:
+        moment = datetime.datetime.fromisoformat(created_at.replace("Z", "+00:00"))
+    except ValueError:
+        logger.debug(f"Unrecognized created_at value: {created_at}")
+        return None
+    if moment.tzinfo:
+        moment = moment.astimezone()
+    return moment.strftime("%I:%M %p").lstrip("0")
+
+
+def convert_chat_event(event_data, data_index):
+    """
+    Convert the data of a ChatMessageEvent into the ingest pipeline's message dict.
+
+    Args:
+        event_data: The decoded event data (dict).
+        data_index: Synthetic row index for the message (wraps after MAX_KICK_INDEX
+            like the chat DOM, so the message has the usual shape).
+
+    Returns:
+        The message dict, or None if the event carries no sender.
+    """
+    sender = (event_data.get("sender") or {}).get("username")
+    if not sender:
+        return None
+
+    emotes = []
+
+    def replace_emote(match):
+        emote_id, emote_name = match.group(1), match.group(2)
+        emotes.append({"name": emote_name, "url": EMOTE_URL.format(id=emote_id), "id": emote_id})
+        return f"[emote:{emote_name}|{emote_id}]"
+
+    content = EMOTE_PATTERN.sub(replace_emote, event_data.get("content") or "").strip()
+    metadata = event_data.get("metadata") or {}
+
+    return {
+        "message_id": event_data.get("id"),  # Kick's unique id: the dedup key (kick_parser.message_key)
+        "data_index": data_index,
+        "timestamp": format_timestamp(event_data.get("created_at")),
+        "sender": sender,
+        "content": content,
+        "emotes": emotes,
+        "is_reply": event_data.get("type") == "reply" or "original_sender" in metadata,
+    }
+
+
+def _decode_data(data):
+    """Pusher sends event data as a JSON-encoded string (sometimes as an object)."""
+    if isinstance(data, str):
+        try:
+            return json.loads(data)
+        except json.JSONDecodeError:
+            return {}
+    return data or {}
+
+
+async def _send_frame(websocket, event, data):
+    """
+    Send a protocol frame, tolerating a connection the server is already closing.
+
+    Frames the server sent before closing are still queued for recv(); the closed
+    connection surfaces there once they are consumed, so none of them are lost.
+    """
+    try:
+        await websocket.send(json.dumps({"event": event, "data": data}))
+    except websockets.exceptions.ConnectionClosed:
+        logger.debug(f"Could not send {event}: connection is closing")
+
+
+class PusherChatClient:
+    """
+    Subscribes to a Kick chatroom over Pusher and hands converted messages to a callback.
+
+    Args:
+        chatroom_id: Kick chatroom id (the channel API's `chatroom.id`).
+        on_messages: Async callable receiving a list of message dicts.
+        url: Pusher WebSocket URL (defaults to Kick's public endpoint).
+    """
+
+    def __init__(self, chatroom_id, on_messages, url=None):
+        self.chatroom_id = chatroom_id
+        self.channel = chatroom_channel(chatroom_id)
+        self.on_messages = on_messages
+        self.url = url or DEFAULT_PUSHER_URL
+        self.subscribed = asyncio.Event()
+        self.messages_received = 0
+        self.reconnects = 0
+        self._sequence = 0
+
+    async def run(self):
+        """Stay subscribed until cancelled, reconnecting with backoff when the connection drops."""
+        attempt = 0
+        while True:
+            try:
+                await self._run_connection()
+            except asyncio.CancelledError:
+                raise
+            except PusherProtocolError as e:
+                logger.error(f"Kick Pusher client stopped: {e}")
+                return
+            except (OSError, asyncio.TimeoutError, websockets.exceptions.WebSocketException) as e:
+                logger.warning(f"Kick Pusher connection lost ({type(e).__name__}: {e})")
+            if self.subscribed.is_set():
+                attempt = 0  # The connection was healthy: start the backoff over
+            self.subscribed.clear()
+            delay = RECONNECT_DELAYS[min(attempt, len(RECONNECT_DELAYS) - 1)]
+            attempt += 1
+            self.reconnects += 1
+            logger.info(f"Reconnecting to Kick Pusher in {delay}s (attempt {attempt})")
+            await asyncio.sleep(delay)
+
+    async def _run_connection(self):
+        logger.info(f"Connecting to Kick Pusher for {self.channel}")
+        async with websockets.connect(self.url, open_timeout=15) as websocket:
+            activity_timeout = DEFAULT_ACTIVITY_TIMEOUT
+            ping_sent = False
+            while True:
+                try:
+                    raw = await asyncio.wait_for(websocket.recv(), PONG_TIMEOUT if ping_sent else activity_timeout)
+                except asyncio.TimeoutError:
+                    if ping_sent:
+                        raise  # No answer to our ping: the connection is dead
+                    await _send_frame(websocket, "pusher:ping", {})
+                    ping_sent = True
+                    continue
+                ping_sent = False
+
+                try:
+                    frame = json.loads(raw)
+                except (TypeError, json.JSONDecodeError):
+                    logger.debug(f"Ignoring non-JSON Pusher frame: {str(raw)[:100]}")
+                    continue
+                event = frame.get("event")
+
+                if event == CHAT_MESSAGE_EVENT:
+                    await self._handle_chat_event(frame.get("data"))
+                elif event == "pusher:connection_established":
+                    established = _decode_data(frame.get("data"))
+                    activity_timeout = min(DEFAULT_ACTIVITY_TIMEOUT, established.get("activity_timeout") or DEFAULT_ACTIVITY_TIMEOUT)
+                    await _send_frame(websocket, "pusher:subscribe", {"auth": "", "channel": self.channel})
+                elif event == "pusher_internal:subscription_succeeded":
+                    logger.info(f"Subscribed to Kick chat channel {frame.get('channel', self.channel)}")
+                    self.subscribed.set()
+                elif event == "pusher:ping":
+                    await _send_frame(websocket, "pusher:pong", {})
+                elif event == "pusher:error":
+                    error = _decode_data(frame.get("data"))
+                    code = error.get("code") or 0
+                    # 4000-4099: do not reconnect with the same settings (e.g. unknown app key)
+                    if 4000 <= code < 4100:
+                        raise PusherProtocolError(f"{code} {error.get('message')}")
+                    logger.warning(f"Kick Pusher error {code}: {error.get('message')}")
+                # pusher:pong and other channel events need no handling
+
+    async def _handle_chat_event(self, data):
+        message = convert_chat_event(_decode_data(data), self._sequence % (MAX_KICK_INDEX + 1))
+        if not message:
+            return
+        self._sequence += 1
+        self.messages_received += 1
+        await self.on_messages([message])
@@ -0,0 +1,136 @@
+"""
+Per-channel Kick chat connection state and the registry of connected channels.
+
+Each connected channel gets a KickChannelSession holding everything that used to
+be module-level state in api/kick.py: its ingest queue, dedup cache, tasks,
+Selenium driver (browser engine), push-channel token, history and metrics.
+api/kick.py drives the sessions; this module only holds state, so it has no
+Selenium or network dependencies.
+"""
+
+import asyncio
+import secrets
+import threading
+import time
+from collections import deque
+
+from utils.dedup import BoundedDedupCache
+
+HISTORY_SIZE = 100  # Chat messages kept per channel
+# New messages after which a dedup key not seen since is new again: half of Kick's 300
+# data-index values, more than the rows Kick keeps on screen (see utils/dedup.py)
+DEDUP_SEQUENCE_WINDOW = 150
+
+
+class KickChannelSession:
+    """
+    Connection state of one Kick channel.
+
+    Args:
+        channel_name: Lower-cased Kick channel slug.
+        channel_id: Kick channel id (from the channel API).
+        engine: Ingest engine, "browser" or "pusher".
+        queue_size: Bound of the ingest queue (pending HTML or message batches).
+        max_ids: Capacity of the dedup cache.
+        dedup_window: Sliding dedup window in seconds.
+    """
+
+    def __init__(self, channel_name, channel_id=None, engine="browser", queue_size=100, max_ids=1000, dedup_window=None):
+        self.channel_name = channel_name
+        self.channel_id = channel_id
+        self.chatroom_id = None
+        self.engine = engine
+
+        # Ingest pipeline
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.dedup = BoundedDedupCache(max_ids, window=dedup_window, sequence_window=DEDUP_SEQUENCE_WINDOW)
+        self.last_processed_index = -1
+        self.active = False  # Capture loops run while True
+        self.ingest_task = None  # poll_messages / run_pusher_ingest
+        self.streaming_task = None  # stream_messages
+
+        # Browser engine
+        self.driver = None
+        self.keep_alive_active = False
+        self.keep_alive_thread = None
+        self.push_token = None  # Secret the injected page script presents to /ws/kick-ingest
+        self.push_connected = False
+        self.push_socket = None  # The /ws/kick-ingest socket currently feeding this session
+
+        # Activity, history and metrics
+        self.activity_lock = threading.Lock()  # last_message_time is also read by the keep-alive thread
+        self.last_message_time = 0
+        self.connected_at = None
+        self.history = deque(maxlen=HISTORY_SIZE)
+        self.counters = {
+            "batches": 0,  # HTML snapshots/row batches or message batches taken off the queue
+            "rows_parsed": 0,  # Rows produced by the parse stage (before dedup)
+            "messages": 0,  # New messages after dedup
+            "broadcast": 0,  # Messages sent to clients
+            "errors": 0,  # Parse/dedup/broadcast errors
+        }
+
+    def touch(self):
+        """Record chat activity (used by the keep-alive thread to decide on page refreshes)."""
+        with self.activity_lock:
+            self.last_message_time = time.time()
+
+    def stats(self):
+        """Return the channel's metrics as a JSON-serializable dict."""
+        with self.activity_lock:
+            last_message_time = self.last_message_time
+        return {
+            "channel": self.channel_name,
+            "channel_id": self.channel_id,
+            "engine": self.engine,
+            "connected": self.active,
+            "connected_at": self.connected_at,
+            "last_message_age": time.time() - last_message_time if last_message_time else None,
+            "queue_depth": self.queue.qsize(),
+            "push_connected": self.push_connected,
+            "history_size": len(self.history),
+            "dedup": self.dedup.stats(),
+            **self.counters,
+        }
+
+
+class KickSessionRegistry:
+    """The connected Kick channels, keyed by channel name (in connection order)."""
+
+    def __init__(self):
+        self._sessions = {}
+
+    def get(self, channel_name):
+        return self._sessions.get(channel_name)
+
+    def add(self, session):
+        self._sessions[session.channel_name] = session
+        return session
+
+    def remove(self, channel_name):
+        return self._sessions.pop(channel_name, None)
+
+    def find_by_push_token(self, token):
+        """Return the session whose page push channel uses `token`, if any."""
+        if not token:
+            return None
+        for session in self._sessions.values():
+            if session.push_token and secrets.compare_digest(session.push_token, token):
+                return session
+        return None
+
+    def latest(self):
+        """The most recently connected session, or None."""
+        return next(reversed(self._sessions.values()), None)
+
+    def channel_names(self):
+        return list(self._sessions)
+
+    def __iter__(self):
+        return iter(list(self._sessions.values()))
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def __contains__(self, channel_name):
+        return channel_name in self._sessions
@@ -3,10 +3,20 @@ import time
 import logging
 import threading
 import subprocess
-import asyncio
-import json
 import glob
 import globals
+from api import settings
+from api.frame_diff import DEFAULT_TILE_SIZE, FrameDiffer
+from api import frame_stream
+from api.capture_controller import (DEFAULT_BOOST_SECONDS, DEFAULT_CPU_BUDGET, DEFAULT_MAX_DOWNSCALE,
+                                    DEFAULT_MAX_INTERVAL, DEFAULT_MIN_INTERVAL, CaptureController)
+from api.frame_store import DEFAULT_FRAME_HISTORY, FrameStore
+from api.x11_capture import DEFAULT_PNG_COMPRESSION, CaptureError, PNGEncoder, X11Grabber
+
+try:
+    import resource  # CPU time of the xwd | convert children (Unix only)
+except ImportError:
+    resource = None
 
 # Set up logging
 logger = logging.getLogger(__name__)
@@ -14,8 +24,23 @@ logger = logging.getLogger(__name__)
 # Global variables
 screenshot_thread = None
 screenshot_active = False
-latest_screenshot_path = None
+frame_store = FrameStore()  # Latest encoded frames, served by /api/screenshot from memory
+unchanged_frames = 0  # Captures skipped because the desktop had not changed
+controller = CaptureController()  # Decides when (and at what resolution) to capture
 screenshot_interval = 1.0  # Screenshot interval in seconds
+capture_backend = "auto"  # "auto" (in-process X11 grab, xwd if that fails), "x11" (in-process only) or "xwd"
+xwd_cpu_seconds = 0.0  # CPU time spent in xwd/convert pipelines so far
+
+CAPTURE_BACKENDS = ("auto", "x11", "xwd")
+X11_RETRY_INTERVAL = 60  # Seconds "auto" stays on xwd after the in-process grab failed
+_grabber = None
+_encoder = None
+_differ = None
+PAUSED_POLL_INTERVAL = 0.5  # Seconds between viewer checks while capture is paused
+_capture_lock = threading.RLock()  # Serializes captures: the screenshot thread and emergency captures share the grabber and encoder
+_cpu_lock = threading.Lock()  # Guards xwd_cpu_seconds and the RUSAGE_CHILDREN snapshots taken around each capture command
+_x11_retry_at = 0
+DEBUG_FRAME_PATH = os.path.join("static", "screenshots", "desktop_view.png")  # Only written with DEBUG_SCREENSHOTS=1
 
 def cleanup_screenshot_files(current_file=None):
     """Clean up old screenshot files, keeping only the current one."""
@@ -70,122 +95,223 @@ def cleanup_debug_screenshots(max_age_hours=24):
     except Exception as e:
         logger.error(f"Error cleaning up debug screenshots: {e}")
 
-def capture_screenshot(output_path):
-    """Capture a screenshot of the Xvfb display using xwd and convert to PNG."""
+def capture_x11(downscale=1):
+    """
+    Grab the X display in-process and encode it as PNG unless it is unchanged.
+
+    Args:
+        downscale: Keep every n-th pixel of every n-th row (1 = full resolution).
+
+    Returns:
+        (png, change): png is None when the frame is identical to the previous grab;
+        change is the FrameChange against that grab.
+
+    Raises:
+        CaptureError: If the display cannot be grabbed in-process.
+    """
+    global _grabber, _encoder, _differ
+    with _capture_lock:
+        if _grabber is None:
+            _grabber = X11Grabber()
+            _encoder = PNGEncoder(settings.get_setting("screenshot.png_compression", DEFAULT_PNG_COMPRESSION))
+            _differ = FrameDiffer(settings.get_setting("screenshot.tile_size", DEFAULT_TILE_SIZE))
+        if frame_store.latest() is None:
+            _differ.reset()  # Nothing stored to fall back on, so the next grab must be encoded
+        rgb = _grabber.grab()
+        if downscale > 1:
+            rgb = rgb[::downscale, ::downscale]
+        change = _differ.diff(rgb)
+        if change.region is None:
+            return None, change
+        return _encoder.encode(rgb), change
+
+def capture_xwd(downscale=1):
+    """Capture the X display as PNG bytes with xwd and ImageMagick (None on failure)."""
+    display = os.environ.get('DISPLAY', ':99')
+    resize = f"-sample {100 // downscale}% " if downscale > 1 else ""
+    cmd = f"xwd -root -display {display} | convert xwd:- {resize}png:-"
+
+    # Execute the command with a timeout to prevent hanging
     try:
-        # Ensure the directory exists
-        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        result = _run_capture_command(cmd)
+        if result.returncode == 0 and result.stdout:
+            return result.stdout
+
+        error_output = result.stderr.decode('utf-8', errors='ignore')
+        logger.error(f"Failed to capture screenshot, command returned: {result.returncode}\nError: {error_output}")
+
+        # Try an alternative method if the first one fails
+        alt_result = _run_capture_command("import -window root png:-")
+        if alt_result.returncode == 0 and alt_result.stdout:
+            logger.info("Screenshot captured successfully using alternative method")
+            return alt_result.stdout
+        return None
+    except subprocess.TimeoutExpired:
+        logger.error(f"Screenshot capture timed out after 5 seconds")
+        return None
+
+def _run_capture_command(cmd):
+    """Run a capture pipeline (5 s timeout), adding the CPU time it took to xwd_cpu_seconds."""
+    global xwd_cpu_seconds
+    # Held for the whole run: another command reaped in between would count in both snapshots' difference
+    with _cpu_lock:
+        before = _children_cpu_seconds()
+        try:
+            return subprocess.run(cmd, shell=True, check=False, timeout=5, stderr=subprocess.PIPE, stdout=subprocess.PIPE)
+        finally:
+            xwd_cpu_seconds += _children_cpu_seconds() - before
+
+def _children_cpu_seconds():
+    """CPU time of this process's reaped children (0 where getrusage is unavailable)."""
+    if resource is None:
+        return 0.0
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return children.ru_utime + children.ru_stime
+
+def write_debug_frame(frame):
+    """Keep a copy of the frame on disk (only with DEBUG_SCREENSHOTS=1), replaced atomically."""
+    try:
+        os.makedirs(os.path.dirname(DEBUG_FRAME_PATH), exist_ok=True)
+        temp_path = f"{DEBUG_FRAME_PATH}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(frame.data)
+        os.replace(temp_path, DEBUG_FRAME_PATH)
+        logger.debug(f"Screenshot {frame.seq} written to {DEBUG_FRAME_PATH}")
+    except OSError as e:
+        logger.error(f"Failed to write debug screenshot: {e}")
+
+def capture_screenshot(downscale=None):
+    """
+    Capture the Xvfb display as PNG (in-process, or with xwd and convert) into frame_store.
+
+    A frame identical to the latest stored one is not encoded or stored again.
+
+    Args:
+        downscale: Per-side divisor of the stored frame (None: the controller's current one).
+
+    Returns:
+        The new Frame, the latest Frame if the desktop is unchanged, or None if the capture failed.
+    """
+    global _x11_retry_at, unchanged_frames
+    with _capture_lock:  # One capture at a time: the screenshot thread and emergency captures
+        try:
+            png = change = None
+            downscale = downscale or controller.downscale
+            if capture_backend != "xwd" and time.time() >= _x11_retry_at:
+                try:
+                    png, change = capture_x11(downscale)
+                    if png is None:
+                        unchanged_frames += 1
+                        return frame_store.latest()
+                except CaptureError as e:
+                    if capture_backend == "x11":
+                        logger.error(f"Failed to capture screenshot in-process: {e}")
+                        return None
+                    logger.warning(f"In-process capture failed ({e}); using xwd for the next {X11_RETRY_INTERVAL}s")
+                    _x11_retry_at = time.time() + X11_RETRY_INTERVAL
+            if png is None:
+                png = capture_xwd(downscale)
+                if png is None:
+                    return None
+                latest = frame_store.latest()
+                if latest and latest.data == png:
+                    unchanged_frames += 1
+                    return latest
+
+            frame = frame_store.publish(png, "image/png", change)
+            if os.environ.get('DEBUG_SCREENSHOTS') == '1':
+                write_debug_frame(frame)
+            return frame
+        except Exception as e:
+            logger.error(f"Error capturing screenshot: {e}")
+            return None
 
-        # Use xwd to capture the X display and convert to PNG with ImageMagick
-        display = os.environ.get('DISPLAY', ':99')
-        cmd = f"xwd -root -display {display} | convert xwd:- png:{output_path}"
+def count_viewers():
+    """Clients watching the desktop: WebSocket clients receiving screenshot updates plus open streams."""
+    subscribers = globals.manager.subscriber_count("screenshot") if globals.manager else 0
+    return subscribers + frame_stream.stream_clients
 
-        # Execute the command with a timeout to prevent hanging
-        try:
-            # Use subprocess.run with timeout instead of subprocess.call
-            result = subprocess.run(cmd, shell=True, check=False, timeout=5, stderr=subprocess.PIPE, stdout=subprocess.PIPE)
-
-            if result.returncode == 0:
-                # Reduced logging - only log at debug level if DEBUG_SCREENSHOTS is enabled
-                if os.environ.get('DEBUG_SCREENSHOTS') == '1':
-                    logger.debug(f"Screenshot captured successfully: {output_path}")
-                # Clean up any old screenshot files
-                cleanup_screenshot_files(output_path)
-                return True
-            else:
-                error_output = result.stderr.decode('utf-8', errors='ignore')
-                logger.error(f"Failed to capture screenshot, command returned: {result.returncode}\nError: {error_output}")
-
-                # Try an alternative method if the first one fails
-                alt_cmd = f"import -window root {output_path}"
-                alt_result = subprocess.run(alt_cmd, shell=True, check=False, timeout=5)
-
-                if alt_result.returncode == 0:
-                    logger.info(f"Screenshot captured successfully using alternative method: {output_path}")
-                    cleanup_screenshot_files(output_path)
-                    return True
-                return False
-        except subprocess.TimeoutExpired:
-            logger.error(f"Screenshot capture timed out after 5 seconds")
-            return False
-    except Exception as e:
-        logger.error(f"Error capturing screenshot: {e}")
-        return False
+def _cpu_seconds():
+    """
+    CPU time of this thread plus the xwd | convert pipelines it ran.
+
+    Only the capture commands' children are counted (measured around each run), so
+    Chrome or chromedriver exiting never lands in a capture's cost.
+    """
+    with _cpu_lock:
+        return time.thread_time() + xwd_cpu_seconds
 
 # Function to broadcast screenshot updates via WebSocket
-async def broadcast_screenshot_update(path):
-    """Broadcast a screenshot update notification to all connected clients."""
+def broadcast_screenshot_update(frame):
+    """Broadcast a screenshot update notification to all connected clients (called from the screenshot thread)."""
     try:
         # Create a timestamp to prevent caching
-        timestamp = int(time.time() * 1000)
+        timestamp = int(frame.timestamp * 1000)
         # Create a unique ID for this screenshot update
-        update_id = f"screenshot_{timestamp}_{hash(path) % 10000}"
-
-        # Create a message specifically for screenshot updates
-        message = {
-            "type": "screenshot_update",
-            "data": {
-                "path": path,
-                "timestamp": timestamp,
-                "update_id": update_id
-            }
-        }
+        update_id = f"screenshot_{timestamp}_{frame.seq}"
 
         # Use the global manager to broadcast the message
         if globals.manager:
-            # Convert the message to JSON string
-            message_str = json.dumps(message)
-
-            # Use the screenshot-specific broadcast queue for high priority
-            await globals.manager._screenshot_queue.put(message_str)
+            # Handed to the manager's event loop; an update not yet sent is replaced by this newer one.
+            # Local only: the frame lives in this process's store, other workers capture their own
+            globals.manager.publish_threadsafe("screenshot_update", {
+                "path": f"/api/screenshot?seq={frame.seq}&instance={frame_store.instance}",
+                "seq": frame.seq,
+                "instance": frame_store.instance,
+                "etag": frame.etag,
+                "region": frame.change.as_dict() if frame.change else None,  # Changed area (None: unknown, treat as all)
+                "timestamp": timestamp,
+                "update_id": update_id
+            }, local=True)
             # Only log if debug screenshots are enabled
             if os.environ.get('DEBUG_SCREENSHOTS') == '1':
-                logger.debug(f"Queued screenshot update: {path} with ID {update_id}")
+                logger.debug(f"Queued screenshot update: frame {frame.seq} with ID {update_id}")
         else:
             logger.warning("Cannot broadcast screenshot update: globals.manager is None")
     except Exception as e:
         logger.error(f"Error broadcasting screenshot update: {e}")
 
-# Create an event loop for the screenshot thread to use
-screenshot_loop = None
-
 def screenshot_thread_function():
     """Thread function to periodically capture screenshots."""
-    global screenshot_active, latest_screenshot_path, screenshot_loop, screenshot_interval
+    global screenshot_active, screenshot_interval
 
     logger.info(f"Starting screenshot capture thread with interval of {screenshot_interval} seconds")
 
-    # Create a new event loop for this thread
-    screenshot_loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(screenshot_loop)
-
     # Add a counter to log periodic status updates
     screenshot_count = 0
     status_log_interval = 30  # Log status every 30 screenshots
     last_error_time = 0  # Track when the last error occurred
     last_cleanup_time = time.time()  # Track when we last cleaned up debug screenshots
     cleanup_interval = 3600  # Clean up debug screenshots every hour
+    broadcast_seq = 0  # The last frame announced to clients
 
     while screenshot_active:
         try:
-            # Use a fixed filename for the desktop view
-            filename = "desktop_view.png"
-            output_path = os.path.join("static", "screenshots", filename)
-
-            # Get the current time for interval calculation
-            current_time = time.time()
-
-            # Capture the screenshot
-            if capture_screenshot(output_path):
-                latest_screenshot_path = output_path
+            # Ask the controller whether anyone is watching and how fast (and how big) to capture
+            interval, downscale = controller.decide(count_viewers(), screenshot_interval)
+            if interval is None:
+                controller.wait(PAUSED_POLL_INTERVAL)
+                continue
+
+            # Capture the screenshot into memory, measuring what it costs (under the capture lock, so an
+            # emergency capture's xwd time never lands between the two readings)
+            started = time.monotonic()
+            with _capture_lock:
+                started_cpu = _cpu_seconds()
+                frame = capture_screenshot(downscale)
+                controller.record(_cpu_seconds() - started_cpu)
+            if frame:
                 screenshot_count += 1
 
-                # Broadcast the screenshot update using the event loop
-                screenshot_loop.run_until_complete(broadcast_screenshot_update(output_path))
+                # Broadcast the screenshot update on the server's event loop, unless the desktop is unchanged
+                if frame.seq != broadcast_seq:
+                    broadcast_seq = frame.seq
+                    broadcast_screenshot_update(frame)
 
                 # Log status periodically to confirm thread is still running
                 if screenshot_count % status_log_interval == 0:
-                    logger.info(f"Screenshot service still running - captured {screenshot_count} screenshots so far with interval {screenshot_interval}s")
+                    logger.info(f"Screenshot service still running - captured {screenshot_count} screenshots so far "
+                                f"({unchanged_frames} unchanged and skipped), controller: {controller.stats()}")
 
             # Periodically clean up debug screenshots
             current_time = time.time()
@@ -194,10 +320,8 @@ def screenshot_thread_function():
                 last_cleanup_time = current_time
                 logger.info("Performed periodic cleanup of debug screenshots")
 
-            # Calculate how long to sleep based on the current interval setting
-            # This allows the interval to be changed dynamically
-            sleep_time = max(0.1, screenshot_interval)  # Ensure minimum sleep time
-            time.sleep(sleep_time)
+            # Sleep out the rest of the controller's interval (a boost cuts it short)
+            controller.wait(max(0.05, interval - (time.monotonic() - started)))
         except Exception as e:
             # Only log errors once per minute to avoid spamming the log
             current_time = time.time()
@@ -208,10 +332,6 @@ def screenshot_thread_function():
 
     logger.info("Screenshot capture thread stopped")
 
-    # Close the event loop when done
-    if screenshot_loop and screenshot_loop.is_running():
-        screenshot_loop.close()
-
 def start_screenshot_service():
     """Start the screenshot capture service."""
     global screenshot_thread, screenshot_active
@@ -243,16 +363,44 @@ def stop_screenshot_service():
 
     # Signal the thread to stop
     screenshot_active = False
+    controller.wake()
     logger.info("Screenshot service stopping")
     return True
 
-def get_latest_screenshot():
-    """Get the path to the latest screenshot."""
-    return latest_screenshot_path
+def get_frame(seq=None, instance=None):
+    """The frame with this seq (of this store) if it is still held, else the latest one (None before the first capture)."""
+    frame = frame_store.get(seq, instance) if seq is not None else None
+    return frame or frame_store.latest()
+
+def is_exact_frame(frame, seq, instance):
+    """Whether frame is the one a (seq, instance) pair names: only then are its bytes fixed for that URL."""
+    return frame is not None and seq == frame.seq and instance == frame_store.instance
+
+def stats():
+    """Frame store, change detection, stream counters and the controller's decisions (for websocket_stats)."""
+    return {**frame_store.stats(), "unchanged": unchanged_frames, "stream_clients": frame_stream.stream_clients,
+            "controller": controller.stats()}
 
 # Initialize the service when the module is imported
 def init():
     """Initialize the screenshot service."""
+    global capture_backend, frame_store, controller, screenshot_interval
+    try:
+        screenshot_interval = max(0.1, float(settings.get_setting("screenshot.interval", screenshot_interval)))
+    except (TypeError, ValueError):
+        logger.warning("Invalid screenshot.interval setting, keeping the default")
+    frame_store = FrameStore(settings.get_setting("screenshot.frame_history", DEFAULT_FRAME_HISTORY))
+    controller = CaptureController(
+        cpu_budget=settings.get_setting("screenshot.cpu_budget", DEFAULT_CPU_BUDGET),
+        min_interval=settings.get_setting("screenshot.min_interval", DEFAULT_MIN_INTERVAL),
+        max_interval=settings.get_setting("screenshot.max_interval", DEFAULT_MAX_INTERVAL),
+        boost_seconds=settings.get_setting("screenshot.boost_seconds", DEFAULT_BOOST_SECONDS),
+        max_downscale=settings.get_setting("screenshot.max_downscale", DEFAULT_MAX_DOWNSCALE),
+        pause_without_viewers=settings.get_setting("screenshot.pause_without_viewers", True))
+    capture_backend = settings.get_setting("screenshot.backend", "auto")
+    if capture_backend not in CAPTURE_BACKENDS:
+        logger.warning(f"Unknown screenshot backend '{capture_backend}', using 'auto'")
+        capture_backend = "auto"
     # Clean up any existing screenshot files before starting
     cleanup_screenshot_files()
     # Clean up old debug screenshots
@@ -263,6 +411,9 @@ def init():
 def cleanup():
     """Clean up the screenshot service and any remaining files."""
     stop_screenshot_service()
+    if _grabber:
+        _grabber.close()
+    frame_store.clear()
     # Clean up all screenshot files when shutting down
     cleanup_screenshot_files()
     # Clean up old debug screenshots
@@ -41,7 +41,45 @@ DEFAULT_SETTINGS = {
         "debug_mode": False
     },
     "screenshot": {
-        "interval": 1.0
+        "interval": 1.0,
+        "backend": "auto",  # "auto" (in-process X11/MIT-SHM grab, falling back to xwd | convert), "x11" or "xwd"
+        "png_compression": 1,  # zlib level (0-9) for in-process PNG encoding; higher is smaller but slower
+        "frame_history": 8,  # Recent frames /api/screenshot?seq= can still serve from memory
+        "tile_size": 32,  # Pixels per side of the tiles compared to detect (and locate) desktop changes
+        "stream_max_fps": 10,  # Frame-rate cap for /api/screenshot/stream clients (each may ask for less with ?fps=)
+        "cpu_budget": 0.25,  # Fraction of one core capture may use; the interval stretches, then resolution drops, to stay within it
+        "min_interval": 0.2,  # Capture interval while the user interacts with the desktop view
+        "max_interval": 5.0,  # Longest interval the CPU budget may stretch to before frames are downscaled
+        "boost_seconds": 10,  # How long an interaction keeps the faster interval
+        "max_downscale": 4,  # Largest per-side divisor for frames over budget (1 = always full resolution)
+        "pause_without_viewers": True  # Stop capturing while no dashboard or stream is watching
+    },
+    "kick": {
+        "engine": "browser",  # "browser" (Selenium reads the chat page) or "pusher" (browserless, Kick's realtime WebSocket)
+        "pusher_url": "",  # Override the realtime WebSocket URL for the "pusher" engine (empty = Kick's public endpoint)
+        "capture_mode": "push",  # "push" (page pushes rows to the backend), "observer" (incremental MutationObserver) or "snapshot" (full container HTML)
+        "push_url": "ws://127.0.0.1:8000/ws/kick-ingest",  # Backend endpoint the Kick page pushes new rows to
+        "queue_size": 100,  # Max pending HTML batches in the ingest pipeline before producers wait
+        "parser": "lxml",  # Chat HTML parser backend: "lxml" (C-accelerated, one pass) or "bs4" (BeautifulSoup html.parser)
+        "dedup_window_seconds": 120  # How long a chat message stays remembered after it was last seen (guards against index reuse)
+    },
+    "websocket": {
+        "send_queue_size": 256,  # Max messages waiting to be sent to one client before the slow-consumer policy applies
+        "slow_consumer_policy": "drop_oldest",  # "drop_oldest" or "disconnect" (snapshots such as screenshot_update are always conflated to the newest)
+        "send_timeout": 10,  # Seconds a send may hang before a client whose queue is full is disconnected as stalled
+        "chat_batch_window_ms": 25,  # Chat arriving within this window is sent as one kick_chat_batch frame (0 = one frame per message)
+        "chat_batch_max": 100,  # Most chat messages in one kick_chat_batch frame
+        # Share of broadcast dispatches each priority class gets while several are waiting
+        "priority_weights": {"control": 8, "chat": 4, "status": 2, "bulk": 1},
+        # Events each priority class may hold before publishers wait (snapshots never count twice)
+        "priority_queue_sizes": {"control": 256, "chat": 2000, "status": 512, "bulk": 64},
+        "replay_buffer_size": 500,  # Newest chat events kept so reconnecting overlays can resume (/ws?resume_from=<seq>)
+        "per_message_deflate": True  # Compress WebSocket frames (permessage-deflate) for clients that support it
+    },
+    "event_bus": {
+        "backend": "local",  # "local" (one app process) or "relay" (share events with other processes through an event relay)
+        "address": "unix:/tmp/chattastic-events.sock",  # Event relay address: unix:<path> or tcp://<host>:<port>
+        "host_relay": False  # Run the event relay inside this process, the only one that runs Kick chat ingest (else: python -m utils.event_bus <address>, chat not shared)
     },
     "ui": {
         "dark_mode": True
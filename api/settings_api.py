@@ -3,7 +3,6 @@ API endpoints for settings management.
 """
 
 import logging
-import json
 import os
 from fastapi import APIRouter, HTTPException, UploadFile, File, Body
 from fastapi.responses import FileResponse
@@ -46,10 +45,7 @@ async def update_settings(new_settings: Dict[str, Any] = Body(...)):
 
         # Broadcast settings update to all connected clients
         if globals.manager:
-            await globals.manager.broadcast(json.dumps({
-                "type": "settings_updated",
-                "data": updated_settings
-            }))
+            await globals.manager.publish("settings_updated", updated_settings)
 
         return updated_settings
     except Exception as e:
@@ -94,10 +90,7 @@ async def set_setting(key_path: str, value: Any = Body(..., embed=True)):
 
         # Broadcast setting update to all connected clients
         if globals.manager:
-            await globals.manager.broadcast(json.dumps({
-                "type": "setting_updated",
-                "data": {"key": key_path, "value": value}
-            }))
+            await globals.manager.publish("setting_updated", {"key": key_path, "value": value})
 
         return {"key": key_path, "value": value}
     except Exception as e:
@@ -140,10 +133,7 @@ async def update_obs_dimensions(dimensions: Dict[str, int] = Body(...)):
 
         # Broadcast settings update to all connected clients
         if globals.manager:
-            await globals.manager.broadcast(json.dumps({
-                "type": "obs_dimensions_updated",
-                "data": updated_settings["obs_source"]
-            }))
+            await globals.manager.publish("obs_dimensions_updated", updated_settings["obs_source"])
 
         return updated_settings["obs_source"]
     except Exception as e:
@@ -213,14 +203,11 @@ async def export_settings():
 
         # Broadcast export success to all connected clients
         if globals.manager:
-            await globals.manager.broadcast(json.dumps({
-                "type": "settings_exported",
-                "data": {
-                    "path": result["path"],
-                    "filename": file_name,
-                    "timestamp": result.get("timestamp")
-                }
-            }))
+            await globals.manager.publish("settings_exported", {
+                "path": result["path"],
+                "filename": file_name,
+                "timestamp": result.get("timestamp")
+            })
 
         # Log the successful export
         logger.info(f"Settings exported successfully to {file_path}")
@@ -263,10 +250,7 @@ async def import_settings(file: UploadFile = File(...)):
 
             # Broadcast import success to all connected clients
             if globals.manager:
-                await globals.manager.broadcast(json.dumps({
-                    "type": "settings_imported",
-                    "data": result["settings"]
-                }))
+                await globals.manager.publish("settings_imported", result["settings"])
 
             # Log successful import
             logger.info(f"Settings imported successfully from {file.filename}")
@@ -27,28 +27,15 @@ router = APIRouter()
 async def broadcast_error(message: str):
     """Broadcasts an error message via WebSocket."""
     if globals.manager:
-        error_message = {
-            "type": "error",
-            "data": {"message": f"Twitch API Error: {message}"}
-        }
-        await globals.manager.broadcast(json.dumps(error_message))
+        await globals.manager.publish("error", {"message": f"Twitch API Error: {message}"})
     else:
         logger.warning("WebSocket manager not available for broadcasting error.")
 
 async def broadcast_viewer_update():
     """Broadcasts the current viewer lists (all and selected)."""
     if globals.manager:
-        viewer_update = {
-            "type": "viewer_list_update",
-            "data": {"viewers": config.viewers_list} # Assuming config.viewers_list holds all viewers
-        }
-        selected_update = {
-            "type": "selected_viewers_update",
-            "data": {"selected_viewers": config.selected_viewers}
-        }
-        # Use asyncio.gather to send concurrently if desired, or send sequentially
-        await globals.manager.broadcast(json.dumps(viewer_update))
-        await globals.manager.broadcast(json.dumps(selected_update))
+        await globals.manager.publish("viewer_list_update", {"viewers": config.viewers_list}) # Assuming config.viewers_list holds all viewers
+        await globals.manager.publish("selected_viewers_update", {"selected_viewers": config.selected_viewers})
     else:
         logger.warning("WebSocket manager not available for broadcasting viewer updates.")
 
@@ -0,0 +1,332 @@
+"""
+In-process capture of the X display's root window.
+
+X11Grabber talks to libX11 through ctypes, so no extra package is needed. With
+the MIT-SHM extension (always there on a local Xvfb) the server copies each
+frame straight into a shared-memory segment allocated once; without it each
+grab falls back to a plain XGetImage round trip. The frame is then encoded as
+PNG from memory by encode_png (numpy + zlib), replacing the per-frame
+`xwd | convert` pipeline and its two processes.
+
+Only ZPixmap images with 32 bits per pixel (Xvfb's default 24-bit depth) are
+handled; anything else raises CaptureError so the caller can use xwd instead.
+"""
+
+import ctypes
+import ctypes.util
+import logging
+import os
+import struct
+import threading
+import zlib
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+DEFAULT_PNG_COMPRESSION = 1  # zlib level: desktop frames are mostly flat colour, so 1 is small enough and fastest
+
+_ZPIXMAP = 2
+_ALL_PLANES = ctypes.c_ulong(-1).value
+_IPC_PRIVATE = 0
+_IPC_CREAT = 0o1000
+_IPC_RMID = 0
+
+
+class CaptureError(Exception):
+    """The display cannot be captured in-process (no libX11, no display, unsupported format)."""
+
+
+class _XImage(ctypes.Structure):
+    # Leading fields of Xlib's XImage; the function table that follows is never touched
+    _fields_ = [
+        ("width", ctypes.c_int),
+        ("height", ctypes.c_int),
+        ("xoffset", ctypes.c_int),
+        ("format", ctypes.c_int),
+        ("data", ctypes.c_void_p),
+        ("byte_order", ctypes.c_int),
+        ("bitmap_unit", ctypes.c_int),
+        ("bitmap_bit_order", ctypes.c_int),
+        ("bitmap_pad", ctypes.c_int),
+        ("depth", ctypes.c_int),
+        ("bytes_per_line", ctypes.c_int),
+        ("bits_per_pixel", ctypes.c_int),
+        ("red_mask", ctypes.c_ulong),
+        ("green_mask", ctypes.c_ulong),
+        ("blue_mask", ctypes.c_ulong),
+    ]
+
+
+class _XShmSegmentInfo(ctypes.Structure):
+    _fields_ = [
+        ("shmseg", ctypes.c_ulong),
+        ("shmid", ctypes.c_int),
+        ("shmaddr", ctypes.c_void_p),
+        ("readOnly", ctypes.c_int),
+    ]
+
+
+class _XErrorEvent(ctypes.Structure):
+    _fields_ = [
+        ("type", ctypes.c_int),
+        ("display", ctypes.c_void_p),
+        ("resourceid", ctypes.c_ulong),
+        ("serial", ctypes.c_ulong),
+        ("error_code", ctypes.c_ubyte),
+        ("request_code", ctypes.c_ubyte),
+        ("minor_code", ctypes.c_ubyte),
+    ]
+
+
+_X_ERROR_HANDLER = ctypes.CFUNCTYPE(ctypes.c_int, ctypes.c_void_p, ctypes.POINTER(_XErrorEvent))
+_libraries = None
+_x_errors = []
+
+
+@_X_ERROR_HANDLER
+def _record_x_error(display, event):
+    # Xlib's default handler exits the process; record the error for the grabber instead
+    _x_errors.append(event.contents.error_code)
+    return 0
+
+
+def _load_libraries():
+    """(libX11, libXext, libc) with the prototypes used here, loaded once."""
+    global _libraries
+    if _libraries is not None:
+        return _libraries
+    names = {name: ctypes.util.find_library(name) for name in ("X11", "Xext", "c")}
+    if not names["X11"]:
+        raise CaptureError("libX11 is not installed")
+    x11 = ctypes.CDLL(names["X11"])
+    xext = ctypes.CDLL(names["Xext"]) if names["Xext"] else None
+    libc = ctypes.CDLL(names["c"], use_errno=True)
+
+    display_p, image_p = ctypes.c_void_p, ctypes.POINTER(_XImage)
+    x11.XOpenDisplay.argtypes = [ctypes.c_char_p]
+    x11.XOpenDisplay.restype = display_p
+    x11.XCloseDisplay.argtypes = [display_p]
+    x11.XDefaultScreen.argtypes = [display_p]
+    x11.XRootWindow.argtypes = [display_p, ctypes.c_int]
+    x11.XRootWindow.restype = ctypes.c_ulong
+    x11.XDisplayWidth.argtypes = [display_p, ctypes.c_int]
+    x11.XDisplayHeight.argtypes = [display_p, ctypes.c_int]
+    x11.XDefaultVisual.argtypes = [display_p, ctypes.c_int]
+    x11.XDefaultVisual.restype = ctypes.c_void_p
+    x11.XDefaultDepth.argtypes = [display_p, ctypes.c_int]
+    x11.XGetImage.argtypes = [display_p, ctypes.c_ulong, ctypes.c_int, ctypes.c_int, ctypes.c_uint,
+                              ctypes.c_uint, ctypes.c_ulong, ctypes.c_int]
+    x11.XGetImage.restype = image_p
+    x11.XDestroyImage.argtypes = [image_p]
+    x11.XSync.argtypes = [display_p, ctypes.c_int]
+    x11.XSetErrorHandler.argtypes = [_X_ERROR_HANDLER]
+    x11.XSetErrorHandler.restype = ctypes.c_void_p
+    x11.XFree.argtypes = [ctypes.c_void_p]
+    if xext:
+        xext.XShmQueryExtension.argtypes = [display_p]
+        xext.XShmCreateImage.argtypes = [display_p, ctypes.c_void_p, ctypes.c_uint, ctypes.c_int, ctypes.c_void_p,
+                                         ctypes.POINTER(_XShmSegmentInfo), ctypes.c_uint, ctypes.c_uint]
+        xext.XShmCreateImage.restype = image_p
+        xext.XShmAttach.argtypes = [display_p, ctypes.POINTER(_XShmSegmentInfo)]
+        xext.XShmDetach.argtypes = [display_p, ctypes.POINTER(_XShmSegmentInfo)]
+        xext.XShmGetImage.argtypes = [display_p, ctypes.c_ulong, image_p, ctypes.c_int, ctypes.c_int, ctypes.c_ulong]
+    libc.shmget.argtypes = [ctypes.c_int, ctypes.c_size_t, ctypes.c_int]
+    libc.shmat.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_int]
+    libc.shmat.restype = ctypes.c_void_p
+    libc.shmdt.argtypes = [ctypes.c_void_p]
+    libc.shmctl.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.c_void_p]
+
+    x11.XSetErrorHandler(_record_x_error)
+    _libraries = (x11, xext, libc)
+    return _libraries
+
+
+def _png_chunk(tag, data):
+    return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data))
+
+
+class PNGEncoder:
+    """
+    Encodes RGB frames (height x width x 3 uint8 arrays) as PNG.
+
+    The filtered scanline buffer (a zero filter byte before each row) is kept
+    between frames of the same size instead of being allocated per frame.
+
+    Args:
+        compression: zlib level, 0-9.
+    """
+
+    def __init__(self, compression=DEFAULT_PNG_COMPRESSION):
+        self.compression = compression
+        self._scanlines = None
+
+    def encode(self, rgb):
+        height, width, _ = rgb.shape
+        if self._scanlines is None or self._scanlines.shape != (height, width * 3 + 1):
+            self._scanlines = np.zeros((height, width * 3 + 1), dtype=np.uint8)
+        self._scanlines[:, 1:] = rgb.reshape(height, width * 3)
+        header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)  # 8-bit RGB, no interlace
+        return (PNG_SIGNATURE + _png_chunk(b"IHDR", header)
+                + _png_chunk(b"IDAT", zlib.compress(self._scanlines.data, self.compression))
+                + _png_chunk(b"IEND", b""))
+
+
+def encode_png(rgb, compression=DEFAULT_PNG_COMPRESSION):
+    """PNG bytes for an RGB frame (a one-off PNGEncoder)."""
+    return PNGEncoder(compression).encode(rgb)
+
+
+class X11Grabber:
+    """
+    Grabs the root window of an X display into a buffer reused across frames.
+
+    Opened lazily on the first grab and reopened after an X error, so a display
+    that comes up after the app (or restarts) is picked up. Grabs are serialized:
+    the screenshot thread and an emergency capture from a request share it.
+
+    Args:
+        display: X display name (defaults to $DISPLAY, then ":99").
+        use_shm: Use the MIT-SHM extension when the server offers it.
+    """
+
+    def __init__(self, display=None, use_shm=True):
+        self.display_name = display or os.environ.get("DISPLAY", ":99")
+        self.use_shm = use_shm
+        self.shm = False  # Whether the open display is grabbed through shared memory
+        self.width = self.height = 0
+        self._lock = threading.Lock()
+        self._display = None
+        self._root = None
+        self._image = None
+        self._shm_info = None
+        self._pixels = None
+
+    def open(self):
+        x11, xext, libc = _load_libraries()
+        display = x11.XOpenDisplay(self.display_name.encode())
+        if not display:
+            raise CaptureError(f"Cannot open X display {self.display_name}")
+        self._display = display
+        screen = x11.XDefaultScreen(display)
+        self._root = x11.XRootWindow(display, screen)
+        self.width, self.height = x11.XDisplayWidth(display, screen), x11.XDisplayHeight(display, screen)
+        self.shm = False
+        if self.use_shm and xext and xext.XShmQueryExtension(display):
+            try:
+                self._attach_shm(x11, xext, libc, screen)
+                self.shm = True
+            except CaptureError as e:
+                logger.warning(f"MIT-SHM unavailable on {self.display_name} ({e}); using XGetImage")
+                self._release_shm(x11, xext, libc)
+        logger.info(f"Capturing X display {self.display_name} in-process ({self.width}x{self.height}, "
+                    f"{'MIT-SHM' if self.shm else 'XGetImage'})")
+
+    def _attach_shm(self, x11, xext, libc, screen):
+        display = self._display
+        info = _XShmSegmentInfo()
+        self._shm_info = info
+        image = xext.XShmCreateImage(display, x11.XDefaultVisual(display, screen), x11.XDefaultDepth(display, screen),
+                                     _ZPIXMAP, None, ctypes.byref(info), self.width, self.height)
+        if not image:
+            raise CaptureError("XShmCreateImage failed")
+        self._image = image
+        size = image.contents.bytes_per_line * image.contents.height
+        info.shmid = libc.shmget(_IPC_PRIVATE, size, _IPC_CREAT | 0o600)
+        if info.shmid < 0:
+            raise CaptureError(f"shmget failed: {os.strerror(ctypes.get_errno())}")
+        address = libc.shmat(info.shmid, None, 0)
+        if address in (None, ctypes.c_void_p(-1).value):
+            libc.shmctl(info.shmid, _IPC_RMID, None)
+            raise CaptureError(f"shmat failed: {os.strerror(ctypes.get_errno())}")
+        info.shmaddr = image.contents.data = address
+        info.readOnly = 0
+        _x_errors.clear()
+        xext.XShmAttach(display, ctypes.byref(info))
+        x11.XSync(display, 0)
+        libc.shmctl(info.shmid, _IPC_RMID, None)  # Freed by the kernel once both sides detach
+        if _x_errors:
+            info.shmid = -1
+            raise CaptureError(f"XShmAttach failed (X error {_x_errors[-1]}); is the X server remote?")
+        self._pixels = (ctypes.c_ubyte * size).from_address(address)
+
+    def _release_shm(self, x11, xext, libc):
+        info, image = self._shm_info, self._image
+        if info is not None and info.shmaddr:
+            if info.shmid >= 0:
+                xext.XShmDetach(self._display, ctypes.byref(info))
+                x11.XSync(self._display, 0)
+            libc.shmdt(info.shmaddr)
+        if image:
+            image.contents.data = None  # The segment is not malloc'd, so XFree only the header
+            x11.XFree(image)
+        self._shm_info = self._image = self._pixels = None
+
+    def close(self):
+        with self._lock:
+            self._close()
+
+    def _close(self):
+        if not self._display:
+            return
+        x11, xext, libc = _load_libraries()
+        self._release_shm(x11, xext, libc)
+        x11.XCloseDisplay(self._display)
+        self._display = None
+
+    def grab(self):
+        """
+        The root window as an RGB array (height x width x 3, a fresh copy).
+
+        Raises:
+            CaptureError: If the display cannot be opened or grabbed.
+        """
+        with self._lock:
+            try:
+                if not self._display:
+                    self.open()
+                return self._grab()
+            except CaptureError:
+                self._close()
+                raise
+
+    def _grab(self):
+        x11, xext, _ = _load_libraries()
+        _x_errors.clear()
+        if self.shm:
+            if not xext.XShmGetImage(self._display, self._root, self._image, 0, 0, _ALL_PLANES) or _x_errors:
+                raise CaptureError("XShmGetImage failed")
+            return self._to_rgb(self._image.contents, self._pixels)
+        image = x11.XGetImage(self._display, self._root, 0, 0, self.width, self.height, _ALL_PLANES, _ZPIXMAP)
+        if not image or _x_errors:
+            raise CaptureError("XGetImage failed")
+        try:
+            size = image.contents.bytes_per_line * image.contents.height
+            return self._to_rgb(image.contents, (ctypes.c_ubyte * size).from_address(image.contents.data))
+        finally:
+            x11.XDestroyImage(image)
+
+    @staticmethod
+    def _to_rgb(image, pixels):
+        if image.bits_per_pixel != 32:
+            raise CaptureError(f"Unsupported X image format: {image.bits_per_pixel} bits per pixel")
+        return ximage_to_rgb(np.frombuffer(pixels, dtype=np.uint8), image.width, image.height,
+                             image.bytes_per_line, (image.red_mask, image.green_mask, image.blue_mask),
+                             image.byte_order)
+
+
+def ximage_to_rgb(data, width, height, bytes_per_line, masks=(0xFF0000, 0x00FF00, 0x0000FF), byte_order=0):
+    """
+    RGB array from 32-bit ZPixmap data (BGRX in memory on a little-endian server).
+
+    Args:
+        data: Flat uint8 array of bytes_per_line * height bytes.
+        masks: The visual's (red, green, blue) masks, each one byte wide.
+        byte_order: 0 for LSBFirst, 1 for MSBFirst.
+    """
+    pixels = data[:bytes_per_line * height].reshape(height, bytes_per_line // 4, 4)[:, :width]
+    channels = [(mask & -mask).bit_length() // 8 for mask in masks]  # Byte holding each channel, LSB first
+    if byte_order:
+        channels = [3 - channel for channel in channels]
+    return pixels[:, :, channels]  # Fancy indexing copies, so the shared buffer can be reused
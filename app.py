@@ -1,15 +1,19 @@
 
 
 import asyncio
+import errno
 import os
 import logging
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
-from fastapi.responses import HTMLResponse, FileResponse
+from fastapi import FastAPI, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import HTMLResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 import uvicorn
 import config  # Assuming config.py holds necessary configurations
 import globals # Import the globals module
 import json # Add json import for message handling
+from utils.connection_manager import ConnectionManager, parse_encoding, parse_topics # WebSocket client registry and broadcast workers
+from utils.sse import SSE_HEADERS, SSEConnection, parse_last_event_id # Read-only event stream over the same bus
+from utils.event_bus import DEFAULT_RELAY_ADDRESS, EventRelay # Relay sharing events between app processes
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -20,96 +24,12 @@ app = FastAPI()
 # Mount static files directories (for HTML, CSS, JS)
 app.mount("/static", StaticFiles(directory="ui"), name="static")
 app.mount("/static-assets", StaticFiles(directory="static"), name="static-assets")
-# Mount screenshots directory directly to avoid 404 errors
-app.mount("/screenshots", StaticFiles(directory="static/screenshots"), name="screenshots")
-
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections: list[WebSocket] = []
-        self._broadcast_lock = asyncio.Lock()
-        self._screenshot_queue = asyncio.Queue()
-        self._chat_queue = asyncio.Queue()
-        # Start the broadcast workers
-        asyncio.create_task(self._screenshot_broadcast_worker())
-        asyncio.create_task(self._chat_broadcast_worker())
-
-    async def connect(self, websocket: WebSocket):
-        await websocket.accept()
-        self.active_connections.append(websocket)
-        logger.info(f"WebSocket connected: {websocket.client}")
-
-    def disconnect(self, websocket: WebSocket):
-        if websocket in self.active_connections:
-            self.active_connections.remove(websocket)
-            logger.info(f"WebSocket disconnected: {websocket.client}")
-
-    async def send_personal_message(self, message: str, websocket: WebSocket):
-        try:
-            await websocket.send_text(message)
-        except Exception as e:
-            logger.error(f"Error sending personal message to {websocket.client}: {e}")
-            # Disconnect problematic client
-            self.disconnect(websocket)
-
-    async def broadcast(self, message: str):
-        # Parse the message to determine its type
-        try:
-            msg_data = json.loads(message)
-            msg_type = msg_data.get("type", "")
-
-            # Route screenshot updates to the high-priority queue
-            if msg_type == "screenshot_update" or "desktop_view" in msg_type:
-                await self._screenshot_queue.put(message)
-            # Route chat messages to the regular queue
-            elif msg_type == "kick_chat_message" or "twitch_chat_message" in msg_type:
-                await self._chat_queue.put(message)
-            # All other messages go through the immediate broadcast
-            else:
-                await self._direct_broadcast(message)
-        except json.JSONDecodeError:
-            # If we can't parse the message, just broadcast it directly
-            await self._direct_broadcast(message)
-
-    async def _direct_broadcast(self, message: str):
-        """Immediately broadcast a message to all connections."""
-        async with self._broadcast_lock:
-            # Only log non-screenshot messages
-            if 'screenshot_update' not in message and 'desktop_view' not in message:
-                logger.debug(f"Direct broadcasting message: {message[:100]}...")
-            for connection in self.active_connections.copy():  # Use copy to avoid modification during iteration
-                try:
-                    await connection.send_text(message)
-                except Exception as e:
-                    logger.error(f"Error sending message to {connection.client}: {e}")
-                    # Disconnect problematic clients
-                    self.disconnect(connection)
-
-    async def _screenshot_broadcast_worker(self):
-        """Worker that processes screenshot messages with high priority."""
-        while True:
-            try:
-                message = await self._screenshot_queue.get()
-                await self._direct_broadcast(message)
-                self._screenshot_queue.task_done()
-            except Exception as e:
-                logger.error(f"Error in screenshot broadcast worker: {e}")
-                await asyncio.sleep(0.1)
-
-    async def _chat_broadcast_worker(self):
-        """Worker that processes chat messages with normal priority."""
-        while True:
-            try:
-                message = await self._chat_queue.get()
-                await self._direct_broadcast(message)
-                self._chat_queue.task_done()
-                # Small delay to allow screenshot messages to be processed
-                await asyncio.sleep(0.01)
-            except Exception as e:
-                logger.error(f"Error in chat broadcast worker: {e}")
-                await asyncio.sleep(0.1)
+# Screenshots are served from memory by /api/screenshot; this directory only fills with DEBUG_SCREENSHOTS=1
+app.mount("/screenshots", StaticFiles(directory="static/screenshots", check_dir=False), name="screenshots")
 
 # Create the manager instance and assign it to the globals module
 globals.manager = ConnectionManager()
+event_relay = None  # EventRelay hosted by this process (event_bus.host_relay)
 
 @app.get("/", response_class=HTMLResponse)
 async def get_root(code: str = None, state: str = None):
@@ -141,6 +61,8 @@ from api import twitch as twitch_api # Import the refactored twitch api module
 from api import kick as kick_api # Import the refactored kick api module
 from api import docker as docker_api # Import the Docker API module
 from api import screenshot as screenshot_api # Import the screenshot module
+from api.frame_store import etag_matches # Conditional GETs for in-memory screenshots
+from api.frame_stream import DEFAULT_STREAM_MAX_FPS, MULTIPART_MEDIA_TYPE, STREAM_HEADERS, parse_fps, stream_frames # Live desktop view
 from api import settings as settings_module # Import the settings module
 from api import settings_api # Import the settings API router
 # TODO: Import audio utils if needed for TTS trigger
@@ -172,6 +94,7 @@ async def handle_ws_message(websocket: WebSocket, message: dict):
                     "twitch_channel": config.selected_channel,
                     "kick_channel": config.kick_channel_name,
                     "kick_connected": config.kick_chat_connected,
+                    "kick_channels": kick_api.sessions.channel_names(),
                     "raffle_entries_count": len(config.entered_users),
                     "settings": current_settings,
                     # Add twitch connected status if implemented
@@ -192,7 +115,11 @@ async def handle_ws_message(websocket: WebSocket, message: dict):
 
         elif msg_type == "connect_kick_chat":
             channel = msg_data.get("channel")
-            if channel:
+            if not globals.manager.publishes_chat:
+                # Chat seqs and push tokens are per process: only the process hosting the event relay ingests
+                logger.warning(f"Refusing to connect Kick chat for '{channel}': this process does not host the event relay")
+                await globals.manager.send_personal_message(json.dumps({"type": "error", "data": {"message": "Kick chat runs in the process hosting the event relay (event_bus.host_relay)"}}), websocket)
+            elif channel:
                 await kick_api.connect_kick_chat(channel) # Call the async function
             else:
                 logger.warning("Connect Kick chat request missing channel name.")
@@ -204,7 +131,29 @@ async def handle_ws_message(websocket: WebSocket, message: dict):
              await globals.manager.send_personal_message(json.dumps({"type": "error", "data": {"message": "Twitch chat disconnect not implemented"}}), websocket)
 
         elif msg_type == "disconnect_kick_chat":
-             await kick_api.disconnect_kick_chat() # Call the async function
+             # Disconnect one channel, or all of them when no channel is given
+             await kick_api.disconnect_kick_chat(msg_data.get("channel")) # Call the async function
+
+        elif msg_type == "subscribe":
+            # Replace this client's topic subscription ("*" or no topics = everything)
+            topics = parse_topics(msg_data.get("topics"))
+            globals.manager.set_topics(websocket, topics)
+            await globals.manager.send_event(websocket, "subscribed", {"topics": sorted(topics) if topics else ["*"]})
+
+        elif msg_type == "get_kick_channels":
+            await globals.manager.send_personal_message(json.dumps({
+                "type": "kick_channels",
+                "data": {"channels": kick_api.get_kick_channel_metrics()}
+            }), websocket)
+
+        elif msg_type == "get_websocket_stats":
+            # Priority class backlogs and per-client queues, e.g. to see what is delaying chat
+            await globals.manager.send_event(websocket, "websocket_stats", {
+                "scheduler": globals.manager.scheduler_stats(),
+                "clients": globals.manager.stats(),
+                "bus": globals.manager.bus_stats(),
+                "screenshots": screenshot_api.stats(),
+            })
 
         elif msg_type == "get_docker_containers":
             # Get Docker containers and send to client
@@ -243,15 +192,12 @@ async def handle_ws_message(websocket: WebSocket, message: dict):
                     return
 
                 # Select random viewers from Kick chat
-                selected_viewers = await kick_api.select_random_kick_viewers(count, use_raffle)
+                selected_viewers = await kick_api.select_random_kick_viewers(count, use_raffle, msg_data.get("channel"))
                 if selected_viewers:
                     # Update global selected viewers list
                     config.selected_viewers = selected_viewers
                     # Broadcast the selected viewers
-                    await globals.manager.broadcast(json.dumps({
-                        "type": "selected_viewers_update",
-                        "data": {"selected_viewers": selected_viewers}
-                    }))
+                    await globals.manager.publish("selected_viewers_update", {"selected_viewers": selected_viewers})
             else:  # Default to Twitch
                 # This is handled by the POST endpoint in twitch_api
                 logger.info("Twitch viewer selection should use POST /api/twitch/select-viewers endpoint.")
@@ -270,10 +216,7 @@ async def handle_ws_message(websocket: WebSocket, message: dict):
         elif msg_type == "clear_raffle_entries":
             logger.info("Clearing raffle entries")
             config.entered_users.clear()
-            await globals.manager.broadcast(json.dumps({
-                "type": "raffle_entries_cleared",
-                "data": {"message": "Raffle entries cleared"}
-            }))
+            await globals.manager.publish("raffle_entries_cleared", {"message": "Raffle entries cleared"})
 
         # --- Handle Control Messages for Kick Overlay ---
         elif msg_type == "control_kick_overlay":
@@ -383,11 +326,7 @@ async def handle_ws_message(websocket: WebSocket, message: dict):
                 # Optionally send an error back to the sender if needed
                 return # Don't broadcast unknown commands
 
-            overlay_command = {
-                "type": "kick_overlay_command",
-                "data": command_data
-            }
-            await globals.manager.broadcast(json.dumps(overlay_command))
+            await globals.manager.publish("kick_overlay_command", command_data)
         # --- End Kick Overlay Control ---
 
         elif msg_type == "update_screenshot_interval":
@@ -417,6 +356,10 @@ async def handle_ws_message(websocket: WebSocket, message: dict):
                     "data": {"message": f"Error updating screenshot interval: {str(e)}"}
                 }), websocket)
 
+        elif msg_type == "screenshot_boost":
+            # The user is interacting with the desktop view: capture faster for a little while
+            screenshot_api.controller.boost()
+
         elif msg_type == "update_settings":
             # Update settings
             try:
@@ -426,10 +369,7 @@ async def handle_ws_message(websocket: WebSocket, message: dict):
                     logger.info(f"Updated settings: {updated_settings}")
 
                     # Broadcast settings update to all clients
-                    await globals.manager.broadcast(json.dumps({
-                        "type": "settings_updated",
-                        "data": updated_settings
-                    }))
+                    await globals.manager.publish("settings_updated", updated_settings)
                 else:
                     logger.warning("Update settings request with empty settings data.")
             except Exception as e:
@@ -479,10 +419,7 @@ async def handle_ws_message(websocket: WebSocket, message: dict):
                 logger.info(f"Updated OBS dimensions: {updated_settings['obs_source']}")
 
                 # Broadcast OBS dimensions update to all clients
-                await globals.manager.broadcast(json.dumps({
-                    "type": "obs_dimensions_updated",
-                    "data": updated_settings["obs_source"]
-                }))
+                await globals.manager.publish("obs_dimensions_updated", updated_settings["obs_source"])
             except Exception as e:
                 logger.error(f"Error updating OBS dimensions: {e}")
                 await globals.manager.send_personal_message(json.dumps({
@@ -515,9 +452,10 @@ async def handle_ws_message(websocket: WebSocket, message: dict):
 
 
 @app.websocket("/ws")
-async def websocket_endpoint(websocket: WebSocket):
-    # Use the manager from the globals module
-    await globals.manager.connect(websocket)
+async def websocket_endpoint(websocket: WebSocket, topics: str = None, encoding: str = None, resume_from: int = None):
+    # Use the manager from the globals module. Overlays pass ?topics=chat,overlay to skip everything else,
+    # ?encoding=msgpack for binary MessagePack frames and, when reconnecting, ?resume_from=<last chat seq>.
+    await globals.manager.connect(websocket, topics=parse_topics(topics), encoding=parse_encoding(encoding), resume_from=resume_from)
     try:
         # Send initial status when a client connects
         # Load current settings
@@ -531,17 +469,17 @@ async def websocket_endpoint(websocket: WebSocket):
                 "twitch_channel": config.selected_channel, # Assuming this holds twitch channel
                 "kick_channel": config.kick_channel_name, # Assuming this holds kick channel
                 "kick_connected": config.kick_chat_connected, # Add kick connection status
+                "kick_channels": kick_api.sessions.channel_names(), # All connected Kick channels
                 "raffle_entries_count": len(config.entered_users), # Add raffle entries count
                 "settings": current_settings, # Include current settings
                 # TODO: Add twitch_connected status if implemented
             }
         }
-        logger.info(f"Sending initial status to new client: Twitch={config.IS_AUTHENTICATED}, Kick={config.KICK_IS_AUTHENTICATED}")
-        try:
-            await websocket.send_text(json.dumps(initial_status))
-            logger.info("Initial status sent successfully")
-        except Exception as e:
-            logger.error(f"Error sending initial status: {e}")
+        if globals.manager.wants(websocket, "initial_status"):
+            logger.info(f"Sending initial status to new client: Twitch={config.IS_AUTHENTICATED}, Kick={config.KICK_IS_AUTHENTICATED}")
+            # Queued like every other message, so it is never sent concurrently with a broadcast
+            await globals.manager.send_personal_message(json.dumps(initial_status), websocket)
+            logger.info("Initial status queued")
 
         while True:
             # Keep connection open and listen for messages from the client
@@ -576,6 +514,64 @@ async def websocket_endpoint(websocket: WebSocket):
             globals.manager.disconnect(websocket)
 
 
+@app.get("/sse")
+async def sse_endpoint(request: Request, topics: str = "chat,overlay", last_event_id: str = None):
+    """
+    Read-only Server-Sent Events stream of the WebSocket bus for overlays (chat and overlay commands by default).
+
+    EventSource resends the last chat seq as the Last-Event-ID header when it reconnects
+    (?last_event_id= works too), and the chat missed in between is replayed.
+    """
+    connection = SSEConnection(request.client)
+    resume_from = parse_last_event_id(request.headers.get("last-event-id") or last_event_id)
+    await globals.manager.connect(connection, topics=parse_topics(topics), resume_from=resume_from)
+    return StreamingResponse(
+        connection.stream(on_close=globals.manager.disconnect, is_disconnected=request.is_disconnected),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS,
+    )
+
+
+@app.websocket("/ws/kick-ingest")
+async def kick_ingest_endpoint(websocket: WebSocket, token: str = None):
+    """Receives new chat rows pushed by the script injected into the Kick page."""
+    if not globals.manager.publishes_chat:
+        logger.warning(f"Rejected Kick ingest connection from {websocket.client}: this process does not host the event relay")
+        await websocket.close(code=1008)
+        return
+    session = kick_api.sessions.find_by_push_token(token)
+    if not session:
+        logger.warning(f"Rejected Kick ingest connection from {websocket.client}: invalid token")
+        await websocket.close(code=1008)
+        return
+
+    await websocket.accept()
+    # A reconnecting page may open its new socket before the old one has closed: the newest one owns the flag
+    session.push_socket = websocket
+    session.push_connected = True
+    logger.info(f"Kick page push channel connected for {session.channel_name}: {websocket.client}")
+    try:
+        while True:
+            data = await websocket.receive_text()
+            try:
+                payload = json.loads(data)
+            except json.JSONDecodeError:
+                logger.error(f"Received invalid JSON on Kick ingest channel: {data[:200]}")
+                continue
+            if not isinstance(payload, dict):
+                logger.error(f"Ignoring Kick ingest payload that is not an object: {data[:200]}")
+                continue
+            await kick_api.ingest_pushed_rows(session, payload.get("rows", []))
+    except WebSocketDisconnect:
+        logger.info(f"Kick page push channel disconnected: {websocket.client}")
+    except Exception as e:
+        logger.error(f"Kick ingest channel error for {websocket.client}: {e}", exc_info=True)
+    finally:
+        if session.push_socket is websocket:
+            session.push_socket = None
+            session.push_connected = False
+
+
 # Placeholder for other utility endpoints (can be removed if status is handled by WS)
 # @app.get("/api/status")
 # async def get_status():
@@ -625,8 +621,9 @@ async def get_docker_logs():
 
 # Screenshot endpoint
 @app.get("/api/screenshot")
-async def get_screenshot(t: str = None, id: str = None, fallback: bool = False, direct: bool = False, emergency: bool = False, retry: bool = False):
-    screenshot_path = screenshot_api.get_latest_screenshot()
+async def get_screenshot(request: Request, t: str = None, id: str = None, seq: int = None, instance: str = None, fallback: bool = False, direct: bool = False, emergency: bool = False, retry: bool = False):
+    # Served from memory: the frame announced by a screenshot_update (seq, instance) while it is held, else the latest
+    frame = screenshot_api.get_frame(seq, instance)
 
     # Only log special screenshot requests, not regular updates
     if fallback or direct or emergency or retry:
@@ -634,35 +631,60 @@ async def get_screenshot(t: str = None, id: str = None, fallback: bool = False,
 
     # Check if we need to force a new screenshot capture
     if emergency or retry:
+        screenshot_api.controller.boost()  # Someone is looking right now, even if no dashboard is subscribed
         try:
-            # Force a new screenshot capture
-            output_path = os.path.join("static", "screenshots", "desktop_view.png")
-            if screenshot_api.capture_screenshot(output_path):
-                screenshot_path = output_path
-                logger.info(f"Emergency screenshot captured successfully: {output_path}")
+            # Force a new screenshot capture (off the event loop; the grab and encode block)
+            captured = await asyncio.to_thread(screenshot_api.capture_screenshot)
+            if captured:
+                frame = captured
+                logger.info(f"Emergency screenshot captured successfully: frame {frame.seq}")
         except Exception as e:
             logger.error(f"Error capturing emergency screenshot: {e}")
 
-    if screenshot_path and os.path.exists(screenshot_path):
-        # Add cache control headers to prevent caching
-        headers = {
-            "Cache-Control": "no-cache, no-store, must-revalidate",
-            "Pragma": "no-cache",
-            "Expires": "0"
-        }
-        return FileResponse(screenshot_path, headers=headers)
-    else:
-        logger.warning(f"Screenshot not found at path: {screenshot_path}")
+    if not frame:
+        logger.warning("No screenshot captured yet")
         return HTMLResponse(content="<html><body><h1>No screenshot available</h1></body></html>", status_code=404)
 
+    headers = {"ETag": frame.etag, "X-Frame-Seq": str(frame.seq)}
+    if screenshot_api.is_exact_frame(frame, seq, instance):
+        # A seq of this process's frame store always names the same bytes
+        headers["Cache-Control"] = "private, max-age=300, immutable"
+    else:
+        # Revalidate every time; an unchanged desktop answers 304 by ETag
+        headers["Cache-Control"] = "no-cache"
+    if etag_matches(request.headers.get("if-none-match"), frame.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=frame.data, media_type=frame.content_type, headers=headers)
+
+# Live desktop view: one long-lived multipart response fed by the capture loop
+@app.get("/api/screenshot/stream")
+async def stream_screenshots(fps: float = None):
+    max_fps = settings_module.get_setting("screenshot.stream_max_fps", DEFAULT_STREAM_MAX_FPS)
+    return StreamingResponse(stream_frames(screenshot_api.frame_store, parse_fps(fps, max_fps)),
+                             media_type=MULTIPART_MEDIA_TYPE, headers=STREAM_HEADERS)
+
 # --- Application Startup/Shutdown ---
 @app.on_event("startup")
 async def startup_event():
+    global event_relay
     logger.info("Application starting up...")
     # Initialize settings module
     settings_module.initialize()
     logger.info("Settings module initialized")
 
+    # Host the event relay other app processes connect to, if this is the process configured to
+    if settings_module.get_setting("event_bus.host_relay", False):
+        try:
+            event_relay = await EventRelay(settings_module.get_setting("event_bus.address", DEFAULT_RELAY_ADDRESS)).start()
+            globals.manager.publishes_chat = True  # The relay's host is the one process running Kick ingest
+        except OSError as e:
+            if e.errno == errno.EADDRINUSE:
+                logger.info(f"Not hosting the event relay, another process already does: {e}")
+            else:
+                logger.error(f"Could not start the event relay: {e}")
+        except ValueError as e:
+            logger.error(f"Could not start the event relay: {e}")
+
     # Initialize authentication state
     await auth_router.initialize_auth()
 
@@ -690,10 +712,15 @@ async def shutdown_event():
     # Disconnect Kick chat cleanly
     await kick_api.disconnect_kick_chat()
     # TODO: Add disconnect for Twitch chat if implemented
+    await globals.manager.shutdown()
+    if event_relay:
+        await event_relay.close()
     logger.info("Shutdown complete.")
 
 
 if __name__ == "__main__":
     # Note: Use 'uvicorn app:app --reload' from CLI for development
     # The --reload flag handles code changes automatically
-    uvicorn.run("app:app", host="0.0.0.0", port=8000, reload=True)
+    # permessage-deflate is negotiated with browsers that offer it (uvicorn CLI: --ws-per-message-deflate)
+    uvicorn.run("app:app", host="0.0.0.0", port=8000, reload=True,
+                ws_per_message_deflate=settings_module.get_setting("websocket.per_message_deflate", True))
@@ -0,0 +1,49 @@
+"""
+Benchmark the Kick chat parser backends on recorded chat HTML.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_kick_parser [--repeat 5]
+
+Reports the best time per container and per row for each backend at
+50, 300 and 3000 rows.
+"""
+
+import argparse
+import time
+
+from api import kick_parser
+from benchmarks.kick_fixtures import build_chat_container
+
+ROW_COUNTS = (50, 300, 3000)
+
+
+def time_parser(parse_rows, html, repeat):
+    """Return the best wall time (seconds) and the message count for one parser."""
+    best = float("inf")
+    messages = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        messages = parse_rows(html)
+        best = min(best, time.perf_counter() - start)
+    return best, len(messages)
+
+
+def run(repeat=5):
+    """Run the benchmark and print one line per backend and container size."""
+    print(f"{'backend':<8} {'rows':>6} {'parsed':>7} {'ms/container':>13} {'us/row':>9}")
+    results = {}
+    for row_count in ROW_COUNTS:
+        html = build_chat_container(row_count)
+        for name, parse_rows in kick_parser.PARSERS.items():
+            seconds, parsed = time_parser(parse_rows, html, repeat)
+            results[(name, row_count)] = seconds
+            print(f"{name:<8} {row_count:>6} {parsed:>7} {seconds * 1000:>13.2f} {seconds * 1e6 / row_count:>9.1f}")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per measurement (best time is reported)")
+    args = parser.parse_args()
+    run(args.repeat)
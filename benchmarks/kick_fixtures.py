@@ -0,0 +1,61 @@
+"""
+Kick chat HTML fixtures for the parser benchmark and the ingest replay harness.
+
+The message groups in fixtures/kick_chat_rows.html were captured from a live
+#chatroom-messages container. build_chat_container() wraps them in
+div[data-index] rows the way Kick renders them, including the index
+wraparound after MAX_KICK_INDEX.
+"""
+
+import os
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+CHAT_ROWS_FIXTURE = os.path.join(FIXTURES_DIR, "kick_chat_rows.html")
+
+MAX_KICK_INDEX = 299  # Mirrors api.kick.MAX_KICK_INDEX (kept local so fixtures load without Selenium)
+
+_message_groups = None
+
+
+def load_message_groups():
+    """Load the recorded `div.group` message elements (one per line in the fixture file)."""
+    global _message_groups
+    if _message_groups is None:
+        with open(CHAT_ROWS_FIXTURE, "r", encoding="utf-8") as file:
+            _message_groups = [
+                line.strip() for line in file
+                if line.strip().startswith('<div class="group')
+            ]
+    return _message_groups
+
+
+def build_chat_rows(row_count, start_sequence=0, unique=False):
+    """
+    Build `div[data-index]` rows by cycling through the recorded message groups.
+
+    Args:
+        row_count: Number of rows to generate.
+        start_sequence: Absolute message number of the first row. The data-index
+            is derived from it and wraps after MAX_KICK_INDEX like Kick's list.
+        unique: If True, append the absolute message number to each message text
+            so every generated message has distinct content.
+
+    Returns:
+        list: The outerHTML of each row.
+    """
+    groups = load_message_groups()
+    rows = []
+    for sequence in range(start_sequence, start_sequence + row_count):
+        group = groups[sequence % len(groups)]
+        if unique:
+            # Every recorded group ends with the closing tags of the message span
+            group = group[:-len("</span></div></div>")] + f" #{sequence}</span></div></div>"
+        index = sequence % (MAX_KICK_INDEX + 1)
+        rows.append(f'<div data-index="{index}" class="absolute left-0 top-0 w-full">{group}</div>')
+    return rows
+
+
+def build_chat_container(row_count, start_sequence=0, unique=False):
+    """Build a full #chatroom-messages container with `row_count` rows."""
+    rows = "".join(build_chat_rows(row_count, start_sequence, unique))
+    return f'<div id="chatroom-messages" class="overflow-y-scroll">{rows}</div>'
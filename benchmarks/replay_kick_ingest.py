@@ -0,0 +1,349 @@
+"""
+Replay recorded or synthetic Kick chat through the real ingest path and measure it.
+
+Run from the repository root:
+
+    python -m benchmarks.replay_kick_ingest [--messages 2000] [--capture-mode snapshot]
+    python -m benchmarks.replay_kick_ingest --snapshots path/to/snapshots/
+
+A fake Selenium driver serves #chatroom-messages snapshots to api.kick.poll_messages
+("snapshot"/"observer" capture), or the rows are handed to api.kick.ingest_pushed_rows
+("push" capture). api.kick.stream_messages then parses, deduplicates and broadcasts
+them through a real ConnectionManager to fake WebSocket clients.
+
+Reports messages/sec, p50/p99 end-to-end latency (capture -> client send) and CPU
+time per message. Recorded snapshots are the outerHTML of #chatroom-messages saved
+as one .html file per capture; they are replayed in file name order.
+"""
+
+import argparse
+import asyncio
+import copy
+import glob
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict, deque
+
+import lxml.html
+
+import config
+import globals
+from api import kick, kick_parser, settings
+from benchmarks.kick_fixtures import build_chat_container
+from utils.connection_manager import ConnectionManager
+
+CAPTURE_MODES = ("snapshot", "observer", "push")
+
+
+# --- Replay input ---
+
+def synthetic_snapshots(message_count, per_capture=7, visible_rows=60):
+    """Build the snapshots of a chat that receives `per_capture` new messages between captures."""
+    snapshots = []
+    for newest in range(per_capture, message_count + per_capture, per_capture):
+        newest = min(newest, message_count)
+        first = max(0, newest - visible_rows)
+        snapshots.append(build_chat_container(newest - first, first, unique=True))
+    return snapshots
+
+
+def load_snapshots(directory):
+    """Load recorded #chatroom-messages snapshots (one .html file per capture, in name order)."""
+    snapshots = []
+    for path in sorted(glob.glob(os.path.join(directory, "*.html"))):
+        with open(path, "r", encoding="utf-8") as file:
+            snapshots.append(file.read())
+    return snapshots
+
+
+def split_rows(container_html):
+    """Return the outerHTML of each `div[data-index]` row in a snapshot."""
+    root = lxml.html.fragment_fromstring(container_html, create_parent="div")
+    return [
+        lxml.html.tostring(row, encoding="unicode", with_tail=False)
+        for row in root.iter("div") if row.get("data-index") is not None
+    ]
+
+
+def prepare_steps(snapshots):
+    """
+    Precompute what each capture reveals, outside of the measured run.
+
+    Returns:
+        list: One dict per capture with the snapshot "html", the "new_rows" an observer
+        would report (rows absent from the previous snapshot) and the (user, text) of the
+        messages those rows are "expected" to broadcast.
+    """
+    steps = []
+    previous_rows = set()
+    for html in snapshots:
+        rows = split_rows(html)
+        new_rows = [row for row in rows if row not in previous_rows]
+        previous_rows = set(rows)
+        wrapped = f'<div id="chatroom-messages">{"".join(new_rows)}</div>'
+        expected = [(msg["sender"], msg["content"]) for msg in kick_parser.parse_chat_rows_lxml(wrapped)]
+        steps.append({"html": html, "new_rows": new_rows, "expected": expected})
+    return steps
+
+
+# --- Fakes ---
+
+class ReplayRecorder:
+    """Matches broadcast chat messages to the moment their row was captured."""
+
+    def __init__(self, expected_total):
+        self.expected_total = expected_total
+        self._captured = defaultdict(deque)  # (user, text) -> capture times, oldest first
+        self.latencies = []
+        self.unexpected = 0  # Broadcasts with no pending capture (duplicates or unknown messages)
+        self.frames = 0  # Chat frames received (single messages or kick_chat_batch)
+        self.done = asyncio.Event()
+
+    def mark_captured(self, step):
+        now = time.perf_counter()
+        for key in step["expected"]:
+            self._captured[key].append(now)
+
+    def on_send(self, message):
+        now = time.perf_counter()
+        payload = json.loads(message)
+        if payload.get("type") == "kick_chat_batch":
+            self.frames += 1
+            events = payload["data"]["messages"]
+        elif payload.get("type") == "kick_chat_message":
+            self.frames += 1
+            events = [payload]
+        else:
+            return
+        for event in events:
+            data = event["data"]
+            pending = self._captured.get((data["user"], data["text"]))
+            if not pending:
+                self.unexpected += 1
+                continue
+            self.latencies.append(now - pending.popleft())
+        if len(self.latencies) >= self.expected_total:
+            self.done.set()
+
+
+class FakeWebSocket:
+    """Minimal stand-in for a starlette WebSocket as used by ConnectionManager."""
+
+    def __init__(self, number, recorder=None):
+        self.client = ("replay-client", number)
+        self.recorder = recorder
+        self.messages_sent = 0
+
+    async def accept(self):
+        pass
+
+    async def close(self, code=1000):
+        pass
+
+    async def send_text(self, message):
+        self.messages_sent += 1
+        if self.recorder:
+            self.recorder.on_send(message)
+
+
+class FakeElement:
+    def __init__(self, driver):
+        self._driver = driver
+
+    def get_attribute(self, name):
+        self._driver.round_trips += 1
+        return self._driver.next_step()["html"] if name == "outerHTML" else None
+
+
+class FakeChatDriver:
+    """
+    Serves the replay steps to poll_messages in place of the Selenium driver.
+
+    Every capture (a container fetch or an observer drain) advances to the next
+    step. Once the replay is exhausted the last snapshot keeps being served with
+    no new rows, like an idle chat.
+    """
+
+    session_id = "replay-session"
+
+    def __init__(self, steps, recorder, latency=0.0):
+        self.round_trips = 0  # WebDriver calls made by the capture loop
+        self.url_checks = 0  # current_url reads (liveness probes)
+        self._steps = steps
+        self._recorder = recorder
+        self._latency = latency  # Simulated WebDriver round trip in seconds
+        self._position = 0
+        self._lock = threading.Lock()  # Driver calls run in worker threads (asyncio.to_thread)
+
+    def next_step(self):
+        if self._latency:
+            time.sleep(self._latency)
+        with self._lock:
+            if self._position >= len(self._steps):
+                last = self._steps[-1]
+                return {"html": last["html"], "new_rows": [], "expected": []}
+            step = self._steps[self._position]
+            self._position += 1
+            self._recorder.mark_captured(step)
+            return step
+
+    @property
+    def current_url(self):
+        self.round_trips += 1
+        self.url_checks += 1
+        return "https://kick.com/replay"
+
+    def find_element(self, by, selector):
+        self.round_trips += 1
+        return FakeElement(self)
+
+    def execute_script(self, script, *args):
+        self.round_trips += 1
+        if script == kick.CHAT_OBSERVER_INSTALL_SCRIPT:
+            return True
+        if script == kick.CHAT_OBSERVER_DRAIN_SCRIPT:
+            return list(self.next_step()["new_rows"])
+        return None
+
+
+# --- Replay ---
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+async def _push_rows(session, steps, recorder, poll_interval):
+    """Producer for "push" capture: hand each step's new rows to the push endpoint handler."""
+    for step in steps:
+        recorder.mark_captured(step)
+        await kick.ingest_pushed_rows(session, step["new_rows"])
+        await asyncio.sleep(poll_interval)
+
+
+async def replay(steps, capture_mode="snapshot", parser=kick_parser.DEFAULT_PARSER, clients=1,
+                 poll_interval=0.0, driver_latency=0.0, timeout=120.0):
+    """
+    Run the replay steps through poll_messages/stream_messages and the ConnectionManager.
+
+    Args:
+        steps: Output of prepare_steps().
+        capture_mode: "snapshot", "observer" or "push".
+        parser: Chat parser backend name (see api.kick_parser.PARSERS).
+        clients: Number of fake WebSocket clients connected to the manager.
+        poll_interval: Seconds between captures (0 replays as fast as the pipeline allows).
+        driver_latency: Simulated seconds per WebDriver call.
+        timeout: Give up after this many seconds.
+
+    Returns:
+        dict: The measured results.
+    """
+    if capture_mode not in CAPTURE_MODES:
+        raise ValueError(f"Unknown capture mode '{capture_mode}'")
+
+    # Use in-memory settings for the run so the replay never writes the settings file
+    saved_settings = settings._settings_cache
+    replay_settings = copy.deepcopy(settings.DEFAULT_SETTINGS)
+    replay_settings["kick"].update({"capture_mode": capture_mode, "parser": parser})
+    settings._settings_cache = replay_settings
+
+    expected_total = sum(len(step["expected"]) for step in steps)
+    recorder = ReplayRecorder(expected_total)
+    saved_manager = globals.manager
+    globals.manager = ConnectionManager()
+    sockets = [FakeWebSocket(number, recorder if number == 0 else None) for number in range(clients)]
+    for websocket in sockets:
+        await globals.manager.connect(websocket)
+
+    session = kick.new_session("replay", engine="browser")
+    session.driver = driver = FakeChatDriver(steps, recorder, driver_latency)
+    session.active = True
+    config.kick_chat_messages.clear()
+
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    tasks = [asyncio.create_task(kick.stream_messages(session))]
+    if capture_mode == "push":
+        tasks.append(asyncio.create_task(_push_rows(session, steps, recorder, poll_interval)))
+    else:
+        tasks.append(asyncio.create_task(kick.poll_messages(session, poll_interval=poll_interval)))
+
+    timed_out = False
+    try:
+        await asyncio.wait_for(recorder.done.wait(), timeout)
+    except asyncio.TimeoutError:
+        timed_out = True
+    finally:
+        elapsed = time.perf_counter() - wall_start
+        cpu = time.process_time() - cpu_start
+        session.active = False
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await globals.manager.shutdown()
+        globals.manager = saved_manager
+        settings._settings_cache = saved_settings
+
+    delivered = len(recorder.latencies)
+    return {
+        "capture_mode": capture_mode,
+        "parser": parser,
+        "clients": clients,
+        "captures": len(steps),
+        "expected": expected_total,
+        "delivered": delivered,
+        "frames": recorder.frames,
+        "unexpected": recorder.unexpected,
+        "timed_out": timed_out,
+        "seconds": elapsed,
+        "messages_per_second": delivered / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(recorder.latencies, 0.50) * 1000,
+        "p99_ms": percentile(recorder.latencies, 0.99) * 1000,
+        "cpu_us_per_message": cpu * 1e6 / delivered if delivered else 0.0,
+        "driver_round_trips": driver.round_trips,
+        "liveness_probes": driver.url_checks,
+    }
+
+
+def print_report(results):
+    print(f"capture={results['capture_mode']} parser={results['parser']} clients={results['clients']} captures={results['captures']}")
+    print(f"delivered {results['delivered']}/{results['expected']} messages in {results['frames']} frames, {results['seconds']:.2f}s"
+          f" ({results['unexpected']} unexpected{', TIMED OUT' if results['timed_out'] else ''})")
+    print(f"throughput   {results['messages_per_second']:10.1f} msgs/sec")
+    print(f"latency p50  {results['p50_ms']:10.2f} ms")
+    print(f"latency p99  {results['p99_ms']:10.2f} ms")
+    print(f"cpu          {results['cpu_us_per_message']:10.1f} us/msg")
+    print(f"driver calls {results['driver_round_trips']:10d} ({results['liveness_probes']} liveness probes)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--snapshots", help="Directory of recorded #chatroom-messages .html snapshots (default: synthetic chat)")
+    parser.add_argument("--messages", type=int, default=2000, help="Synthetic messages to replay")
+    parser.add_argument("--per-capture", type=int, default=7, help="Synthetic messages arriving between captures")
+    parser.add_argument("--visible-rows", type=int, default=60, help="Rows rendered in each synthetic snapshot")
+    parser.add_argument("--capture-mode", choices=CAPTURE_MODES, default="snapshot")
+    parser.add_argument("--parser", choices=sorted(kick_parser.PARSERS), default=kick_parser.DEFAULT_PARSER)
+    parser.add_argument("--clients", type=int, default=1, help="Fake WebSocket clients connected")
+    parser.add_argument("--poll-interval", type=float, default=0.0, help="Seconds between captures (0 = as fast as possible)")
+    parser.add_argument("--driver-latency", type=float, default=0.0, help="Simulated seconds per WebDriver call")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING, force=True)  # Per-message ingest logging would dominate the measurement
+
+    if args.snapshots:
+        snapshots = load_snapshots(args.snapshots)
+    else:
+        snapshots = synthetic_snapshots(args.messages, args.per_capture, args.visible_rows)
+    if not snapshots:
+        parser.error("No snapshots to replay")
+    results = asyncio.run(replay(
+        prepare_steps(snapshots), args.capture_mode, args.parser, args.clients,
+        args.poll_interval, args.driver_latency, args.timeout,
+    ))
+    print_report(results)
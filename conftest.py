@@ -0,0 +1,36 @@
+"""
+Shared pytest setup: every test runs on default settings held in memory, with
+any save going to a throwaway file, so a test run neither reads the developer's
+chattastic_settings.json nor leaves one behind.
+
+Test modules run directly (python test_*.py) use isolated_settings() the same way.
+"""
+
+import contextlib
+import copy
+import os
+import tempfile
+
+import pytest
+
+from api import settings
+
+
+@contextlib.contextmanager
+def isolated_settings():
+    """Default settings in memory and a temporary settings file for the duration of the block."""
+    saved = settings._settings_cache, settings.get_settings_path
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, settings.SETTINGS_FILE)
+        settings.get_settings_path = lambda: path
+        settings._settings_cache = copy.deepcopy(settings.DEFAULT_SETTINGS)
+        try:
+            yield settings._settings_cache
+        finally:
+            settings._settings_cache, settings.get_settings_path = saved
+
+
+@pytest.fixture(autouse=True)
+def _isolate_settings():
+    with isolated_settings():
+        yield
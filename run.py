@@ -17,6 +17,8 @@ else:
 import uvicorn
 import logging
 
+from api import settings
+
 # Configure Uvicorn's logger to filter out screenshot requests
 class ScreenshotFilter(logging.Filter):
     def filter(self, record):
@@ -32,4 +34,6 @@ class ScreenshotFilter(logging.Filter):
 logging.getLogger("uvicorn.access").addFilter(ScreenshotFilter())
 
 # Run the application
-uvicorn.run("app:app", host="0.0.0.0", port=8000, access_log=True)
+# permessage-deflate is negotiated with browsers that offer it (setting websocket.per_message_deflate)
+uvicorn.run("app:app", host="0.0.0.0", port=8000, access_log=True,
+            ws_per_message_deflate=settings.get_setting("websocket.per_message_deflate", True))
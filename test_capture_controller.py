@@ -0,0 +1,101 @@
+"""
+Checks the adaptive screenshot controller: capture pauses without viewers,
+stretches its interval and then downscales to stay within the CPU budget,
+recovers when there is room again, and boosts while the user interacts.
+
+Run with pytest or directly: python test_capture_controller.py
+"""
+
+from api.capture_controller import SETTLE_CAPTURES, CaptureController
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+def new_controller(clock=None, **options):
+    options = {"cpu_budget": 0.25, "min_interval": 0.2, "max_interval": 5.0, "boost_seconds": 10,
+               "max_downscale": 4, **options}
+    return CaptureController(clock=clock or FakeClock(), **options)
+
+
+def test_pauses_without_viewers():
+    controller = new_controller()
+    assert controller.decide(0, 1.0) == (None, 1)
+    assert controller.stats()["state"] == "paused" and controller.stats()["fps"] == 0.0
+    assert controller.decide(1, 1.0) == (1.0, 1)
+    assert controller.stats()["state"] == "normal"
+    assert new_controller(pause_without_viewers=False).decide(0, 1.0) == (1.0, 1)
+
+
+def test_interval_stretches_to_the_budget():
+    controller = new_controller()
+    controller.record(0.5)  # 0.5 s of CPU per capture needs 2 s between captures at 25%
+    assert controller.decide(1, 1.0) == (2.0, 1)
+    stats = controller.stats()
+    assert stats["state"] == "budget_limited"
+    assert stats["capture_cpu_ms"] == 500.0 and stats["cpu_load"] == 0.25
+
+
+def test_cheap_captures_keep_the_configured_interval():
+    controller = new_controller()
+    controller.record(0.02)
+    assert controller.decide(1, 0.5) == (0.5, 1)
+    assert controller.decide(1, 0.05) == (0.2, 1)  # Never faster than min_interval
+
+
+def test_over_budget_downscales_then_recovers():
+    controller = new_controller()
+    controller.record(2.0)  # Would need 8 s even at full resolution: over max_interval
+    interval, downscale = controller.decide(1, 1.0)
+    assert downscale == 2
+    assert interval == 2.0  # Estimated 0.5 s per capture at a quarter of the pixels
+    # Measurements at the new scale settle (and the average converges) before the next change
+    for _ in range(SETTLE_CAPTURES * 3):
+        controller.record(0.01)
+    assert controller.decide(1, 1.0)[1] == 1  # Full resolution fits in the budget again
+    assert controller.downscale == 1
+
+
+def test_downscale_is_bounded():
+    controller = new_controller(max_downscale=2)
+    controller.record(10.0)
+    controller.decide(1, 1.0)
+    for _ in range(SETTLE_CAPTURES):
+        controller.record(10.0)
+    interval, downscale = controller.decide(1, 1.0)
+    assert downscale == 2 and interval == 5.0  # Capped at max_interval
+
+
+def test_boost_overrides_pause_and_budget_then_expires():
+    clock = FakeClock()
+    controller = new_controller(clock)
+    controller.record(0.5)
+    controller.boost()
+    assert controller.wait(0) is True  # A boost wakes the capture thread
+    assert controller.decide(0, 1.0) == (0.2, 1)
+    assert controller.stats()["state"] == "boost" and controller.stats()["boost_remaining"] == 10.0
+    clock.now += 10
+    assert controller.decide(0, 1.0) == (None, 1)
+    assert controller.stats()["boosts"] == 1
+
+
+def test_invalid_options_fall_back_to_defaults():
+    controller = CaptureController(cpu_budget="lots", min_interval=-1, max_interval=None, max_downscale=0)
+    assert (controller.cpu_budget, controller.min_interval, controller.max_interval, controller.max_downscale) == (
+        0.25, 0.2, 5.0, 4)
+
+
+if __name__ == "__main__":
+    test_pauses_without_viewers()
+    test_interval_stretches_to_the_budget()
+    test_cheap_captures_keep_the_configured_interval()
+    test_over_budget_downscales_then_recovers()
+    test_downscale_is_bounded()
+    test_boost_overrides_pause_and_budget_then_expires()
+    test_invalid_options_fall_back_to_defaults()
+    print("All capture controller checks passed")
@@ -0,0 +1,455 @@
+"""
+Checks that a slow WebSocket client only delays itself, that the slow-consumer
+policies bound its queue and that state snapshots are conflated to the newest value.
+
+Run with pytest or directly: python test_connection_manager.py
+"""
+
+import asyncio
+import json
+
+import msgpack
+
+from utils import connection_manager
+from utils.connection_manager import ConnectionManager, encode_event, event_topic, parse_encoding, parse_topics
+
+
+class RecordingWebSocket:
+    """Fake client that keeps the exact message objects it was sent."""
+
+    def __init__(self, name):
+        self.client = (name, 0)
+        self.sent = []
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, message):
+        self.sent.append(message)
+
+    async def send_bytes(self, frame):
+        self.sent.append(frame)
+
+
+class GatedWebSocket:
+    """Fake client whose sends block until `gate` is set (a stalled browser source)."""
+
+    def __init__(self, name, gate=None):
+        self.client = (name, 0)
+        self.gate = gate
+        self.received = []
+        self.close_code = None
+
+    async def accept(self):
+        pass
+
+    async def close(self, code=1000):
+        self.close_code = code
+
+    async def send_text(self, message):
+        if self.gate:
+            await self.gate.wait()
+        self.received.append(json.loads(message))
+
+
+def new_manager(**options):
+    """A manager configured by arguments only (never reads the settings file); chat batching off."""
+    defaults = {"send_queue_size": 100, "slow_consumer_policy": "drop_oldest", "send_timeout": 5, "chat_batch_window": 0}
+    return ConnectionManager(**{**defaults, **options})
+
+
+def chat(number):
+    return json.dumps({"type": "kick_chat_message", "data": {"user": "viewer", "text": f"message {number}"}})
+
+
+def screenshot(number):
+    return json.dumps({"type": "screenshot_update", "data": {"url": f"/screenshots/{number}.png"}})
+
+
+async def settle(until, timeout=2.0):
+    for _ in range(int(timeout / 0.01)):
+        if until():
+            return
+        await asyncio.sleep(0.01)
+
+
+async def run_slow_and_fast(policy, messages):
+    manager = new_manager(send_queue_size=10, slow_consumer_policy=policy)
+    gate = asyncio.Event()
+    slow, fast = GatedWebSocket("slow", gate), GatedWebSocket("fast")
+    await manager.connect(slow)
+    await manager.connect(fast)
+    try:
+        for message in messages:
+            await manager.broadcast(message)
+            await asyncio.sleep(0.001)  # Paced like real producers, so the fast client keeps up
+        # The fast client gets everything while the slow one is still stuck on its first send
+        await settle(lambda: len(fast.received) == len(messages))
+        stats = {entry["client"]: entry for entry in manager.stats()}
+        gate.set()
+        await settle(lambda: not manager.stats() or all(entry["queue_depth"] == 0 for entry in manager.stats()))
+        await asyncio.sleep(0.05)
+        return slow, fast, stats, list(manager.active_connections)
+    finally:
+        await manager.shutdown()
+
+
+def test_slow_client_does_not_stall_others():
+    slow, fast, stats, connected = asyncio.run(run_slow_and_fast("drop_oldest", [chat(n) for n in range(50)]))
+    assert [msg["data"]["text"] for msg in fast.received] == [f"message {n}" for n in range(50)]
+    slow_stats = stats[str(slow.client)]
+    assert slow_stats["queue_depth"] == 10
+    assert slow_stats["dropped"] == 39  # One message was in flight, ten are queued
+    # The slow client resumes with its first message and the newest ten
+    assert [msg["data"]["text"] for msg in slow.received] == ["message 0"] + [f"message {n}" for n in range(40, 50)]
+    assert connected == [slow, fast]
+
+
+def test_slow_client_gets_only_newest_snapshot():
+    messages = [screenshot(n) for n in range(30)] + [chat(n) for n in range(5)]
+    slow, fast, stats, _ = asyncio.run(run_slow_and_fast("drop_oldest", messages))
+    assert fast.received[-6]["data"]["url"] == "/screenshots/29.png"
+    slow_stats = stats[str(slow.client)]
+    # The stale screenshots collapse into one queued entry, so the queue never overflows
+    assert slow_stats["dropped"] == 0
+    assert slow_stats["coalesced"] > 0
+    assert slow_stats["queue_depth"] == 6
+    assert [msg["data"]["url"] for msg in slow.received if msg["type"] == "screenshot_update"] == [
+        "/screenshots/0.png", "/screenshots/29.png",
+    ]
+    assert [msg["data"]["text"] for msg in slow.received if msg["type"] == "kick_chat_message"] == [f"message {n}" for n in range(5)]
+
+
+async def run_snapshot_burst():
+    manager = new_manager()
+    client = RecordingWebSocket("dashboard")
+    await manager.connect(client)
+    try:
+        # Published back to back, before the broadcast worker gets to run
+        for number in range(50):
+            await manager.publish("docker_containers", {"containers": [], "revision": number})
+        await manager.publish("raffle_entries_cleared", {"message": "Raffle entries cleared"})
+        await settle(lambda: len(client.sent) >= 2)
+        await asyncio.sleep(0.01)
+        stats = {entry["class"]: entry for entry in manager.scheduler_stats()}
+        return [json.loads(message) for message in client.sent], stats["bulk"]["conflated"]
+    finally:
+        await manager.shutdown()
+
+
+def test_snapshot_burst_is_conflated_before_broadcast():
+    received, conflated = asyncio.run(run_snapshot_burst())
+    snapshots = [msg["data"]["revision"] for msg in received if msg["type"] == "docker_containers"]
+    assert snapshots == [49]
+    assert conflated == 49
+    assert [msg["type"] for msg in received].count("raffle_entries_cleared") == 1
+
+
+async def run_threadsafe_publish():
+    manager = new_manager()
+    client = RecordingWebSocket("dashboard")
+    await manager.connect(client)
+    try:
+        def capture_thread():
+            for number in range(3):
+                manager.publish_threadsafe("screenshot_update", {"path": f"/screenshots/{number}.png"}).result(timeout=2)
+
+        await asyncio.to_thread(capture_thread)
+        await settle(lambda: client.sent and json.loads(client.sent[-1])["data"]["path"] == "/screenshots/2.png")
+        return [json.loads(message)["data"]["path"] for message in client.sent]
+    finally:
+        await manager.shutdown()
+
+
+def test_publish_threadsafe_from_another_thread():
+    paths = asyncio.run(run_threadsafe_publish())
+    assert paths[-1] == "/screenshots/2.png"
+    assert paths == sorted(paths)  # Possibly conflated, never out of order
+
+
+def test_disconnect_policy_closes_slow_client():
+    slow, fast, _, connected = asyncio.run(run_slow_and_fast("disconnect", [chat(n) for n in range(20)]))
+    assert len(fast.received) == 20
+    assert connected == [fast]
+    assert slow.close_code == 1013
+
+
+async def run_stalled_client():
+    manager = new_manager(send_queue_size=5, send_timeout=0.05)
+    stalled = GatedWebSocket("stalled", asyncio.Event())  # Never released
+    await manager.connect(stalled)
+    try:
+        for number in range(6):
+            await manager.broadcast(chat(number))
+            await asyncio.sleep(0.001)
+        connected_while_waiting = list(manager.active_connections)
+        await asyncio.sleep(0.1)
+        await manager.broadcast(chat(6))  # Queue full and the send has hung past the timeout
+        await asyncio.sleep(0.01)
+        return connected_while_waiting, list(manager.active_connections), stalled.close_code
+    finally:
+        await manager.shutdown()
+
+
+def test_stalled_send_disconnects_client():
+    connected_while_waiting, connected, close_code = asyncio.run(run_stalled_client())
+    assert len(connected_while_waiting) == 1
+    assert connected == []
+    assert close_code == 1013
+
+
+async def run_personal_and_broadcast_ordering():
+    manager = new_manager()
+    client = GatedWebSocket("client")
+    await manager.connect(client)
+    try:
+        await manager.send_personal_message(json.dumps({"type": "initial_status", "data": {}}), client)
+        await manager.broadcast(json.dumps({"type": "settings_updated", "data": {}}))
+        await settle(lambda: len(client.received) == 2)
+        return [msg["type"] for msg in client.received]
+    finally:
+        await manager.shutdown()
+
+
+def test_personal_messages_share_the_client_queue():
+    assert asyncio.run(run_personal_and_broadcast_ordering()) == ["initial_status", "settings_updated"]
+
+
+async def run_publish(clients):
+    manager = new_manager()
+    sockets = [RecordingWebSocket(f"client{number}") for number in range(clients)]
+    for websocket in sockets:
+        await manager.connect(websocket)
+    try:
+        await manager.publish("kick_chat_message", {"channel": "alpha", "user": "viewer", "text": "hi"})
+        await manager.publish("screenshot_update", {"path": "static/screenshots/desktop_view.png"})
+        await manager.publish("raffle_entries_cleared", {"message": "Raffle entries cleared"})
+        await settle(lambda: all(len(websocket.sent) == 3 for websocket in sockets))
+        return sockets
+    finally:
+        await manager.shutdown()
+
+
+def test_publish_encodes_once_without_parsing():
+    def refuse_to_parse(message):
+        raise AssertionError("publish() must route on the event type without parsing")
+
+    saved = connection_manager._message_type
+    connection_manager._message_type = refuse_to_parse
+    try:
+        sockets = asyncio.run(run_publish(3))
+    finally:
+        connection_manager._message_type = saved
+
+    first = sockets[0].sent
+    assert sorted(json.loads(message)["type"] for message in first) == ["kick_chat_message", "raffle_entries_cleared", "screenshot_update"]
+    for websocket in sockets[1:]:
+        # Every client is handed the very same encoded string
+        assert all(any(message is other for other in first) for message in websocket.sent)
+
+
+def test_encode_event_matches_json():
+    payload = {"user": "viewer", "emotes": [{"name": "KEKW", "id": "37226"}], "text": "caf\u00e9 [emote:KEKW|37226]", "count": 2**70}
+    assert json.loads(encode_event("kick_chat_message", payload)) == {"type": "kick_chat_message", "data": payload}
+
+
+async def run_topics():
+    manager = new_manager()
+    dashboard, overlay, late = RecordingWebSocket("dashboard"), RecordingWebSocket("overlay"), RecordingWebSocket("late")
+    await manager.connect(dashboard)
+    await manager.connect(overlay, topics=parse_topics("chat,overlay"))
+    await manager.connect(late, topics=parse_topics(["docker"]))
+    try:
+        await manager.publish("screenshot_update", {"path": "desktop_view.png"})
+        await manager.publish("docker_containers", {"containers": []})
+        await manager.publish("kick_chat_message", {"user": "viewer", "text": "hi"})
+        await manager.publish("kick_overlay_command", {"action": "clear"})
+        await manager.broadcast(json.dumps({"type": "settings_updated", "data": {}}))
+        await settle(lambda: len(dashboard.sent) == 5)
+        assert manager.set_topics(late, parse_topics("chat"))
+        await manager.publish("docker_containers", {"containers": []})
+        await manager.publish("kick_chat_message", {"user": "viewer", "text": "again"})
+        await settle(lambda: len(dashboard.sent) == 7)
+        await asyncio.sleep(0.01)
+        wants = (manager.wants(overlay, "initial_status"), manager.wants(dashboard, "initial_status"),
+                 manager.subscriber_count("screenshot"), manager.subscriber_count("chat"))
+        return [[json.loads(message)["type"] for message in websocket.sent] for websocket in (dashboard, overlay, late)], wants
+    finally:
+        await manager.shutdown()
+
+
+def test_topics_limit_what_clients_receive():
+    (dashboard, overlay, late), wants = asyncio.run(run_topics())
+    assert sorted(dashboard) == sorted([
+        "screenshot_update", "docker_containers", "kick_chat_message", "kick_overlay_command",
+        "settings_updated", "docker_containers", "kick_chat_message",
+    ])
+    # Chat goes through its broadcast worker, so it may arrive after a directly sent event
+    assert sorted(overlay) == ["kick_chat_message", "kick_chat_message", "kick_overlay_command"]
+    assert sorted(late) == ["docker_containers", "kick_chat_message"]
+    assert wants == (False, True, 1, 3)  # Screenshot viewers: only the dashboard (every topic)
+
+
+def test_parse_topics():
+    assert parse_topics("chat, Overlay") == {"chat", "overlay"}
+    assert parse_topics("*") is None
+    assert parse_topics("chat,*") is None
+    assert parse_topics("nonsense") is None  # A typo falls back to everything rather than nothing
+    assert parse_topics(None) is None
+    assert event_topic("desktop_view_update") == "screenshot"
+    assert event_topic("something_new") == "status"
+
+
+async def run_chat_burst(count, pause_after=None):
+    manager = new_manager(chat_batch_window=0.05, chat_batch_max=40)
+    client = RecordingWebSocket("overlay")
+    await manager.connect(client)
+    try:
+        if pause_after is not None:
+            await manager.broadcast(chat("quiet"))
+            await asyncio.sleep(pause_after)
+        for number in range(count):
+            await manager.broadcast(chat(number))
+        await settle(lambda: manager.chat_messages == count + (pause_after is not None))
+        await asyncio.sleep(0.01)
+        return [json.loads(message) for message in client.sent], manager
+    finally:
+        await manager.shutdown()
+
+
+async def run_encodings():
+    manager = new_manager(chat_batch_window=0.05)
+    text_client, binary_client, other_binary = RecordingWebSocket("json"), RecordingWebSocket("msgpack"), RecordingWebSocket("msgpack2")
+    await manager.connect(text_client)
+    await manager.connect(binary_client, encoding="msgpack")
+    await manager.connect(other_binary, encoding="msgpack")
+    try:
+        for number in range(5):
+            await manager.publish("kick_chat_message", {"user": "viewer", "text": f"message {number}", "emotes": []})
+        await manager.publish("settings_updated", {"ui": {"dark_mode": True}})
+        await settle(lambda: manager.chat_messages == 5 and len(binary_client.sent) == len(text_client.sent) >= 2)
+        await asyncio.sleep(0.01)
+        return text_client.sent, binary_client.sent, other_binary.sent
+    finally:
+        await manager.shutdown()
+
+
+def test_msgpack_clients_get_binary_frames():
+    def refuse_to_parse(text):
+        raise AssertionError("MessagePack frames must be packed from the event, not parsed back from JSON")
+
+    saved = connection_manager.EncodedEvent.from_json
+    connection_manager.EncodedEvent.from_json = staticmethod(refuse_to_parse)
+    try:
+        text_frames, binary_frames, other_binary = asyncio.run(run_encodings())
+    finally:
+        connection_manager.EncodedEvent.from_json = saved
+    assert all(isinstance(frame, str) for frame in text_frames)
+    assert all(isinstance(frame, bytes) for frame in binary_frames)
+    # Same events, smaller frames; converted once and shared by every MessagePack client
+    assert sorted(map(json.loads, text_frames), key=str) == sorted(map(msgpack.unpackb, binary_frames), key=str)
+    assert sum(map(len, binary_frames)) < sum(len(frame.encode()) for frame in text_frames)
+    assert all(any(frame is other for other in binary_frames) for frame in other_binary)
+
+
+def test_parse_encoding():
+    assert parse_encoding("MsgPack") == "msgpack"
+    assert parse_encoding(None) == "json"
+    assert parse_encoding("cbor") == "json"
+
+
+def test_packed_frames_match_the_json():
+    events = [encode_event("kick_chat_message", {"text": f"message {number}"}, number) for number in range(20)]
+    for members in (events[:3], events):  # fixarray and array 16 headers
+        batch, msg_type = connection_manager.ConnectionManager._chat_frame([(event, "kick_chat_message") for event in members])
+        assert msg_type == "kick_chat_batch"
+        assert msgpack.unpackb(batch.packed()) == json.loads(batch)
+    assert encode_event("info", {"count": 2**70}).packed() is None  # Too large for MessagePack: sent as text
+    relayed = connection_manager.EncodedEvent.from_json('{"type":"info","data":{"text":"hi"}}')
+    assert msgpack.unpackb(relayed.packed()) == {"type": "info", "data": {"text": "hi"}}
+    assert connection_manager.EncodedEvent.from_json("not json") is None
+
+
+def test_chat_burst_is_sent_in_batches():
+    frames, manager = asyncio.run(run_chat_burst(100))
+    texts = []
+    for frame in frames:
+        if frame["type"] == "kick_chat_batch":
+            assert len(frame["data"]["messages"]) <= 40
+            texts.extend(event["data"]["text"] for event in frame["data"]["messages"])
+        else:
+            texts.append(frame["data"]["text"])
+    assert texts == [f"message {n}" for n in range(100)]  # Order is kept across frames
+    assert len(frames) <= 5
+    assert manager.chat_frames == len(frames)
+
+
+def test_lone_chat_message_is_not_delayed():
+    # After a quiet period the first message goes out by itself, without waiting for the window
+    frames, _ = asyncio.run(run_chat_burst(3, pause_after=0.2))
+    assert frames[0] == {"type": "kick_chat_message", "seq": 1, "data": {"user": "viewer", "text": "message quiet"}}
+    assert frames[1]["type"] in ("kick_chat_message", "kick_chat_batch")
+
+
+async def run_resume(resume_points):
+    manager = new_manager(replay_buffer_size=5, chat_batch_max=3)
+    for number in range(1, 9):
+        await manager.publish("kick_chat_message", {"user": "viewer", "text": f"message {number}"})
+    await settle(lambda: manager.chat_messages == 8)
+    clients = []
+    try:
+        for resume_from in resume_points:
+            client = RecordingWebSocket(f"resume{resume_from}")
+            await manager.connect(client, topics=parse_topics("chat"), resume_from=resume_from)
+            clients.append(client)
+        await manager.publish("kick_chat_message", {"user": "viewer", "text": "message 9"})
+        await settle(lambda: all(len(client.sent) >= 2 for client in clients) and manager.chat_messages == 9)
+        await asyncio.sleep(0.01)
+        results = []
+        for client in clients:
+            frames = [json.loads(message) for message in client.sent]
+            events = []
+            for frame in frames[1:]:
+                events.extend(frame["data"]["messages"] if frame["type"] == "kick_chat_batch" else [frame])
+            results.append((frames[0], [event["seq"] for event in events], len(frames) - 1))
+        return results
+    finally:
+        await manager.shutdown()
+
+
+def test_reconnecting_client_resumes_missed_chat():
+    # Seqs 1-8 were broadcast; the buffer keeps the newest five (4-8)
+    (recent, recent_seqs, _), (old, old_seqs, old_frames), (restart, restart_seqs, _) = asyncio.run(run_resume([6, 2, 100]))
+    assert recent["type"] == "chat_resume"
+    assert recent["data"] == {"resume_from": 6, "replayed": 2, "last_seq": 8, "complete": True}
+    assert recent_seqs == [7, 8, 9]  # The missed events, then live chat
+    assert (old["data"]["replayed"], old["data"]["complete"]) == (5, False)  # Seq 3 fell out of the buffer
+    assert old_seqs == [4, 5, 6, 7, 8, 9]
+    assert old_frames == 3  # Replayed in chat_batch_max-sized frames, then message 9
+    # A seq from before a server restart replays everything buffered
+    assert (restart["data"]["resume_from"], restart["data"]["complete"]) == (0, False)
+    assert restart_seqs == [4, 5, 6, 7, 8, 9]
+
+
+if __name__ == "__main__":
+    from conftest import isolated_settings
+
+    with isolated_settings():  # As under pytest (conftest.py)
+        test_slow_client_does_not_stall_others()
+        test_slow_client_gets_only_newest_snapshot()
+        test_snapshot_burst_is_conflated_before_broadcast()
+        test_publish_threadsafe_from_another_thread()
+        test_disconnect_policy_closes_slow_client()
+        test_stalled_send_disconnects_client()
+        test_personal_messages_share_the_client_queue()
+        test_publish_encodes_once_without_parsing()
+        test_encode_event_matches_json()
+        test_topics_limit_what_clients_receive()
+        test_parse_topics()
+        test_msgpack_clients_get_binary_frames()
+        test_parse_encoding()
+        test_packed_frames_match_the_json()
+        test_chat_burst_is_sent_in_batches()
+        test_lone_chat_message_is_not_delayed()
+        test_reconnecting_client_resumes_missed_chat()
+        print("All connection manager checks passed")
@@ -21,6 +21,9 @@ class DummyManager:
     async def broadcast(self, msg):
         print(f"BROADCAST: {msg}")
 
+    async def publish(self, event_type, payload):
+        print(f"PUBLISH {event_type}: {payload}")
+
 # Import globals and set the manager
 import globals
 globals.manager = DummyManager()
@@ -0,0 +1,187 @@
+"""
+Runs two ConnectionManagers (standing in for two app workers) on one event relay
+and checks that an event published by either reaches the clients of both.
+
+Run with pytest or directly: python test_event_bus.py
+"""
+
+import asyncio
+import errno
+import json
+import os
+import socket
+import tempfile
+
+from utils.connection_manager import ConnectionManager
+from utils.event_bus import EventRelay, LocalEventBus, RelayEventBus, decode_frame, encode_frame, parse_address
+
+
+class RecordingWebSocket:
+    def __init__(self, name):
+        self.client = (name, 0)
+        self.sent = []
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, message):
+        self.sent.append(json.loads(message))
+
+
+def new_manager(bus):
+    """A manager configured by arguments only (never reads the settings file)."""
+    return ConnectionManager(send_queue_size=100, slow_consumer_policy="drop_oldest", send_timeout=5,
+                             chat_batch_window=0, replay_buffer_size=50, event_bus=bus)
+
+
+async def settle(until, timeout=2.0):
+    for _ in range(int(timeout / 0.01)):
+        if until():
+            return
+        await asyncio.sleep(0.01)
+
+
+async def run_two_workers(address):
+    relay = await EventRelay(address).start()
+    # The ingest hosts the relay in production: it is the one process publishing chat
+    ingest, web = new_manager(RelayEventBus(address, publishes_chat=True)), new_manager(RelayEventBus(address))
+    dashboard, overlay = RecordingWebSocket("dashboard"), RecordingWebSocket("overlay")
+    try:
+        await ingest.connect(dashboard)
+        await web.connect(overlay)
+        await settle(lambda: ingest._bus.connected and web._bus.connected)
+        for number in range(1, 4):
+            await ingest.publish("kick_chat_message", {"user": "viewer", "text": f"message {number}"})
+        await web.publish("kick_overlay_command", {"command": "clear"})
+        # Chat from a worker that does not publish chat is dropped, so its seq cannot collide with the ingest's
+        await web.publish("kick_chat_message", {"user": "viewer", "text": "from the wrong worker"})
+        assert (web.publishes_chat, web.refused_chat) == (False, 1)
+        await settle(lambda: len(dashboard.sent) == 4 and len(overlay.sent) == 4)
+
+        # A local event (about this worker's own state) reaches this worker's clients only
+        await asyncio.to_thread(
+            lambda: web.publish_threadsafe("screenshot_update", {"seq": 1}, local=True).result(timeout=2))
+        await settle(lambda: len(overlay.sent) == 5)
+
+        # A client reconnecting to the other worker resumes with the ingest's seqs
+        late = RecordingWebSocket("late")
+        await web.connect(late, resume_from=1)
+        await settle(lambda: len(late.sent) == 2)
+        return dashboard.sent, overlay.sent, late.sent, web.last_seq, relay.stats(), ingest.bus_stats()
+    finally:
+        await ingest.shutdown()
+        await web.shutdown()
+        await relay.close()
+
+
+def test_events_reach_clients_of_every_worker():
+    with tempfile.TemporaryDirectory() as directory:
+        address = f"unix:{os.path.join(directory, 'events.sock')}"
+        dashboard, overlay, late, web_seq, relay_stats, ingest_stats = asyncio.run(run_two_workers(address))
+        assert not os.path.exists(address[len("unix:"):])  # Removed when the relay closes
+
+    assert overlay.pop()["type"] == "screenshot_update"
+    for received in (dashboard, overlay):
+        assert sorted(event["type"] for event in received) == ["kick_chat_message"] * 3 + ["kick_overlay_command"]
+        assert [event["seq"] for event in received if event["type"] == "kick_chat_message"] == [1, 2, 3]
+    assert web_seq == 3
+    assert late[0]["type"] == "chat_resume" and late[0]["data"]["replayed"] == 2
+    assert [event["seq"] for event in late[1]["data"]["messages"]] == [2, 3]
+    assert relay_stats["forwarded"] == 4
+    assert (ingest_stats["published"], ingest_stats["received"], ingest_stats["local_fallbacks"]) == (3, 4, 0)
+
+
+async def run_unreachable_relay(address):
+    bus = RelayEventBus(address)
+    manager = new_manager(bus)
+    client = RecordingWebSocket("dashboard")
+    await manager.connect(client)
+    try:
+        await manager.publish("raffle_entries_cleared", {"message": "Raffle entries cleared"})
+        await settle(lambda: len(client.sent) == 1)
+        return client.sent, bus.stats()
+    finally:
+        await manager.shutdown()
+
+
+def test_unreachable_relay_falls_back_to_local_delivery():
+    with tempfile.TemporaryDirectory() as directory:
+        sent, stats = asyncio.run(run_unreachable_relay(f"unix:{os.path.join(directory, 'missing.sock')}"))
+    assert [event["type"] for event in sent] == ["raffle_entries_cleared"]
+    assert (stats["connected"], stats["local_fallbacks"]) == (False, 1)
+
+
+async def run_second_relay(path):
+    # A socket file nobody listens on, as a crashed relay leaves behind
+    stale = socket.socket(socket.AF_UNIX)
+    stale.bind(path)
+    stale.close()
+    relay = await EventRelay(f"unix:{path}").start()
+    try:
+        await EventRelay(f"unix:{path}").start()
+    except OSError as e:
+        second_error = e.errno
+    else:
+        second_error = None
+    try:
+        # The first relay still owns the socket
+        _, writer = await asyncio.open_unix_connection(path)
+        await settle(lambda: relay.stats()["peers"] == 1)
+        writer.close()
+        return second_error, relay.stats()["peers"]
+    finally:
+        await relay.close()
+
+
+def test_only_one_relay_hosts_an_address():
+    with tempfile.TemporaryDirectory() as directory:
+        second_error, peers = asyncio.run(run_second_relay(os.path.join(directory, "bus.sock")))
+    assert second_error == errno.EADDRINUSE
+    assert peers == 1
+
+
+async def run_local_bus():
+    manager = new_manager(LocalEventBus())
+    client = RecordingWebSocket("dashboard")
+    await manager.connect(client)
+    try:
+        await manager.publish("kick_chat_message", {"user": "viewer", "text": "hi"})
+        await settle(lambda: len(client.sent) == 1)
+        return client.sent, manager.bus_stats()
+    finally:
+        await manager.shutdown()
+
+
+def test_local_bus_delivers_in_process():
+    sent, stats = asyncio.run(run_local_bus())
+    assert sent == [{"type": "kick_chat_message", "seq": 1, "data": {"user": "viewer", "text": "hi"}}]
+    assert stats == {"backend": "local"}
+
+
+def test_frames_and_addresses():
+    line = encode_frame('{"type":\n"info",\t"data":{"text":"a\\nb"}}', "info")
+    assert line.count(b"\n") == 1
+    message, msg_type, seq = decode_frame(line)
+    assert json.loads(message) == {"type": "info", "data": {"text": "a\nb"}}
+    assert (msg_type, seq) == ("info", None)
+    assert decode_frame(encode_frame("{}", "kick_chat_message", 42))[1:] == ("kick_chat_message", 42)
+    assert parse_address("unix:/tmp/bus.sock") == ("unix", "/tmp/bus.sock")
+    assert parse_address("tcp://10.0.0.5:7000") == ("tcp", ("10.0.0.5", 7000))
+    try:
+        parse_address("redis://localhost")
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("Unsupported addresses must be rejected")
+
+
+if __name__ == "__main__":
+    from conftest import isolated_settings
+
+    with isolated_settings():  # As under pytest (conftest.py)
+        test_events_reach_clients_of_every_worker()
+        test_unreachable_relay_falls_back_to_local_delivery()
+        test_only_one_relay_hosts_an_address()
+        test_local_bus_delivers_in_process()
+        test_frames_and_addresses()
+        print("All event bus checks passed")
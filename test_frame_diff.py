@@ -0,0 +1,67 @@
+"""
+Checks desktop change detection: identical frames are reported unchanged and
+a change is located by the bounding box of the tiles it touches.
+
+Run with pytest or directly: python test_frame_diff.py
+"""
+
+import numpy as np
+
+from api.frame_diff import FrameDiffer
+
+
+def desktop(width=100, height=70):
+    rgb = np.zeros((height, width, 3), dtype=np.uint8)
+    rgb[:, :] = (40, 40, 48)
+    return rgb
+
+
+def test_first_frame_is_entirely_changed():
+    change = FrameDiffer(tile_size=32).diff(desktop())
+    assert change.region == (0, 0, 100, 70)
+    assert change.changed_tiles == change.total_tiles == 4 * 3
+
+
+def test_identical_frames_are_unchanged():
+    differ = FrameDiffer(tile_size=32)
+    differ.diff(desktop())
+    change = differ.diff(desktop())
+    assert change.region is None and change.changed_tiles == 0
+    assert differ.unchanged == 1
+    assert change.as_dict()["width"] == 0
+
+
+def test_changed_region_covers_touched_tiles():
+    differ = FrameDiffer(tile_size=32)
+    differ.diff(desktop())
+    frame = desktop()
+    frame[40, 70] = (255, 255, 255)  # Tile (row 1, column 2)
+    frame[41, 33, 2] = 0  # One channel of one pixel in tile (row 1, column 1)
+    change = differ.diff(frame)
+    assert change.region == (32, 32, 64, 32)
+    assert change.changed_tiles == 2
+
+
+def test_region_is_clipped_to_partial_edge_tiles():
+    differ = FrameDiffer(tile_size=32)
+    differ.diff(desktop())
+    frame = desktop()
+    frame[69, 99] = (0, 0, 0)  # Bottom-right corner, in a partial tile
+    assert differ.diff(frame).region == (96, 64, 4, 6)
+
+
+def test_size_change_and_reset_count_as_full_frames():
+    differ = FrameDiffer(tile_size=16)
+    differ.diff(desktop())
+    assert differ.diff(desktop(width=50)).region == (0, 0, 50, 70)
+    differ.reset()
+    assert differ.diff(desktop(width=50)).region == (0, 0, 50, 70)
+
+
+if __name__ == "__main__":
+    test_first_frame_is_entirely_changed()
+    test_identical_frames_are_unchanged()
+    test_changed_region_covers_touched_tiles()
+    test_region_is_clipped_to_partial_edge_tiles()
+    test_size_change_and_reset_count_as_full_frames()
+    print("All frame diff checks passed")
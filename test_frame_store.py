@@ -0,0 +1,71 @@
+"""
+Checks the in-memory screenshot store: frames are numbered, recent ones stay
+addressable by seq, identical frames share an ETag and If-None-Match matching
+follows HTTP's rules.
+
+Run with pytest or directly: python test_frame_store.py
+"""
+
+import threading
+
+from api.frame_store import FrameStore, etag_matches
+
+
+def test_frames_are_numbered_and_ring_is_bounded():
+    store = FrameStore(history=3, instance="w1")
+    assert store.latest() is None and store.get(1) is None
+    frames = [store.publish(f"frame {number}".encode()) for number in range(1, 6)]
+    assert [frame.seq for frame in frames] == [1, 2, 3, 4, 5]
+    assert store.latest() is frames[-1]
+    assert store.get(4).data == b"frame 4"
+    assert store.get(2) is None  # Left the ring
+    assert store.get(6) is None
+    assert store.stats() == {"instance": "w1", "last_seq": 5, "frames": 3, "bytes": 21}
+
+
+def test_seqs_belong_to_their_store():
+    # Two worker processes each number their own frames from 1
+    first, second = FrameStore(), FrameStore()
+    assert first.instance != second.instance
+    first.publish(b"desktop on worker 1")
+    assert first.get(1, first.instance).data == b"desktop on worker 1"
+    assert first.get(1, second.instance) is None
+    assert first.get(1) is not None  # No instance given: plain seq lookup
+
+
+def test_identical_frames_share_an_etag():
+    store = FrameStore()
+    first, same, changed = store.publish(b"desktop"), store.publish(b"desktop"), store.publish(b"desktop 2")
+    assert first.etag == same.etag != changed.etag
+    assert first.seq != same.seq
+    assert first.etag.startswith('"') and first.etag.endswith('"')
+
+
+def test_if_none_match():
+    etag = '"abc"'
+    assert etag_matches('"abc"', etag)
+    assert etag_matches('"old", W/"abc"', etag)
+    assert etag_matches("*", etag)
+    assert not etag_matches('"abcd"', etag)
+    assert not etag_matches(None, etag)
+    assert not etag_matches("", etag)
+
+
+def test_concurrent_publishers_get_distinct_seqs():
+    store = FrameStore(history=1000)
+    threads = [threading.Thread(target=lambda: [store.publish(b"x") for _ in range(100)]) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert store.last_seq == 400
+    assert [store.get(seq).seq for seq in range(1, 401)] == list(range(1, 401))
+
+
+if __name__ == "__main__":
+    test_frames_are_numbered_and_ring_is_bounded()
+    test_seqs_belong_to_their_store()
+    test_identical_frames_share_an_etag()
+    test_if_none_match()
+    test_concurrent_publishers_get_distinct_seqs()
+    print("All frame store checks passed")
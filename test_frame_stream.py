@@ -0,0 +1,83 @@
+"""
+Checks the live desktop stream: frames published by the capture loop arrive as
+multipart parts, a client's frame-rate cap collapses bursts into the newest
+frame, and an idle stream re-sends the current frame.
+
+Run with pytest or directly: python test_frame_stream.py
+"""
+
+import asyncio
+import threading
+
+from api import frame_stream
+from api.frame_store import FrameStore
+from api.frame_stream import MULTIPART_BOUNDARY, multipart_part, parse_fps, stream_frames
+
+
+def parse_part(chunk):
+    """(headers, body) of one multipart part as yielded by stream_frames."""
+    head, body = chunk.split(b"\r\n\r\n", 1)
+    assert body.endswith(f"\r\n--{MULTIPART_BOUNDARY}\r\n".encode())
+    headers = dict(line.split(": ", 1) for line in head.decode().split("\r\n"))
+    return headers, body[:-len(f"\r\n--{MULTIPART_BOUNDARY}\r\n")]
+
+
+async def run_stream(fps):
+    store = FrameStore()
+    store.publish(b"frame 1")
+    stream = stream_frames(store, fps=fps, resend_interval=5)
+    try:
+        opening = await anext(stream)
+        first = await anext(stream)
+        clients = frame_stream.stream_clients
+        # A thread (like the capture loop) publishes a burst while the client is capped
+        publisher = threading.Thread(target=lambda: [store.publish(f"frame {n}".encode()) for n in (2, 3, 4)])
+        publisher.start()
+        publisher.join()
+        second = await asyncio.wait_for(anext(stream), 2)
+        store.publish(b"frame 5")
+        third = await asyncio.wait_for(anext(stream), 2)
+        return opening, [parse_part(part) for part in (first, second, third)], clients
+    finally:
+        await stream.aclose()
+
+
+def test_stream_sends_newest_frames_within_the_cap():
+    opening, parts, clients = asyncio.run(run_stream(fps=20))
+    assert opening == f"--{MULTIPART_BOUNDARY}\r\n".encode()
+    assert [body for _, body in parts] == [b"frame 1", b"frame 4", b"frame 5"]  # 2 and 3 collapsed
+    headers = parts[0][0]
+    assert headers["Content-Type"] == "image/png" and headers["Content-Length"] == "7"
+    assert headers["X-Frame-Seq"] == "1"
+    assert clients == 1 and frame_stream.stream_clients == 0
+
+
+async def run_idle_stream():
+    store = FrameStore()
+    store.publish(b"still desktop")
+    stream = stream_frames(store, fps=100, resend_interval=0.05)
+    try:
+        return [await asyncio.wait_for(anext(stream), 2) for _ in range(3)][1:]
+    finally:
+        await stream.aclose()
+
+
+def test_idle_stream_resends_current_frame():
+    first, resent = asyncio.run(run_idle_stream())
+    assert first == resent == multipart_part(FrameStore().publish(b"still desktop"))
+
+
+def test_fps_parsing():
+    assert parse_fps("5", 10) == 5.0
+    assert parse_fps("60", 10) == 10.0
+    assert parse_fps(None, 10) == 10.0
+    assert parse_fps("0", 10) == 10.0
+    assert parse_fps("fast", 10) == 10.0
+    assert parse_fps(2, "lots") == 2.0
+
+
+if __name__ == "__main__":
+    test_stream_sends_newest_frames_within_the_cap()
+    test_idle_stream_resends_current_frame()
+    test_fps_parsing()
+    print("All frame stream checks passed")
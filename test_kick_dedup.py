@@ -0,0 +1,152 @@
+"""
+Checks the bounded dedup cache and replays Kick's data-index wraparound through the dedup stage.
+
+Run with pytest or directly: python test_kick_dedup.py
+"""
+
+from api import kick, kick_parser
+from api.kick_session import DEDUP_SEQUENCE_WINDOW, KickChannelSession
+from benchmarks.kick_fixtures import MAX_KICK_INDEX, build_chat_container
+from utils.dedup import BoundedDedupCache
+
+VISIBLE_ROWS = 60  # Rows Kick keeps rendered in #chatroom-messages
+NEW_ROWS_PER_POLL = 7  # Messages arriving between two captures
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def new_session(max_ids=kick.MAX_PROCESSED_IDS, window=kick.DEFAULT_DEDUP_WINDOW):
+    clock = FakeClock()
+    session = KickChannelSession("replay", max_ids=max_ids)
+    session.dedup = BoundedDedupCache(max_ids, window=window, clock=clock, sequence_window=DEDUP_SEQUENCE_WINDOW)
+    return session, clock
+
+
+def replay(session, first_sequence, last_sequence, unique=True, clock=None, seconds_per_poll=1.0):
+    """Scroll a window of VISIBLE_ROWS rows over the sequence range and return the emitted contents."""
+    emitted = []
+    newest = first_sequence + VISIBLE_ROWS
+    while newest <= last_sequence:
+        html = build_chat_container(VISIBLE_ROWS, newest - VISIBLE_ROWS, unique=unique)
+        emitted.extend(msg["content"] for msg in kick._select_new_messages(session, kick_parser.parse_chat_rows_lxml(html)))
+        newest += NEW_ROWS_PER_POLL
+        if clock:
+            clock.now += seconds_per_poll
+    return emitted, newest - NEW_ROWS_PER_POLL
+
+
+def expected_contents(first_sequence, last_sequence, unique=True):
+    html = build_chat_container(last_sequence - first_sequence, first_sequence, unique=unique)
+    return [msg["content"] for msg in kick_parser.parse_chat_rows_lxml(html)]
+
+
+def test_cache_evicts_oldest_first():
+    cache = BoundedDedupCache(3)
+    assert [cache.add(key) for key in "abc"] == [True, True, True]
+    assert cache.add("a") is False  # Duplicate refreshes "a", so "b" is now the oldest
+    assert cache.add("d") is True
+    assert "b" not in cache
+    assert all(key in cache for key in "acd")
+    stats = cache.stats()
+    assert (stats["size"], stats["hits"], stats["misses"], stats["evictions"]) == (3, 1, 4, 1)
+
+
+def test_cache_window_forgets_unseen_keys():
+    clock = FakeClock()
+    cache = BoundedDedupCache(10, window=30, clock=clock)
+    cache.add("old")
+    cache.add("seen-again")
+    clock.now = 20
+    assert cache.add("seen-again") is False  # Refreshes its window
+    clock.now = 45
+    assert "old" not in cache
+    assert cache.add("seen-again") is False
+    assert cache.add("old") is True
+    assert cache.expirations == 1
+
+
+def test_cache_values_update_in_place():
+    cache = BoundedDedupCache(2)
+    cache[MAX_KICK_INDEX] = "10:53 PM"
+    cache[0] = "10:54 PM"
+    cache[MAX_KICK_INDEX] = "10:55 PM"  # Refreshes the key, so index 0 is evicted next
+    cache[1] = "10:55 PM"
+    assert cache.get(MAX_KICK_INDEX) == "10:55 PM"
+    assert cache.get(0) is None
+    assert len(cache) == 2
+
+
+def test_replay_across_index_wraparound():
+    session, _ = new_session()
+    emitted, last = replay(session, MAX_KICK_INDEX - 49, MAX_KICK_INDEX + 200)
+    assert emitted == expected_contents(MAX_KICK_INDEX - 49, last)
+    assert session.dedup.hits > 0
+
+
+def test_replay_with_small_cache_never_reemits_visible_rows():
+    # A cache only slightly larger than the visible window evicts constantly; because
+    # eviction is oldest-first, rows still on screen are never forgotten and re-emitted.
+    session, _ = new_session(max_ids=VISIBLE_ROWS + NEW_ROWS_PER_POLL)
+    emitted, last = replay(session, MAX_KICK_INDEX - 49, MAX_KICK_INDEX + 250)
+    assert emitted == expected_contents(MAX_KICK_INDEX - 49, last)
+    assert session.dedup.evictions > 0
+
+
+def test_replay_many_wraps_emits_each_message_once():
+    session, clock = new_session()
+    emitted, last = replay(session, 0, 5 * (MAX_KICK_INDEX + 1), clock=clock)
+    assert emitted == expected_contents(0, last)
+
+
+def test_identical_spam_from_same_user_is_kept():
+    # Without unique suffixes the fixture repeats the same 8 messages, so the same user
+    # posts identical text over and over, at different indexes and (every 600
+    # messages) at the very index an identical copy occupied before the wrap.
+    # At one poll per second the copy comes back after about 86 s, well inside the
+    # 120 s time window: only the sequence window tells it apart from a visible row.
+    session, clock = new_session()
+    emitted, last = replay(session, 0, 4 * (MAX_KICK_INDEX + 1), unique=False, clock=clock)
+    assert clock.now < kick.DEFAULT_DEDUP_WINDOW * 2
+    assert emitted == expected_contents(0, last, unique=False)
+    assert session.dedup.reappeared > 0
+
+
+def test_cache_sequence_window():
+    cache = BoundedDedupCache(100, sequence_window=3)
+    cache.add("spam")
+    assert [cache.add(key) for key in ("a", "b", "spam", "c", "d", "e")] == [True, True, False, True, True, True]
+    assert cache.add("spam") is False  # Seen 3 new keys ago: still within the window
+    for key in "fghi":
+        cache.add(key)
+    assert cache.add("spam") is True  # 4 new keys since: a new occurrence
+    assert cache.reappeared == 1
+
+
+def test_idle_visible_rows_are_not_reemitted():
+    # A quiet chat: the same rows stay on screen for far longer than the window,
+    # but each snapshot sighting refreshes them.
+    session, clock = new_session(window=5)
+    html = build_chat_container(VISIBLE_ROWS, MAX_KICK_INDEX - 20, unique=True)
+    assert len(kick._select_new_messages(session, kick_parser.parse_chat_rows_lxml(html))) == VISIBLE_ROWS
+    for _ in range(100):
+        clock.now += 1
+        assert kick._select_new_messages(session, kick_parser.parse_chat_rows_lxml(html)) == []
+
+
+if __name__ == "__main__":
+    test_cache_evicts_oldest_first()
+    test_cache_values_update_in_place()
+    test_cache_window_forgets_unseen_keys()
+    test_cache_sequence_window()
+    test_replay_across_index_wraparound()
+    test_replay_with_small_cache_never_reemits_visible_rows()
+    test_replay_many_wraps_emits_each_message_once()
+    test_identical_spam_from_same_user_is_kept()
+    test_idle_visible_rows_are_not_reemitted()
+    print("All Kick dedup checks passed")
@@ -47,6 +47,9 @@ if __name__ == "__main__":
     class DummyManager:
         async def broadcast(self, msg): 
             print(f"BROADCAST: {msg}")
+
+        async def publish(self, event_type, payload):
+            print(f"PUBLISH {event_type}: {payload}")
     
     globals.manager = DummyManager()
     globals.kick_emotes = {}
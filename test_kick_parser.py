@@ -0,0 +1,64 @@
+"""
+Checks that the Kick chat parser backends agree on the recorded chat fixtures.
+
+Run with pytest or directly: python test_kick_parser.py
+"""
+
+from api import kick_parser
+from benchmarks.kick_fixtures import build_chat_container, build_chat_rows
+
+
+def test_backends_return_identical_messages():
+    html = build_chat_container(300)
+    results = {name: parse_rows(html) for name, parse_rows in kick_parser.PARSERS.items()}
+    assert len(results["bs4"]) == 300
+    for name, messages in results.items():
+        assert messages == results["bs4"], f"{name} backend disagrees with bs4"
+
+
+def test_parsed_fields():
+    for name, parse_rows in kick_parser.PARSERS.items():
+        messages = parse_rows(build_chat_container(8))
+        by_sender = {msg["sender"]: msg for msg in messages}
+
+        emote_only = messages[1]
+        assert emote_only["data_index"] == 1
+        assert emote_only["content"] == "[emote:KEKW|37226]"
+        assert emote_only["emotes"] == [{"name": "KEKW", "url": "https://files.kick.com/emotes/37226/fullsize", "id": "37226"}]
+
+        reply = by_sender["quietviewer"]
+        assert reply["is_reply"] is True, name
+        assert reply["timestamp"] == "10:54 PM"
+        assert reply["content"] == "@mod_steve he did it last week too"
+
+        mixed = by_sender["mod_steve"]
+        assert mixed["content"] == "no way [emote:emojiSkull|1730762] he actually did it [emote:KEKW|37226]"
+        assert len(mixed["emotes"]) == 2
+
+        link = by_sender["linkposter"]
+        assert link["content"] == "clip of that: https://kick.com/clips/clip_01J3 insane"
+
+
+def test_index_wraps_after_max_index():
+    for parse_rows in kick_parser.PARSERS.values():
+        html = '<div id="chatroom-messages">' + "".join(build_chat_rows(4, start_sequence=298)) + '</div>'
+        assert [msg["data_index"] for msg in parse_rows(html)] == [298, 299, 0, 1]
+
+
+def test_backends_honour_container_selector():
+    rows = build_chat_rows(6)
+    html = ('<div id="pinned">' + rows[0] + '</div>'
+            '<div id="chatroom-messages" class="chat list">' + "".join(rows[1:]) + '</div>')
+    for selector, expected in (("#chatroom-messages", [1, 2, 3, 4, 5]), ("div.chat", [1, 2, 3, 4, 5]),
+                               ("#pinned", [0]), ("div", [0, 1, 2, 3, 4, 5]), ("#missing", [])):
+        for name, parse_rows in kick_parser.PARSERS.items():
+            indexes = [msg["data_index"] for msg in parse_rows(html, selector)]
+            assert indexes == expected, f"{name} backend with {selector!r}: {indexes}"
+
+
+if __name__ == "__main__":
+    test_backends_return_identical_messages()
+    test_parsed_fields()
+    test_index_wraps_after_max_index()
+    test_backends_honour_container_selector()
+    print("All Kick parser checks passed")
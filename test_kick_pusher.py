@@ -0,0 +1,183 @@
+"""
+Runs the browserless Kick ingest engine against a local stand-in for Kick's Pusher server.
+
+Run with pytest or directly: python test_kick_pusher.py
+"""
+
+import asyncio
+import json
+
+import websockets
+
+from api import kick, kick_pusher
+from api.kick_session import KickChannelSession
+from benchmarks.replay_kick_ingest import FakeWebSocket
+from utils.connection_manager import ConnectionManager
+import globals
+
+CHATROOM_ID = "668"
+
+CHAT_EVENTS = [
+    {"id": "a1", "chatroom_id": 668, "content": "hello chat", "type": "message",
+     "created_at": "2024-07-20T22:53:12+00:00", "sender": {"id": 1, "username": "kekw_enjoyer"}},
+    {"id": "a2", "chatroom_id": 668, "content": "no way [emote:1730762:emojiSkull] lol [emote:37226:KEKW]", "type": "message",
+     "created_at": "2024-07-20T22:53:40+00:00", "sender": {"id": 2, "username": "mod_steve"}},
+    {"id": "a3", "chatroom_id": 668, "content": "@mod_steve he did it last week too", "type": "reply",
+     "created_at": "2024-07-20T22:54:01+00:00", "sender": {"id": 3, "username": "quietviewer"},
+     "metadata": {"original_sender": {"id": 2, "username": "mod_steve"}, "original_message": {"id": "a2"}}},
+    {"id": "a4", "chatroom_id": 668, "content": "hello chat", "type": "message",
+     "created_at": "2024-07-20T22:54:05+00:00", "sender": {"id": 1, "username": "kekw_enjoyer"}},
+]
+
+
+class StandInPusherServer:
+    """Implements the handful of Pusher protocol frames Kick's web client relies on."""
+
+    def __init__(self, events):
+        self.events = events
+        self.subscriptions = []
+        self.pongs = 0
+        self.connections = 0
+
+    async def handler(self, websocket):
+        self.connections += 1
+        await websocket.send(json.dumps({
+            "event": "pusher:connection_established",
+            "data": json.dumps({"socket_id": "123.456", "activity_timeout": 120}),
+        }))
+        async for raw in websocket:
+            frame = json.loads(raw)
+            if frame["event"] == "pusher:subscribe":
+                channel = frame["data"]["channel"]
+                self.subscriptions.append(channel)
+                await websocket.send(json.dumps({"event": "pusher_internal:subscription_succeeded", "data": "{}", "channel": channel}))
+                await websocket.send(json.dumps({"event": "pusher:ping", "data": {}}))
+                for event in self.events:
+                    await websocket.send(json.dumps({"event": kick_pusher.CHAT_MESSAGE_EVENT, "data": json.dumps(event), "channel": channel}))
+                if self.connections == 1:
+                    await websocket.close()  # Drop the first connection to exercise reconnects
+            elif frame["event"] == "pusher:pong":
+                self.pongs += 1
+
+
+def test_convert_chat_event():
+    reply = kick_pusher.convert_chat_event(CHAT_EVENTS[2], 5)
+    assert reply["data_index"] == 5
+    assert reply["sender"] == "quietviewer"
+    assert reply["is_reply"] is True
+    assert reply["timestamp"].endswith("M")
+
+    emotes = kick_pusher.convert_chat_event(CHAT_EVENTS[1], 0)
+    assert emotes["content"] == "no way [emote:emojiSkull|1730762] lol [emote:KEKW|37226]"
+    assert emotes["emotes"] == [
+        {"name": "emojiSkull", "url": "https://files.kick.com/emotes/1730762/fullsize", "id": "1730762"},
+        {"name": "KEKW", "url": "https://files.kick.com/emotes/37226/fullsize", "id": "37226"},
+    ]
+    assert kick_pusher.convert_chat_event({"content": "no sender"}, 0) is None
+
+
+async def run_client_against_stand_in():
+    server = StandInPusherServer(CHAT_EVENTS)
+    received = []
+
+    async def on_messages(messages):
+        received.extend(messages)
+
+    async with websockets.serve(server.handler, "127.0.0.1", 0) as ws_server:
+        port = ws_server.sockets[0].getsockname()[1]
+        client = kick_pusher.PusherChatClient(CHATROOM_ID, on_messages, url=f"ws://127.0.0.1:{port}/app/key")
+        task = asyncio.create_task(client.run())
+        try:
+            for _ in range(100):
+                if len(received) >= 2 * len(CHAT_EVENTS):
+                    break
+                await asyncio.sleep(0.05)
+        finally:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+    return server, client, received
+
+
+def test_client_subscribes_and_reconnects():
+    kick_pusher_delays = kick_pusher.RECONNECT_DELAYS
+    kick_pusher.RECONNECT_DELAYS = (0,)
+    try:
+        server, client, received = asyncio.run(run_client_against_stand_in())
+    finally:
+        kick_pusher.RECONNECT_DELAYS = kick_pusher_delays
+
+    assert server.subscriptions == ["chatrooms.668.v2", "chatrooms.668.v2"]
+    assert server.pongs >= 1
+    assert client.reconnects >= 1
+    assert [msg["sender"] for msg in received[:4]] == ["kekw_enjoyer", "mod_steve", "quietviewer", "kekw_enjoyer"]
+    assert [msg["data_index"] for msg in received] == list(range(len(received)))
+    assert [msg["message_id"] for msg in received[:4]] == ["a1", "a2", "a3", "a4"]
+
+
+async def run_engine_through_pipeline():
+    server = StandInPusherServer(CHAT_EVENTS)
+    saved_manager = globals.manager
+    globals.manager = ConnectionManager()
+    client_socket = FakeWebSocket(0)
+    sent = []
+    client_socket.send_text = lambda message: _record(sent, message)
+    await globals.manager.connect(client_socket)
+
+    session = KickChannelSession("stand_in", engine="pusher", queue_size=10)
+    session.active = True
+    async with websockets.serve(server.handler, "127.0.0.1", 0) as ws_server:
+        port = ws_server.sockets[0].getsockname()[1]
+        client = kick_pusher.PusherChatClient(
+            CHATROOM_ID, lambda messages: kick.ingest_parsed_messages(session, messages), url=f"ws://127.0.0.1:{port}/app/key"
+        )
+        tasks = [asyncio.create_task(client.run()), asyncio.create_task(kick.stream_messages(session))]
+        try:
+            # The stand-in drops the first connection and delivers every event again after the reconnect
+            for _ in range(100):
+                if server.connections >= 2 and session.counters["rows_parsed"] >= 2 * len(CHAT_EVENTS):
+                    break
+                await asyncio.sleep(0.05)
+            await asyncio.sleep(0.1)
+        finally:
+            session.active = False
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await globals.manager.shutdown()
+            globals.manager = saved_manager
+    return sent
+
+
+async def _record(sent, message):
+    payload = json.loads(message)
+    if payload["type"] == "kick_chat_batch":
+        sent.extend(event["data"] for event in payload["data"]["messages"])
+    elif payload["type"] == "kick_chat_message":
+        sent.append(payload["data"])
+
+
+def test_engine_feeds_stream_messages():
+    kick_pusher_delays = kick_pusher.RECONNECT_DELAYS
+    kick_pusher.RECONNECT_DELAYS = (0,)
+    try:
+        sent = asyncio.run(run_engine_through_pipeline())
+    finally:
+        kick_pusher.RECONNECT_DELAYS = kick_pusher_delays
+    # Redelivered events are dropped by their id; the identical "hello chat" messages are both kept
+    assert [(msg["user"], msg["text"]) for msg in sent] == [
+        ("kekw_enjoyer", "hello chat"),
+        ("mod_steve", "no way [emote:emojiSkull|1730762] lol [emote:KEKW|37226]"),
+        ("quietviewer", "@mod_steve he did it last week too"),
+        ("kekw_enjoyer", "hello chat"),
+    ]
+    assert sent[1]["emotes"][0]["id"] == "1730762"
+
+
+if __name__ == "__main__":
+    from conftest import isolated_settings
+
+    with isolated_settings():  # As under pytest (conftest.py)
+        test_convert_chat_event()
+        test_client_subscribes_and_reconnects()
+        test_engine_feeds_stream_messages()
+        print("All Kick Pusher engine checks passed")
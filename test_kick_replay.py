@@ -0,0 +1,28 @@
+"""
+Replays synthetic Kick chat through the real ingest path with the benchmark harness.
+
+Run with pytest or directly: python test_kick_replay.py
+"""
+
+import asyncio
+
+from benchmarks.kick_fixtures import MAX_KICK_INDEX
+from benchmarks.replay_kick_ingest import CAPTURE_MODES, prepare_steps, replay, synthetic_snapshots
+
+
+def test_replay_delivers_every_message_once():
+    # Long enough to wrap the data-index once
+    steps = prepare_steps(synthetic_snapshots(MAX_KICK_INDEX + 60, per_capture=15))
+    for capture_mode in CAPTURE_MODES:
+        results = asyncio.run(replay(steps, capture_mode=capture_mode, clients=2, timeout=30))
+        assert not results["timed_out"], capture_mode
+        assert results["delivered"] == results["expected"] == MAX_KICK_INDEX + 60, capture_mode
+        assert results["unexpected"] == 0, capture_mode
+        assert results["messages_per_second"] > 0
+        # The capture call doubles as the liveness check: no extra current_url round trip per tick
+        assert results["liveness_probes"] == 0, capture_mode
+
+
+if __name__ == "__main__":
+    test_replay_delivers_every_message_once()
+    print("Kick ingest replay checks passed")
@@ -0,0 +1,200 @@
+"""
+Connects several Kick channels at once (Pusher engine, local stand-in server) and
+checks that each channel keeps its own pipeline, dedup state, history and metrics.
+
+Run with pytest or directly: python test_kick_sessions.py
+"""
+
+import asyncio
+import json
+
+import websockets
+
+import config
+import globals
+from api import kick, kick_pusher, settings
+from benchmarks.replay_kick_ingest import FakeWebSocket
+from utils.connection_manager import ConnectionManager
+
+# The same two messages are posted in every chatroom: dedup is per channel, so all are kept
+ROOM_EVENTS = [
+    {"id": "m1", "content": "first!", "type": "message",
+     "created_at": "2024-07-20T22:53:12+00:00", "sender": {"id": 1, "username": "kekw_enjoyer"}},
+    {"id": "m2", "content": "gg", "type": "message",
+     "created_at": "2024-07-20T22:53:20+00:00", "sender": {"id": 2, "username": "mod_steve"}},
+]
+CHANNELS = {"alpha": "101", "bravo": "202", "charlie": "303"}  # Channel name -> chatroom id
+
+
+class MultiRoomPusherServer:
+    """Stand-in Pusher server: every subscribed chatroom receives ROOM_EVENTS plus one message naming the room."""
+
+    def __init__(self):
+        self.subscriptions = []
+
+    async def handler(self, websocket):
+        await websocket.send(json.dumps({"event": "pusher:connection_established", "data": json.dumps({"socket_id": "1.2"})}))
+        async for raw in websocket:
+            frame = json.loads(raw)
+            if frame["event"] != "pusher:subscribe":
+                continue
+            channel = frame["data"]["channel"]
+            self.subscriptions.append(channel)
+            await websocket.send(json.dumps({"event": "pusher_internal:subscription_succeeded", "data": "{}", "channel": channel}))
+            events = ROOM_EVENTS + [{"id": "m3", "content": f"hello {channel}", "type": "message", "sender": {"id": 3, "username": "greeter"}}]
+            for event in events:
+                await websocket.send(json.dumps({"event": kick_pusher.CHAT_MESSAGE_EVENT, "data": json.dumps(event), "channel": channel}))
+
+
+async def run_channels():
+    server = MultiRoomPusherServer()
+    saved_manager = globals.manager
+    globals.manager = ConnectionManager()
+    client_socket = FakeWebSocket(0)
+    sent = []
+    client_socket.send_text = lambda message: _record(sent, message)
+    await globals.manager.connect(client_socket)
+    config.kick_chat_messages.clear()
+
+    async with websockets.serve(server.handler, "127.0.0.1", 0) as ws_server:
+        port = ws_server.sockets[0].getsockname()[1]
+        settings._settings_cache["kick"]["pusher_url"] = f"ws://127.0.0.1:{port}/app/key"
+        try:
+            for channel_name, chatroom_id in CHANNELS.items():
+                session = kick.new_session(channel_name, channel_id=chatroom_id)
+                session.chatroom_id = chatroom_id
+                kick.sessions.add(session)
+                kick.start_session_tasks(session)
+            kick._sync_config()
+
+            expected = len(CHANNELS) * (len(ROOM_EVENTS) + 1)
+            for _ in range(100):
+                if len(sent) >= expected:
+                    break
+                await asyncio.sleep(0.05)
+            results = {"sent": list(sent), "metrics": kick.get_kick_channel_metrics(), "latest": config.kick_channel_name}
+
+            # Disconnecting one channel leaves the others running
+            await kick.disconnect_kick_chat("Alpha")
+            results["after_one"] = kick.sessions.channel_names()
+            results["still_running"] = all(
+                session.active and not session.streaming_task.done() for session in kick.sessions
+            )
+            results["histories"] = {session.channel_name: list(session.history) for session in kick.sessions}
+        finally:
+            await kick.disconnect_kick_chat()
+            results["after_all"] = kick.sessions.channel_names()
+            results["connected"] = config.kick_chat_connected
+            await globals.manager.shutdown()
+            globals.manager = saved_manager
+    results["subscriptions"] = server.subscriptions
+    return results
+
+
+async def _record(sent, message):
+    payload = json.loads(message)
+    if payload["type"] == "kick_chat_batch":
+        sent.extend(event["data"] for event in payload["data"]["messages"])
+    elif payload["type"] == "kick_chat_message":
+        sent.append(payload["data"])
+
+
+def test_channels_run_independent_sessions():
+    settings._settings_cache["kick"]["engine"] = "pusher"  # Default settings in memory (conftest.py)
+    results = asyncio.run(run_channels())
+
+    assert sorted(results["subscriptions"]) == [f"chatrooms.{room}.v2" for room in sorted(CHANNELS.values())]
+    assert results["latest"] == "charlie"
+
+    sent = results["sent"]
+    for channel_name, chatroom_id in CHANNELS.items():
+        texts = [msg["text"] for msg in sent if msg["channel"] == channel_name]
+        assert texts == ["first!", "gg", f"hello chatrooms.{chatroom_id}.v2"]
+
+    metrics = {entry["channel"]: entry for entry in results["metrics"]}
+    assert set(metrics) == set(CHANNELS)
+    for entry in metrics.values():
+        assert (entry["engine"], entry["messages"], entry["broadcast"], entry["errors"]) == ("pusher", 3, 3, 0)
+
+    assert results["after_one"] == ["bravo", "charlie"]
+    assert results["still_running"]
+    for channel_name, history in results["histories"].items():
+        assert [msg["channel"] for msg in history] == [channel_name] * 3
+
+    assert results["after_all"] == []
+    assert results["connected"] is False
+
+
+def test_registry_finds_push_tokens():
+    registry = kick.KickSessionRegistry()
+    first = registry.add(kick.KickChannelSession("first"))
+    second = registry.add(kick.KickChannelSession("second"))
+    first.push_token, second.push_token = "token-one", "token-two"
+    assert registry.find_by_push_token("token-two") is second
+    assert registry.find_by_push_token("wrong") is None
+    assert registry.find_by_push_token(None) is None
+    assert registry.latest() is second
+    registry.remove("second")
+    assert registry.latest() is first and "second" not in registry
+
+
+class ScriptedIngestSocket:
+    """Stand-in for a /ws/kick-ingest socket: yields its messages, then waits for `release` before disconnecting."""
+
+    def __init__(self, messages, release=None):
+        self.messages = list(messages)
+        self.release = release
+        self.client = "page"
+
+    async def accept(self):
+        pass
+
+    async def receive_text(self):
+        from fastapi import WebSocketDisconnect
+        if self.messages:
+            return self.messages.pop(0)
+        if self.release:
+            await self.release.wait()
+        raise WebSocketDisconnect()
+
+
+async def run_ingest_reconnect():
+    import app  # Imported inside the loop: app.py builds its ConnectionManager at import time
+
+    session = kick.KickChannelSession("ingest")
+    session.push_token, session.active = "token", True
+    kick.sessions.add(session)
+    try:
+        release_old = asyncio.Event()
+        old = asyncio.create_task(app.kick_ingest_endpoint(ScriptedIngestSocket(["[1, 2]", '"rows"'], release_old), "token"))
+        await asyncio.sleep(0)
+        still_open = not old.done() and session.push_connected  # Non-object payloads did not end the socket
+
+        release_new = asyncio.Event()
+        new = asyncio.create_task(app.kick_ingest_endpoint(ScriptedIngestSocket(['{"rows": "<div>"}'], release_new), "token"))
+        await asyncio.sleep(0)
+        release_old.set()
+        await old
+        after_old_closed = session.push_connected  # The reconnected page still feeds the session
+        release_new.set()
+        await new
+        return still_open, after_old_closed, session.push_connected, session.queue.qsize()
+    finally:
+        kick.sessions.remove("ingest")
+
+
+def test_ingest_socket_survives_bad_payloads_and_reconnects():
+    still_open, after_old_closed, after_new_closed, queued = asyncio.run(run_ingest_reconnect())
+    assert still_open and after_old_closed
+    assert not after_new_closed
+    assert queued == 0  # "rows" that is not a list is ignored
+
+
+if __name__ == "__main__":
+    from conftest import isolated_settings
+
+    with isolated_settings():  # As under pytest (conftest.py)
+        test_channels_run_independent_sessions()
+        test_registry_finds_push_tokens()
+        test_ingest_socket_survives_bad_payloads_and_reconnects()
+        print("All Kick multi-channel session checks passed")
@@ -0,0 +1,147 @@
+"""
+Checks the weighted priority scheduler behind ConnectionManager broadcasts: class
+shares follow the weights, snapshots conflate, bounds hold producers back and
+wait times are reported.
+
+Run with pytest or directly: python test_priority_scheduler.py
+"""
+
+import asyncio
+
+from utils.connection_manager import priority_class
+from utils.priority_scheduler import WeightedScheduler
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+async def fill_and_drain(weights, per_class, dispatches):
+    scheduler = WeightedScheduler(weights, {name: per_class for name in weights})
+    for name in weights:
+        for number in range(per_class):
+            await scheduler.put(name, f"{name} {number}")
+    return [(await scheduler.get())[0] for _ in range(dispatches)], scheduler
+
+
+def test_dispatch_shares_follow_weights():
+    weights = {"control": 8, "chat": 4, "status": 2, "bulk": 1}
+    order, _ = asyncio.run(fill_and_drain(weights, 100, 150))
+    assert {name: order.count(name) for name in weights} == {"control": 80, "chat": 40, "status": 20, "bulk": 10}
+    # Smooth round-robin interleaves instead of serving a class in one long run
+    assert "bulk" in order[:15] and order[:8].count("control") < 8
+
+
+def test_empty_classes_do_not_hold_back_others():
+    order, scheduler = asyncio.run(fill_and_drain({"bulk": 1}, 5, 5))
+    assert order == ["bulk"] * 5
+    assert all(entry["depth"] == 0 for entry in scheduler.stats())
+
+
+async def run_conflation():
+    scheduler = WeightedScheduler()
+    await scheduler.put("bulk", "shot 1", "screenshot_update", key="screenshot_update")
+    await scheduler.put("bulk", "containers 1", "docker_containers", key="docker_containers")
+    await scheduler.put("bulk", "shot 2", "screenshot_update", key="screenshot_update")
+    taken = [(await scheduler.get())[1][0][0] for _ in range(2)]
+    return taken, scheduler.classes["bulk"]
+
+
+def test_snapshots_conflate_in_place():
+    taken, bulk = asyncio.run(run_conflation())
+    # The newest screenshot, in the place the first one was queued
+    assert taken == ["shot 2", "containers 1"]
+    assert (bulk.conflated, bulk.dispatched, len(bulk)) == (1, 2, 0)
+
+
+async def run_bounded_class():
+    scheduler = WeightedScheduler(queue_sizes={"bulk": 2})
+    await scheduler.put("bulk", "first")
+    await scheduler.put("bulk", "second")
+    producer = asyncio.create_task(scheduler.put("bulk", "third"))
+    await asyncio.sleep(0.01)
+    waited = not producer.done()
+    await scheduler.get()
+    await asyncio.wait_for(producer, 1)
+    return waited, scheduler.classes["bulk"]
+
+
+def test_full_class_makes_producers_wait():
+    waited, bulk = asyncio.run(run_bounded_class())
+    assert waited
+    assert (bulk.blocked, len(bulk)) == (1, 2)
+
+
+async def run_batching(clock):
+    scheduler = WeightedScheduler(clock=clock)
+    chat = scheduler.classes["chat"]
+    chat.batch_window, chat.batch_max = 0.05, 3
+    await scheduler.put("chat", "lone")
+    lone = await scheduler.get()  # After a quiet period: not held back
+    for number in range(4):
+        await scheduler.put("chat", f"burst {number}")
+    full = await scheduler.get()  # batch_max reached
+    held_until = chat.ready_at()
+    clock.now += 0.05
+    rest = await scheduler.get()
+    return lone, full, rest, held_until
+
+
+def test_chat_class_batches_bursts():
+    clock = FakeClock()
+    lone, full, rest, held_until = asyncio.run(run_batching(clock))
+    assert [entry[0] for entry in lone[1]] == ["lone"]
+    assert [entry[0] for entry in full[1]] == ["burst 0", "burst 1", "burst 2"]
+    assert held_until == 100.05  # The last one waits out the window
+    assert [entry[0] for entry in rest[1]] == ["burst 3"]
+
+
+async def run_wait_stats(clock):
+    scheduler = WeightedScheduler(clock=clock)
+    await scheduler.put("bulk", "old screenshot")
+    clock.now += 0.2
+    await scheduler.put("chat", "hello")
+    pending = {entry["class"]: entry for entry in scheduler.stats()}
+    await scheduler.get()
+    await scheduler.get()
+    return pending, {entry["class"]: entry for entry in scheduler.stats()}
+
+
+def test_wait_times_are_reported_per_class():
+    pending, drained = asyncio.run(run_wait_stats(FakeClock()))
+    assert (pending["bulk"]["depth"], pending["chat"]["depth"]) == (1, 1)
+    assert round(pending["bulk"]["oldest_wait_ms"]) == 200
+    assert round(drained["bulk"]["max_wait_ms"]) == 200
+    assert drained["chat"]["max_wait_ms"] == 0.0
+    assert drained["bulk"]["oldest_wait_ms"] == 0.0
+
+
+def test_event_types_map_to_classes():
+    assert priority_class("kick_overlay_command") == "control"
+    assert priority_class("kick_chat_message") == "chat"
+    assert priority_class("raffle_entry") == "status"
+    assert priority_class("screenshot_update") == "bulk"
+    assert priority_class("desktop_view_update") == "bulk"
+    assert priority_class(None) == "status"
+
+
+def test_invalid_settings_fall_back_to_defaults():
+    scheduler = WeightedScheduler({"chat": "lots", "bulk": 3}, {"status": None})
+    assert (scheduler.classes["chat"].weight, scheduler.classes["bulk"].weight) == (4, 3)
+    assert scheduler.classes["status"].max_size == 512
+
+
+if __name__ == "__main__":
+    test_dispatch_shares_follow_weights()
+    test_empty_classes_do_not_hold_back_others()
+    test_snapshots_conflate_in_place()
+    test_full_class_makes_producers_wait()
+    test_chat_class_batches_bursts()
+    test_wait_times_are_reported_per_class()
+    test_event_types_map_to_classes()
+    test_invalid_settings_fall_back_to_defaults()
+    print("All priority scheduler checks passed")
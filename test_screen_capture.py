@@ -0,0 +1,176 @@
+"""
+Checks the in-process screenshot path: X image data converts to RGB, frames
+encode to valid PNG, and capture_screenshot stores what the grabber returns.
+Grabbing a real display needs an X server, so a fake grabber stands in for it.
+
+Run with pytest or directly: python test_screen_capture.py
+"""
+
+import os
+import struct
+import subprocess
+import sys
+import threading
+import zlib
+
+import numpy as np
+
+from api import screenshot
+from api.frame_diff import FrameDiffer
+from api.frame_store import FrameStore
+from api.x11_capture import CaptureError, PNGEncoder, X11Grabber, encode_png, ximage_to_rgb
+
+
+def decode_png(data):
+    """(width, height, RGB array) of an 8-bit RGB PNG with unfiltered scanlines."""
+    assert data[:8] == b"\x89PNG\r\n\x1a\n"
+    position, chunks = 8, {}
+    while position < len(data):
+        length, tag = struct.unpack(">I4s", data[position:position + 8])
+        body = data[position + 8:position + 8 + length]
+        assert struct.unpack(">I", data[position + 8 + length:position + 12 + length])[0] == zlib.crc32(tag + body)
+        chunks[tag] = chunks.get(tag, b"") + body
+        position += 12 + length
+    width, height, depth, color_type = struct.unpack(">IIBB", chunks[b"IHDR"][:10])
+    assert (depth, color_type) == (8, 2) and b"IEND" in chunks
+    rows = np.frombuffer(zlib.decompress(chunks[b"IDAT"]), dtype=np.uint8).reshape(height, width * 3 + 1)
+    assert not rows[:, 0].any()  # Filter type 0 on every row
+    return width, height, rows[:, 1:].reshape(height, width, 3)
+
+
+def gradient(width, height):
+    rgb = np.zeros((height, width, 3), dtype=np.uint8)
+    rgb[:, :, 0] = np.arange(width, dtype=np.uint8)
+    rgb[:, :, 1] = np.arange(height, dtype=np.uint8)[:, None]
+    rgb[:, :, 2] = 200
+    return rgb
+
+
+def test_png_round_trip():
+    frame = gradient(40, 30)
+    width, height, decoded = decode_png(encode_png(frame))
+    assert (width, height) == (40, 30)
+    assert np.array_equal(decoded, frame)
+
+
+def test_encoder_reuses_its_buffer_per_size():
+    encoder = PNGEncoder()
+    encoder.encode(gradient(8, 4))
+    buffer = encoder._scanlines
+    encoder.encode(gradient(8, 4))
+    assert encoder._scanlines is buffer
+    _, _, decoded = decode_png(encoder.encode(gradient(5, 3)))
+    assert decoded.shape == (3, 5, 3)
+
+
+def test_ximage_conversion():
+    # Two BGRX pixels per row plus one pixel of row padding
+    row = [30, 20, 10, 0, 3, 2, 1, 0, 99, 99, 99, 99]
+    data = np.array(row * 2, dtype=np.uint8)
+    rgb = ximage_to_rgb(data, 2, 2, bytes_per_line=12)
+    assert rgb.tolist() == [[[10, 20, 30], [1, 2, 3]]] * 2
+    # RGBX visual, and a big-endian server (XRGB in memory)
+    assert ximage_to_rgb(data, 1, 1, 12, masks=(0x0000FF, 0x00FF00, 0xFF0000)).tolist() == [[[30, 20, 10]]]
+    assert ximage_to_rgb(np.array([0, 10, 20, 30], dtype=np.uint8), 1, 1, 4, byte_order=1).tolist() == [[[10, 20, 30]]]
+
+
+def test_missing_display_raises_capture_error():
+    grabber = X11Grabber(display=":4242")
+    try:
+        grabber.grab()
+    except CaptureError:
+        pass
+    else:
+        raise AssertionError("Grabbing a display that does not exist must fail")
+    grabber.close()
+
+
+class FakeGrabber:
+    def __init__(self, frame=None):
+        self.frame = frame
+
+    def grab(self):
+        if self.frame is None:
+            raise CaptureError("no display")
+        return self.frame
+
+    def close(self):
+        pass
+
+
+def capture_with(grabber, backend, captures=1):
+    saved = (screenshot._grabber, screenshot._encoder, screenshot._differ, screenshot.capture_backend,
+             screenshot.frame_store)
+    screenshot._grabber, screenshot._encoder, screenshot._differ = grabber, PNGEncoder(), FrameDiffer()
+    screenshot.capture_backend, screenshot.frame_store = backend, FrameStore()
+    try:
+        return [screenshot.capture_screenshot() for _ in range(captures)], screenshot.frame_store
+    finally:
+        (screenshot._grabber, screenshot._encoder, screenshot._differ, screenshot.capture_backend,
+         screenshot.frame_store) = saved
+
+
+def test_capture_screenshot_stores_grabbed_frame():
+    frame = gradient(16, 9)
+    (captured,), store = capture_with(FakeGrabber(frame), "auto")
+    assert captured is store.latest() and captured.seq == 1
+    assert captured.content_type == "image/png"
+    assert captured.change.region == (0, 0, 16, 9)
+    assert np.array_equal(decode_png(captured.data)[2], frame)
+    assert not os.path.exists(screenshot.DEBUG_FRAME_PATH)  # Nothing on disk unless debugging
+
+
+def test_unchanged_desktop_is_not_stored_again():
+    skipped_before = screenshot.unchanged_frames
+    captures, store = capture_with(FakeGrabber(gradient(16, 9)), "auto", captures=3)
+    assert [frame.seq for frame in captures] == [1, 1, 1]
+    assert store.last_seq == 1
+    assert screenshot.unchanged_frames == skipped_before + 2
+
+
+def test_x11_only_backend_does_not_fall_back():
+    (captured,), store = capture_with(FakeGrabber(), "x11")
+    assert captured is None and store.latest() is None
+    assert screenshot._x11_retry_at == 0
+
+
+BURN_CPU = [sys.executable, "-c", "import time\nend = time.process_time() + 0.3\nwhile time.process_time() < end: pass"]
+
+
+def test_capture_cost_counts_only_capture_commands():
+    # Another child exiting (Chrome, chromedriver) is not part of the capture's cost
+    before = screenshot._cpu_seconds()
+    subprocess.run(BURN_CPU, check=True)
+    assert screenshot._cpu_seconds() - before < 0.1
+    if screenshot.resource is not None:
+        # The capture pipeline's own children are
+        before = screenshot._cpu_seconds()
+        screenshot._run_capture_command(" ".join(BURN_CPU[:2]) + f" '{BURN_CPU[2]}'")
+        assert screenshot._cpu_seconds() - before >= 0.25
+
+
+def test_overlapping_capture_commands_are_counted_once():
+    if screenshot.resource is None:
+        return
+    # An emergency capture next to the loop's: each run's snapshots must not take in the other's CPU
+    command = " ".join(BURN_CPU[:2]) + f" '{BURN_CPU[2]}'"
+    before = screenshot.xwd_cpu_seconds
+    threads = [threading.Thread(target=screenshot._run_capture_command, args=(command,)) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert 0.55 <= screenshot.xwd_cpu_seconds - before < 0.9
+
+
+if __name__ == "__main__":
+    test_png_round_trip()
+    test_encoder_reuses_its_buffer_per_size()
+    test_ximage_conversion()
+    test_missing_display_raises_capture_error()
+    test_capture_screenshot_stores_grabbed_frame()
+    test_unchanged_desktop_is_not_stored_again()
+    test_x11_only_backend_does_not_fall_back()
+    test_capture_cost_counts_only_capture_commands()
+    test_overlapping_capture_commands_are_counted_once()
+    print("All screen capture checks passed")
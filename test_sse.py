@@ -0,0 +1,146 @@
+"""
+Checks the Server-Sent Events transport: frames carry chat seqs as ids, a
+Last-Event-ID resumes missed chat, and a finished stream (or one whose client
+has gone) unregisters its client.
+
+Run with pytest or directly: python test_sse.py
+"""
+
+import asyncio
+import json
+
+from utils.connection_manager import ConnectionManager, parse_topics
+from utils.sse import SSEConnection, parse_last_event_id, sse_frame
+
+
+def new_manager():
+    """A manager configured by arguments only (never reads the settings file)."""
+    return ConnectionManager(send_queue_size=100, slow_consumer_policy="drop_oldest", send_timeout=5,
+                             chat_batch_window=0, replay_buffer_size=50)
+
+
+def parse_frames(chunks):
+    """Split SSE body chunks into (id, data) events, skipping the retry hint and comments."""
+    events = []
+    for chunk in chunks:
+        fields = dict(line.split(": ", 1) for line in chunk.strip("\n").split("\n") if not line.startswith(":"))
+        if "data" in fields:
+            events.append((fields.get("id"), json.loads(fields["data"])))
+    return events
+
+
+async def read_chunks(stream, count):
+    return [await anext(stream) for _ in range(count)]
+
+
+async def run_stream(resume_from=None):
+    manager = new_manager()
+    for number in range(1, 4):
+        await manager.publish("kick_chat_message", {"user": "viewer", "text": f"message {number}"})
+    await manager.publish("screenshot_update", {"path": "desktop_view.png"})  # Not an overlay topic
+    for _ in range(100):
+        if manager.chat_messages == 3:
+            break
+        await asyncio.sleep(0.01)
+
+    connection = SSEConnection(("overlay", 0))
+    await manager.connect(connection, topics=parse_topics("chat,overlay"), resume_from=resume_from)
+    stream = connection.stream(on_close=manager.disconnect)
+    try:
+        await manager.publish("kick_overlay_command", {"command": "clear"})
+        await manager.publish("kick_chat_message", {"user": "viewer", "text": "message 4"})
+        chunks = await asyncio.wait_for(read_chunks(stream, 3 if resume_from is None else 5), 2)
+        connected = list(manager.active_connections)
+        await connection.close()  # As when the server ends the response
+        remaining = [chunk async for chunk in stream]
+        return chunks, remaining, connected, list(manager.active_connections)
+    finally:
+        await manager.shutdown()
+
+
+def test_stream_delivers_overlay_topics_with_chat_ids():
+    chunks, remaining, connected, after = asyncio.run(run_stream())
+    assert chunks[0] == "retry: 5000\n\n"
+    events = parse_frames(chunks)
+    assert [(event_id, event["type"]) for event_id, event in events] == [
+        (None, "kick_overlay_command"), ("4", "kick_chat_message"),
+    ]
+    assert len(connected) == 1
+    assert remaining == [] and after == []
+
+
+def test_last_event_id_resumes_missed_chat():
+    chunks, _, _, _ = asyncio.run(run_stream(resume_from=1))
+    events = parse_frames(chunks)
+    assert events[0][1]["type"] == "chat_resume"
+    assert events[0][1]["data"]["replayed"] == 2
+    # The replayed pair arrives as one batch frame, identified by its last seq
+    assert events[1][0] == "3"
+    assert [event["data"]["text"] for event in events[1][1]["data"]["messages"]] == ["message 2", "message 3"]
+    assert [event_id for event_id, _ in events[2:]] == [None, "4"]
+
+
+async def run_keepalive():
+    connection = SSEConnection()
+    stream = connection.stream(keepalive=0.01)
+    chunks = await read_chunks(stream, 2)
+    await connection.close()
+    return chunks, [chunk async for chunk in stream]
+
+
+def test_idle_stream_sends_keepalive_comments():
+    chunks, remaining = asyncio.run(run_keepalive())
+    assert chunks[1] == ": keepalive\n\n"
+    assert remaining == []
+
+
+async def run_abandoned_stream():
+    manager = new_manager()
+    connection = SSEConnection(("overlay", 0))
+    gone = asyncio.Event()
+
+    async def is_disconnected():
+        return gone.is_set()
+
+    await manager.connect(connection, topics=parse_topics("chat,overlay"))
+    stream = connection.stream(on_close=manager.disconnect, is_disconnected=is_disconnected, poll_interval=0.01)
+    try:
+        await read_chunks(stream, 1)
+        connected = list(manager.active_connections)
+        # The client leaves; like Starlette, stop iterating without closing the generator
+        gone.set()
+        for _ in range(100):
+            if not manager.active_connections:
+                break
+            await asyncio.sleep(0.01)
+        return connected, list(manager.active_connections), connection.closed
+    finally:
+        await manager.shutdown()
+        await stream.aclose()
+
+
+def test_disconnected_client_is_unregistered_without_closing_the_stream():
+    connected, after, closed = asyncio.run(run_abandoned_stream())
+    assert len(connected) == 1
+    assert after == [] and closed
+
+
+def test_frame_format():
+    assert sse_frame('{"type":"info","data":{}}') == 'data: {"type":"info","data":{}}\n\n'
+    assert sse_frame('{"type":"kick_chat_message","seq":7,"data":{}}').startswith("id: 7\ndata: ")
+    assert sse_frame('{\n"type": "info"}') == 'data: {\ndata: "type": "info"}\n\n'  # Multi-line data stays one event
+    assert parse_last_event_id("12") == 12
+    assert parse_last_event_id("") is None
+    assert parse_last_event_id("abc") is None
+
+
+if __name__ == "__main__":
+    from conftest import isolated_settings
+
+    with isolated_settings():  # As under pytest (conftest.py)
+        test_stream_delivers_overlay_topics_with_chat_ids()
+        test_last_event_id_resumes_missed_chat()
+        test_idle_stream_sends_keepalive_comments()
+        test_disconnected_client_is_unregistered_without_closing_the_stream()
+        test_frame_format()
+        print("All SSE checks passed")
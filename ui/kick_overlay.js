@@ -1,11 +1,55 @@
 (function() {
     const chatContainer = document.getElementById('chat-container');
     const wsProtocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
-    const wsUrl = `${wsProtocol}//${window.location.host}/ws`;
+    // Only chat and overlay commands are rendered here; skip screenshots, docker status, settings...
+    // Binary MessagePack frames (ui/msgpack.js) keep the remote-OBS uplink small
+    const encoding = window.preferredEncoding ? window.preferredEncoding() : 'json';
+    const wsUrl = `${wsProtocol}//${window.location.host}/ws?topics=chat,overlay&encoding=${encoding}`;
+    let lastSeq = null; // Seq of the newest chat event received, sent as resume_from when reconnecting
+    // ?transport=sse reads the read-only /sse event stream instead of the WebSocket
+    const transport = new URLSearchParams(window.location.search).get('transport');
     let ws = null;
     let reconnectTimeout = null;
     let messageLimit = 15; // Default message limit
 
+    function handleMessage(message) {
+        if (typeof message.seq === 'number') {
+            lastSeq = message.seq;
+        }
+        if (message.type === 'kick_chat_message' && message.data) { // Changed type check
+            addChatMessage(message.data.user, message.data.text, message.data.emotes); // Added emotes parameter
+        } else if (message.type === 'kick_overlay_command' && message.data) {
+            handleCommand(message.data);
+        }
+    }
+
+    // Handle one decoded frame from the WebSocket or the event stream
+    function dispatchMessage(message) {
+        if (message.type === 'chat_resume' && message.data) {
+            console.log(`Resumed chat: ${message.data.replayed} missed messages${message.data.complete ? '' : ' (some were too old to replay)'}`);
+        } else if (message.type === 'kick_chat_batch' && message.data) {
+            // A chat burst sent as one frame: each entry is a complete chat event
+            message.data.messages.forEach(handleMessage);
+        } else {
+            handleMessage(message);
+        }
+    }
+
+    function connectEventSource() {
+        // EventSource reconnects by itself and resumes from the last chat seq (Last-Event-ID)
+        const source = new EventSource('/sse?topics=chat,overlay');
+        console.log('Connecting to the overlay event stream...');
+        source.onopen = () => console.log('Event stream connected.');
+        source.onmessage = (event) => {
+            try {
+                dispatchMessage(JSON.parse(event.data));
+            } catch (error) {
+                console.error('Error processing event stream message:', error);
+            }
+        };
+        source.onerror = () => console.warn('Event stream interrupted; the browser will reconnect.');
+    }
+
     function connectWebSocket() {
         if (reconnectTimeout) {
             clearTimeout(reconnectTimeout);
@@ -17,7 +61,9 @@
             return;
         }
 
-        ws = new WebSocket(wsUrl);
+        // After a reconnect the server replays the chat sent while we were away
+        ws = new WebSocket(lastSeq === null ? wsUrl : `${wsUrl}&resume_from=${lastSeq}`);
+        ws.binaryType = 'arraybuffer';
         console.log('Attempting WebSocket connection...');
 
         ws.onopen = () => {
@@ -31,14 +77,8 @@
 
         ws.onmessage = (event) => {
             try {
-                const message = JSON.parse(event.data);
-                // console.log('Received message:', message); // For debugging
-
-                if (message.type === 'kick_chat_message' && message.data) { // Changed type check
-                    addChatMessage(message.data.user, message.data.text, message.data.emotes); // Added emotes parameter
-                } else if (message.type === 'kick_overlay_command' && message.data) {
-                    handleCommand(message.data);
-                }
+                // Text frames are JSON, binary frames MessagePack
+                dispatchMessage(typeof event.data === 'string' ? JSON.parse(event.data) : window.decodeMsgPack(event.data));
             } catch (error) {
                 console.error('Error processing WebSocket message:', error);
             }
@@ -446,6 +486,10 @@
     applyStyles(defaultStyles);
 
     // Initial connection attempt
-    connectWebSocket();
+    if (transport === 'sse') {
+        connectEventSource();
+    } else {
+        connectWebSocket();
+    }
 
 })();
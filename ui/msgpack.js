@@ -0,0 +1,82 @@
+// Minimal MessagePack decoder for the binary frames sent to /ws?encoding=msgpack.
+// Decodes everything msgpack.packb produces for our JSON events (no extension types).
+(function() {
+    const textDecoder = new TextDecoder();
+
+    function decodeMsgPack(buffer) {
+        const bytes = buffer instanceof Uint8Array ? buffer : new Uint8Array(buffer);
+        const view = new DataView(bytes.buffer, bytes.byteOffset, bytes.byteLength);
+        let offset = 0;
+
+        function readString(length) {
+            const value = textDecoder.decode(bytes.subarray(offset, offset + length));
+            offset += length;
+            return value;
+        }
+
+        function readArray(length) {
+            const value = new Array(length);
+            for (let i = 0; i < length; i++) {
+                value[i] = read();
+            }
+            return value;
+        }
+
+        function readMap(length) {
+            const value = {};
+            for (let i = 0; i < length; i++) {
+                const key = read();
+                value[key] = read();
+            }
+            return value;
+        }
+
+        function read() {
+            const type = bytes[offset++];
+            let value;
+            if (type <= 0x7f) return type;  // positive fixint
+            if (type <= 0x8f) return readMap(type & 0x0f);  // fixmap
+            if (type <= 0x9f) return readArray(type & 0x0f);  // fixarray
+            if (type <= 0xbf) return readString(type & 0x1f);  // fixstr
+            if (type >= 0xe0) return type - 0x100;  // negative fixint
+
+            switch (type) {
+                case 0xc0: return null;
+                case 0xc2: return false;
+                case 0xc3: return true;
+                case 0xc4: value = bytes.slice(offset + 1, offset + 1 + bytes[offset]); offset += 1 + value.length; return value;
+                case 0xc5: value = view.getUint16(offset); offset += 2; value = bytes.slice(offset, offset + value); offset += value.length; return value;
+                case 0xc6: value = view.getUint32(offset); offset += 4; value = bytes.slice(offset, offset + value); offset += value.length; return value;
+                case 0xca: value = view.getFloat32(offset); offset += 4; return value;
+                case 0xcb: value = view.getFloat64(offset); offset += 8; return value;
+                case 0xcc: return bytes[offset++];
+                case 0xcd: value = view.getUint16(offset); offset += 2; return value;
+                case 0xce: value = view.getUint32(offset); offset += 4; return value;
+                case 0xcf: value = Number(view.getBigUint64(offset)); offset += 8; return value;
+                case 0xd0: value = view.getInt8(offset); offset += 1; return value;
+                case 0xd1: value = view.getInt16(offset); offset += 2; return value;
+                case 0xd2: value = view.getInt32(offset); offset += 4; return value;
+                case 0xd3: value = Number(view.getBigInt64(offset)); offset += 8; return value;
+                case 0xd9: return readString(bytes[offset++]);
+                case 0xda: value = view.getUint16(offset); offset += 2; return readString(value);
+                case 0xdb: value = view.getUint32(offset); offset += 4; return readString(value);
+                case 0xdc: value = view.getUint16(offset); offset += 2; return readArray(value);
+                case 0xdd: value = view.getUint32(offset); offset += 4; return readArray(value);
+                case 0xde: value = view.getUint16(offset); offset += 2; return readMap(value);
+                case 0xdf: value = view.getUint32(offset); offset += 4; return readMap(value);
+                default: throw new Error(`Unsupported MessagePack type 0x${type.toString(16)}`);
+            }
+        }
+
+        return read();
+    }
+
+    // The frame encoding to ask /ws for: JSON unless the page was opened with ?encoding=msgpack
+    function preferredEncoding() {
+        const requested = new URLSearchParams(window.location.search).get('encoding');
+        return requested === 'msgpack' ? 'msgpack' : 'json';
+    }
+
+    window.decodeMsgPack = decodeMsgPack;
+    window.preferredEncoding = preferredEncoding;
+})();
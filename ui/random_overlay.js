@@ -1,7 +1,13 @@
 (function() {
     const chatContainer = document.getElementById('chat-container');
     const wsProtocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
-    const wsUrl = `${wsProtocol}//${window.location.host}/ws`;
+    // Only chat and overlay commands are rendered here; skip screenshots, docker status, settings...
+    // Binary MessagePack frames (ui/msgpack.js) keep the remote-OBS uplink small
+    const encoding = window.preferredEncoding ? window.preferredEncoding() : 'json';
+    const wsUrl = `${wsProtocol}//${window.location.host}/ws?topics=chat,overlay&encoding=${encoding}`;
+    let lastSeq = null; // Seq of the newest chat event received, sent as resume_from when reconnecting
+    // ?transport=sse reads the read-only /sse event stream instead of the WebSocket
+    const transport = new URLSearchParams(window.location.search).get('transport');
     let ws = null;
     let reconnectTimeout = null;
 
@@ -122,6 +128,72 @@
         positionRandomMessage(messageElement);
     }
 
+    function handleMessage(message) {
+        if (typeof message.seq === 'number') {
+            lastSeq = message.seq;
+        }
+        if (message.type === 'kick_chat_message' && message.data) {
+            // Generate a unique ID for the message if not provided
+            const messageId = message.data.id ||
+                `${message.data.user}_${message.data.text}_${message.data.timestamp || Date.now()}`;
+
+            // Only process if we haven't shown this message before
+            if (!displayedMessageIds.has(messageId)) {
+                // Add to our tracking set
+                displayedMessageIds.add(messageId);
+
+                // Add to queue for processing
+                messageQueue.push({
+                    id: messageId,
+                    user: message.data.user,
+                    text: message.data.text,
+                    emotes: message.data.emotes,
+                    timestamp: message.data.timestamp || Date.now()
+                });
+
+                // Process the next message from queue
+                processNextMessage();
+
+                // Limit the size of our tracking set to prevent memory issues
+                if (displayedMessageIds.size > MAX_MESSAGE_HISTORY) {
+                    // Convert to array, remove oldest entries, convert back to set
+                    const idsArray = Array.from(displayedMessageIds);
+                    displayedMessageIds.clear();
+                    idsArray.slice(-MAX_MESSAGE_HISTORY).forEach(id => displayedMessageIds.add(id));
+                }
+            }
+        } else if (message.type === 'kick_overlay_command' && message.data) {
+            handleCommand(message.data);
+        }
+    }
+
+    // Handle one decoded frame from the WebSocket or the event stream
+    function dispatchMessage(message) {
+        if (message.type === 'chat_resume' && message.data) {
+            console.log(`Resumed chat: ${message.data.replayed} missed messages${message.data.complete ? '' : ' (some were too old to replay)'}`);
+        } else if (message.type === 'kick_chat_batch' && message.data) {
+            // A chat burst sent as one frame: each entry is a complete chat event
+            message.data.messages.forEach(handleMessage);
+        } else {
+            handleMessage(message);
+        }
+    }
+
+    function connectEventSource() {
+        // EventSource reconnects by itself and resumes from the last chat seq (Last-Event-ID)
+        const source = new EventSource('/sse?topics=chat,overlay');
+        console.log('Connecting to the overlay event stream...');
+        source.onopen = () => console.log('Event stream connected.');
+        source.onmessage = (event) => {
+            try {
+                dispatchMessage(JSON.parse(event.data));
+            } catch (error) {
+                console.error('Error processing event stream message:', error);
+            }
+        };
+        source.onerror = () => console.warn('Event stream interrupted; the browser will reconnect.');
+    }
+
     function connectWebSocket() {
         if (reconnectTimeout) {
             clearTimeout(reconnectTimeout);
@@ -133,7 +205,9 @@
             return;
         }
 
-        ws = new WebSocket(wsUrl);
+        // After a reconnect the server replays the chat sent while we were away
+        ws = new WebSocket(lastSeq === null ? wsUrl : `${wsUrl}&resume_from=${lastSeq}`);
+        ws.binaryType = 'arraybuffer';
         console.log('Attempting WebSocket connection...');
 
         ws.onopen = () => {
@@ -147,41 +221,8 @@
 
         ws.onmessage = (event) => {
             try {
-                const message = JSON.parse(event.data);
-
-                if (message.type === 'kick_chat_message' && message.data) {
-                    // Generate a unique ID for the message if not provided
-                    const messageId = message.data.id ||
-                        `${message.data.user}_${message.data.text}_${message.data.timestamp || Date.now()}`;
-
-                    // Only process if we haven't shown this message before
-                    if (!displayedMessageIds.has(messageId)) {
-                        // Add to our tracking set
-                        displayedMessageIds.add(messageId);
-
-                        // Add to queue for processing
-                        messageQueue.push({
-                            id: messageId,
-                            user: message.data.user,
-                            text: message.data.text,
-                            emotes: message.data.emotes,
-                            timestamp: message.data.timestamp || Date.now()
-                        });
-
-                        // Process the next message from queue
-                        processNextMessage();
-
-                        // Limit the size of our tracking set to prevent memory issues
-                        if (displayedMessageIds.size > MAX_MESSAGE_HISTORY) {
-                            // Convert to array, remove oldest entries, convert back to set
-                            const idsArray = Array.from(displayedMessageIds);
-                            displayedMessageIds.clear();
-                            idsArray.slice(-MAX_MESSAGE_HISTORY).forEach(id => displayedMessageIds.add(id));
-                        }
-                    }
-                } else if (message.type === 'kick_overlay_command' && message.data) {
-                    handleCommand(message.data);
-                }
+                // Text frames are JSON, binary frames MessagePack
+                dispatchMessage(typeof event.data === 'string' ? JSON.parse(event.data) : window.decodeMsgPack(event.data));
             } catch (error) {
                 console.error('Error processing WebSocket message:', error);
             }
@@ -586,5 +627,9 @@
     applyStyles(defaultStyles);
 
     // Initial connection attempt
-    connectWebSocket();
+    if (transport === 'sse') {
+        connectEventSource();
+    } else {
+        connectWebSocket();
+    }
 })();
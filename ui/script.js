@@ -72,11 +72,14 @@ document.addEventListener('DOMContentLoaded', () => {
     // Connect to WebSocket
     function connectWebSocket() {
         const wsProtocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
-        const wsUrl = `${wsProtocol}//${window.location.host}/ws`;
+        // JSON text frames; binary MessagePack (ui/msgpack.js) when the page was opened with ?encoding=msgpack
+        const encoding = window.preferredEncoding ? window.preferredEncoding() : 'json';
+        const wsUrl = `${wsProtocol}//${window.location.host}/ws?encoding=${encoding}`;
         console.log(`Connecting to WebSocket: ${wsUrl}`);
 
         try {
             window.ws = new WebSocket(wsUrl);
+            window.ws.binaryType = 'arraybuffer';
 
             window.ws.onopen = () => {
                 console.log('WebSocket connected');
@@ -93,12 +96,13 @@ document.addEventListener('DOMContentLoaded', () => {
             };
 
             window.ws.onmessage = (event) => {
-                // Only log non-screenshot messages to avoid console spam
-                if (!event.data.includes('screenshot_update')) {
-                    console.log('Received message:', event.data);
-                }
                 try {
-                    const message = JSON.parse(event.data);
+                    // Text frames are JSON, binary frames MessagePack
+                    const message = typeof event.data === 'string' ? JSON.parse(event.data) : window.decodeMsgPack(event.data);
+                    // Only log non-screenshot messages to avoid console spam
+                    if (message.type !== 'screenshot_update') {
+                        console.log('Received message:', message);
+                    }
                     handleMessage(message);
                 } catch (error) {
                     console.error('Error parsing message:', error);
@@ -219,6 +223,11 @@ document.addEventListener('DOMContentLoaded', () => {
                 addChatMessage(formattedMessage);
                 break;
 
+            case 'kick_chat_batch':
+                // A chat burst sent as one frame: each entry is a complete chat event
+                message.data.messages.forEach(handleMessage);
+                break;
+
             case 'viewer_list_update':
                 updateViewerList(message.data.viewers);
                 break;
@@ -659,6 +668,10 @@ document.addEventListener('DOMContentLoaded', () => {
         const desktopViewImg = document.getElementById('desktop-view-img');
         const statusIndicator = document.getElementById('connection-status');
 
+        if (streamingMode) {
+            return; // The stream already shows every frame
+        }
+
         if (desktopViewImg) {
             // Use the timestamp and update_id from the server to prevent caching
             const timestamp = data.timestamp || new Date().getTime();
@@ -713,6 +726,9 @@ document.addEventListener('DOMContentLoaded', () => {
             let imageUrl;
             if (imagePath.startsWith('http')) {
                 imageUrl = imagePath;
+            } else if (data.seq !== undefined) {
+                // The frame this update announced, served from the server's memory (cacheable by seq)
+                imageUrl = `/api/screenshot?seq=${data.seq}&instance=${data.instance}`;
             } else {
                 // Otherwise use the API endpoint with timestamp and ID
                 imageUrl = `/api/screenshot?t=${timestamp}&id=${updateId}`;
@@ -742,6 +758,9 @@ document.addEventListener('DOMContentLoaded', () => {
 
         // Function to refresh the desktop view image (fallback method)
         function refreshDesktopView() {
+            if (streamingMode) {
+                return; // The stream keeps the view current on its own
+            }
             if (fallbackMode || (Date.now() - lastUpdateTime > refreshInterval * 3)) {
                 // Use direct polling in fallback mode or if no updates for a while
                 const timestamp = new Date().getTime();
@@ -894,6 +913,17 @@ document.addEventListener('DOMContentLoaded', () => {
             }
         });
 
+        // While the user interacts with the desktop view, ask the server to capture faster for a while
+        let lastBoostTime = 0;
+        ['mousemove', 'click', 'wheel'].forEach(eventName => {
+            desktopViewImg.addEventListener(eventName, () => {
+                if (Date.now() - lastBoostTime > 3000) {
+                    lastBoostTime = Date.now();
+                    sendMessage({ type: 'screenshot_boost' });
+                }
+            });
+        });
+
         // Toggle desktop view visibility
         if (toggleDesktopViewBtn) {
             toggleDesktopViewBtn.addEventListener('click', function() {
@@ -937,7 +967,7 @@ document.addEventListener('DOMContentLoaded', () => {
 
     // Add streaming mode functionality
     let streamingMode = false;
-    let streamingInterval = null;
+    const streamingFps = 10; // Capped again by the server's screenshot.stream_max_fps
 
     // Function to toggle streaming mode
     window.toggleStreamingMode = function() {
@@ -956,15 +986,11 @@ document.addEventListener('DOMContentLoaded', () => {
                 statusIndicator.className = 'status-indicator connected';
             }
 
-            // Start a more frequent refresh interval for streaming
-            if (streamingInterval) clearInterval(streamingInterval);
-            streamingInterval = setInterval(() => {
-                const timestamp = new Date().getTime();
-                const desktopViewImg = document.getElementById('desktop-view-img');
-                if (desktopViewImg) {
-                    desktopViewImg.src = `/api/screenshot?t=${timestamp}&streaming=true`;
-                }
-            }, 200); // Very frequent updates for smoother streaming
+            // One long-lived multipart response replaces the per-frame notice + fetch
+            const desktopViewImg = document.getElementById('desktop-view-img');
+            if (desktopViewImg) {
+                desktopViewImg.src = `/api/screenshot/stream?fps=${streamingFps}&t=${new Date().getTime()}`;
+            }
 
             console.log('Streaming mode enabled');
         } else {
@@ -978,11 +1004,12 @@ document.addEventListener('DOMContentLoaded', () => {
                 statusIndicator.className = 'status-indicator connected';
             }
 
-            // Stop the streaming interval
-            if (streamingInterval) {
-                clearInterval(streamingInterval);
-                streamingInterval = null;
+            // Close the stream by going back to single frames
+            const desktopViewImg = document.getElementById('desktop-view-img');
+            if (desktopViewImg) {
+                desktopViewImg.src = `/api/screenshot?t=${new Date().getTime()}`;
             }
+            lastUpdateTime = Date.now();
 
             console.log('Streaming mode disabled');
         }
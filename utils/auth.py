@@ -161,19 +161,16 @@ def load_kick_tokens():
 async def broadcast_auth_status():
     """Broadcasts the current authentication status via WebSocket."""
     if globals.manager:
-        status_message = {
-            "type": "status_update",
-            "data": {
-                "twitch_authenticated": config.IS_AUTHENTICATED,
-                "kick_authenticated": config.KICK_IS_AUTHENTICATED,
-                "twitch_channel": config.selected_channel, # Or get dynamically if needed
-                "kick_channel": config.kick_channel_name,
-                "kick_connected": config.kick_chat_connected, # Add kick connection status
-                "raffle_entries_count": len(config.entered_users) # Add raffle entries count
-            }
+        status_data = {
+            "twitch_authenticated": config.IS_AUTHENTICATED,
+            "kick_authenticated": config.KICK_IS_AUTHENTICATED,
+            "twitch_channel": config.selected_channel, # Or get dynamically if needed
+            "kick_channel": config.kick_channel_name,
+            "kick_connected": config.kick_chat_connected, # Add kick connection status
+            "raffle_entries_count": len(config.entered_users) # Add raffle entries count
         }
         logger.info(f"Broadcasting auth status: Twitch={config.IS_AUTHENTICATED}, Kick={config.KICK_IS_AUTHENTICATED}")
-        await globals.manager.broadcast(json.dumps(status_message))
+        await globals.manager.publish("status_update", status_data)
     else:
         logger.warning("WebSocket manager not available for broadcasting auth status.")
 
@@ -0,0 +1,801 @@
+"""
+WebSocket connection manager shared by the app (exposed as globals.manager).
+
+Kept out of app.py so tools such as the ingest replay harness can broadcast
+through the real manager without importing the FastAPI app.
+
+Every connected client gets its own bounded outbound queue and writer task, so
+broadcasting is an O(1) enqueue per client and a slow client (a stalled OBS
+browser source, a throttled background tab) only delays itself. When a client's
+queue is full the configured slow-consumer policy decides what to give up.
+
+Published events go through an event bus (utils/event_bus.py, setting
+event_bus.backend) before they are routed to this process's clients: delivery
+is direct by default, and a relay backend forwards them to every app process so
+several workers or replicas can serve clients from one ingest process. Only a
+process whose bus publishes_chat (the one hosting the relay) publishes chat:
+chat seqs are counted here, per process.
+
+Broadcasts pass through a weighted priority scheduler (utils/priority_scheduler.py)
+before reaching the client queues: each event type belongs to a priority class
+(EVENT_PRIORITIES: control, chat, status, bulk) with its own bounded queue, and
+one dispatcher serves the classes in proportion to their weights
+(websocket.priority_weights / websocket.priority_queue_sizes). scheduler_stats()
+reports each class's depth and wait times.
+
+State snapshots (screenshot_update, docker_containers, settings_updated, ...)
+are latest-value-wins: a class queue holds at most one pending value per event
+type, and a newer snapshot replaces an older one still waiting in a client's
+queue. Stale snapshots are never sent and cannot pile up, however slow the
+clients are.
+
+Producers call publish(event_type, payload): the event is routed on its type
+and serialized exactly once (with orjson when installed), and the same encoded
+string is queued for every client. broadcast(message) still accepts a
+pre-serialized JSON string for older callers, at the cost of parsing it.
+
+Each event type belongs to a topic (EVENT_TOPICS). Clients may declare the
+topics they render when connecting (/ws?topics=chat,overlay) or later with a
+"subscribe" message; the manager keeps a subscriber set per topic and only
+queues an event for that topic's subscribers. Clients that declare nothing
+receive every topic, as before.
+
+Chat is micro-batched: after a quiet period the first message goes out at once,
+and messages arriving within the batch window (websocket.chat_batch_window_ms)
+after it are sent together, up to websocket.chat_batch_max per frame, as one
+{"type": "kick_chat_batch", "data": {"messages": [<event>, ...]}} frame whose
+entries are the complete chat events.
+
+Every chat event carries a "seq" number, increasing by one per event, and the
+newest broadcast chat events are kept in a bounded replay buffer
+(websocket.replay_buffer_size). A reconnecting client passes the last seq it
+rendered (/ws?resume_from=<seq>) and is sent a chat_resume event followed by
+just the chat it missed. Sequence numbers restart with the server, so a
+resume_from beyond the latest seq replays the whole buffer.
+
+Frames are JSON text by default. A client can ask for binary MessagePack frames
+(/ws?encoding=msgpack, needs the optional msgpack package): the same events,
+smaller and cheaper to decode. publish() packs them from the event itself, next
+to the JSON, once per event for all such clients (see EncodedEvent).
+Either way uvicorn negotiates permessage-deflate with browsers that offer it
+(websocket.per_message_deflate), which shrinks the keys repeated in every frame.
+"""
+
+import asyncio
+import json
+import logging
+import time
+from collections import defaultdict, deque
+from fastapi import WebSocket
+
+from api import settings
+from utils.event_bus import DEFAULT_RELAY_ADDRESS, create_event_bus
+from utils.priority_scheduler import WeightedScheduler
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+try:
+    import msgpack
+    MSGPACK_AVAILABLE = True
+    _CHAT_BATCH_PREFIX = b"\x82" + msgpack.packb("type") + msgpack.packb("kick_chat_batch") + \
+        msgpack.packb("data") + b"\x81" + msgpack.packb("messages")  # Up to the messages array header
+except ImportError:
+    MSGPACK_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SEND_QUEUE_SIZE = 256
+DEFAULT_SEND_TIMEOUT = 10.0
+SLOW_CONSUMER_POLICIES = ("drop_oldest", "disconnect")
+DEFAULT_SLOW_CONSUMER_POLICY = "drop_oldest"
+# Former policy names still found in settings files
+SLOW_CONSUMER_POLICY_ALIASES = {"coalesce": "drop_oldest"}  # Snapshots are now always coalesced
+DEFAULT_CHAT_BATCH_WINDOW = 0.025  # Seconds
+DEFAULT_CHAT_BATCH_MAX = 100
+DEFAULT_REPLAY_BUFFER_SIZE = 500  # Chat events kept for reconnecting clients
+ENCODINGS = ("json", "msgpack")  # WebSocket frame encodings a client can ask for
+DEFAULT_ENCODING = "json"
+SLOW_CONSUMER_CLOSE_CODE = 1013  # "Try again later": clients reconnect and get a fresh initial_status
+
+# State snapshots: only the newest value matters, so a newer one replaces any still pending
+LATEST_VALUE_TYPES = frozenset({
+    "screenshot_update", "docker_containers", "settings_updated", "viewer_list_update", "status_update",
+})
+
+
+# Topic of each event type. Overlays subscribe to "chat" and "overlay" only.
+EVENT_TOPICS = {
+    "kick_chat_message": "chat",
+    "twitch_chat_message": "chat",
+    "kick_chat_batch": "chat",
+    "chat_resume": "chat",
+    "kick_overlay_command": "overlay",
+    "screenshot_update": "screenshot",
+    "screenshot_interval_updated": "screenshot",
+    "docker_containers": "docker",
+    "settings_updated": "settings",
+    "setting_updated": "settings",
+    "settings_imported": "settings",
+    "settings_exported": "settings",
+    "obs_dimensions_updated": "settings",
+    "raffle_entry": "viewers",
+    "raffle_entries_cleared": "viewers",
+    "viewer_list_update": "viewers",
+    "selected_viewers_update": "viewers",
+    "initial_status": "status",
+    "status_update": "status",
+    "kick_chat_connected": "status",
+    "kick_chat_disconnected": "status",
+    "kick_channels": "status",
+    "websocket_stats": "status",
+    "error": "status",
+    "info": "status",
+}
+DEFAULT_TOPIC = "status"  # Topic of event types not listed above
+TOPICS = frozenset(EVENT_TOPICS.values())
+
+# Priority class of each event type (see utils/priority_scheduler.py); chat events are "chat"
+EVENT_PRIORITIES = {
+    "kick_overlay_command": "control",
+    "obs_dimensions_updated": "control",
+    "kick_chat_connected": "control",
+    "kick_chat_disconnected": "control",
+    "error": "control",
+    "screenshot_update": "bulk",
+    "docker_containers": "bulk",
+    "settings_exported": "bulk",
+}
+DEFAULT_PRIORITY = "status"  # Priority class of event types not listed above (raffle, viewers, settings...)
+
+
+def event_topic(event_type):
+    """The topic an event type is delivered under."""
+    if not event_type:
+        return DEFAULT_TOPIC
+    topic = EVENT_TOPICS.get(event_type)
+    if topic:
+        return topic
+    return "screenshot" if "desktop_view" in event_type else DEFAULT_TOPIC
+
+
+def priority_class(event_type):
+    """The priority class an event type is scheduled in."""
+    if is_chat_event(event_type):
+        return "chat"
+    if not event_type:
+        return DEFAULT_PRIORITY
+    priority = EVENT_PRIORITIES.get(event_type)
+    if priority:
+        return priority
+    return "bulk" if "desktop_view" in event_type else DEFAULT_PRIORITY
+
+
+def parse_topics(value):
+    """
+    Parse a topic subscription ("chat,overlay", ["chat", "overlay"] or "*").
+
+    Returns:
+        A frozenset of known topics, or None for "every topic" (also when nothing
+        usable was given, so a typo never leaves a client receiving nothing).
+    """
+    if value is None:
+        return None
+    names = value.split(",") if isinstance(value, str) else value
+    topics = set()
+    for name in names:
+        name = str(name).strip().lower()
+        if name == "*":
+            return None
+        if name in TOPICS:
+            topics.add(name)
+        elif name:
+            logger.warning(f"Ignoring unknown WebSocket topic '{name}'")
+    return frozenset(topics) or None
+
+
+class EncodedEvent(str):
+    """
+    An event's JSON text that can also give its MessagePack frame.
+
+    The frame is packed from the event object itself (never by parsing the JSON back),
+    at most once, and shared by every MessagePack client. A kick_chat_batch frame is
+    packed by joining its members' frames, like its JSON is joined.
+    """
+
+    def __new__(cls, text, event=None, members=None):
+        self = super().__new__(cls, text)
+        self._source = event if members is None else members  # Released once packed
+        self._packed = None
+        return self
+
+    @classmethod
+    def from_json(cls, text):
+        """Wrap JSON text that arrived as text (from the relay, or the broadcast() shim); None if it is not JSON."""
+        try:
+            return cls(text, orjson.loads(text) if ORJSON_AVAILABLE else json.loads(text))
+        except (TypeError, ValueError):
+            return None
+
+    def packed(self):
+        """The MessagePack frame (None if the event cannot be packed: it is then sent as text)."""
+        if self._packed is None and self._source is not None and MSGPACK_AVAILABLE:
+            source, self._source = self._source, None
+            try:
+                if isinstance(source, list):
+                    self._packed = _pack_chat_batch([member.packed() for member in source])
+                else:
+                    self._packed = msgpack.packb(source)
+            except (TypeError, ValueError, OverflowError):  # e.g. an int beyond 64 bits
+                pass
+        return self._packed
+
+
+def _pack_chat_batch(frames):
+    """{"type": "kick_chat_batch", "data": {"messages": [...]}} from already packed events (None if one is missing)."""
+    if any(frame is None for frame in frames):
+        return None
+    count = len(frames)
+    if count < 16:
+        header = bytes([0x90 | count])
+    elif count < 0x10000:
+        header = b"\xdc" + count.to_bytes(2, "big")
+    else:
+        header = b"\xdd" + count.to_bytes(4, "big")
+    return _CHAT_BATCH_PREFIX + header + b"".join(frames)
+
+
+def encode_event(event_type, payload, seq=None, pack=False):
+    """
+    Serialize an event to the {"type": ..., "data": ...} JSON text clients expect.
+
+    Uses orjson when available (several times faster than json.dumps); falls back to
+    json for anything orjson rejects, so both produce the same object.
+    A chat event's sequence number is added as {"type": ..., "seq": ..., "data": ...}.
+    Returns an EncodedEvent: pack=True also packs its MessagePack frame right away
+    (while the payload is known to be unchanged), else it is packed on first use.
+    """
+    event = {"type": event_type, "data": payload} if seq is None else {"type": event_type, "seq": seq, "data": payload}
+    text = None
+    if ORJSON_AVAILABLE:
+        try:
+            text = orjson.dumps(event, option=orjson.OPT_NON_STR_KEYS).decode()
+        except TypeError:  # orjson.JSONEncodeError, e.g. an int too large for 64 bits
+            pass
+    message = EncodedEvent(text if text is not None else json.dumps(event), event)
+    if pack:
+        message.packed()
+    return message
+
+
+def parse_encoding(value):
+    """
+    Parse a requested frame encoding ("json" or "msgpack").
+
+    Falls back to JSON for anything unknown, and for "msgpack" when the msgpack
+    package is not installed (the clients decode both kinds of frame).
+    """
+    encoding = str(value or DEFAULT_ENCODING).strip().lower()
+    if encoding not in ENCODINGS:
+        logger.warning(f"Ignoring unknown WebSocket encoding '{value}'")
+        return DEFAULT_ENCODING
+    if encoding == "msgpack" and not MSGPACK_AVAILABLE:
+        logger.warning("MessagePack frames requested but msgpack is not installed; sending JSON")
+        return DEFAULT_ENCODING
+    return encoding
+
+
+def _message_type(message):
+    """Best-effort "type" of a JSON message (None if it is not a JSON object)."""
+    try:
+        msg_data = json.loads(message)
+    except (TypeError, ValueError):
+        return None
+    return msg_data.get("type") if isinstance(msg_data, dict) else None
+
+
+def is_chat_event(msg_type):
+    return msg_type == "kick_chat_message" or (msg_type is not None and "twitch_chat_message" in msg_type)
+
+
+def is_latest_value(msg_type):
+    return msg_type in LATEST_VALUE_TYPES or (msg_type is not None and "desktop_view" in msg_type)
+
+
+def conflation_key(msg_type):
+    """Key under which newer values replace older ones (None = every message is delivered)."""
+    return msg_type if is_latest_value(msg_type) else None
+
+
+class ClientConnection:
+    """
+    Outbound side of one WebSocket client: a bounded queue drained by a writer task.
+
+    Args:
+        websocket: The accepted WebSocket.
+        max_queue: Messages allowed to wait before the slow-consumer policy applies.
+        policy: "drop_oldest" or "disconnect".
+        send_timeout: Seconds a send may stay in progress before a full queue
+            disconnects the client as stalled instead of applying the policy.
+        on_close: Called with the websocket when the writer gives up on the client.
+        encoding: "json" (text frames) or "msgpack" (binary frames).
+    """
+
+    def __init__(self, websocket, max_queue=DEFAULT_SEND_QUEUE_SIZE, policy=DEFAULT_SLOW_CONSUMER_POLICY,
+                 send_timeout=DEFAULT_SEND_TIMEOUT, on_close=None, encoding=DEFAULT_ENCODING):
+        self.websocket = websocket
+        self.encoding = encoding
+        self.topics = None  # Subscribed topics; None = every topic (maintained by ConnectionManager)
+        self.max_queue = max(1, max_queue)
+        self.policy = policy
+        self.send_timeout = send_timeout
+        self.on_close = on_close
+        self._queue = deque()  # [message, type, conflation key] entries in send order
+        self._latest = {}  # conflation key -> its entry still waiting in the queue
+        self._ready = asyncio.Event()
+        self.closed = False
+        self._send_started = None  # monotonic time the in-flight send began
+        self.sent = 0
+        self.dropped = 0  # Messages discarded because the queue was full
+        self.coalesced = 0  # Queued snapshots replaced by a newer one
+        self.writer_task = asyncio.create_task(self._writer())
+
+    def enqueue(self, message, msg_type=None):
+        """Queue a message for this client without waiting. Returns False if the client is closed."""
+        if self.closed:
+            return False
+        key = conflation_key(msg_type)
+        if key is not None:
+            entry = self._latest.get(key)
+            if entry is not None:
+                entry[0] = message  # Replace the stale snapshot where it waits
+                self.coalesced += 1
+                return True
+        if len(self._queue) >= self.max_queue:
+            if self._send_started is not None and time.monotonic() - self._send_started > self.send_timeout:
+                logger.error(f"Send to {self.websocket.client} stalled for over {self.send_timeout}s; disconnecting it")
+                self.close(code=SLOW_CONSUMER_CLOSE_CODE)
+                return False
+            self._apply_policy()
+            if self.closed:
+                return False
+        entry = [message, msg_type, key]
+        self._queue.append(entry)
+        if key is not None:
+            self._latest[key] = entry
+        self._ready.set()
+        return True
+
+    def _pop(self):
+        """Take the oldest queued entry (and forget it as its key's pending snapshot)."""
+        entry = self._queue.popleft()
+        if entry[2] is not None and self._latest.get(entry[2]) is entry:
+            del self._latest[entry[2]]
+        return entry
+
+    def _apply_policy(self):
+        """Make room in a full queue according to the slow-consumer policy."""
+        if self.policy == "disconnect":
+            logger.warning(f"Disconnecting slow WebSocket client {self.websocket.client}: {len(self._queue)} messages pending")
+            self.close(code=SLOW_CONSUMER_CLOSE_CODE)
+            return
+        # drop_oldest
+        self._pop()
+        self.dropped += 1
+        if self.dropped == 1 or self.dropped % 100 == 0:
+            logger.warning(f"WebSocket client {self.websocket.client} is falling behind: {self.dropped} messages dropped")
+
+    def close(self, code=None):
+        """
+        Stop the writer and discard pending messages.
+
+        Args:
+            code: If given, also close the WebSocket with this close code (so the
+                client notices and reconnects); None when the socket is already broken.
+        """
+        if self.closed:
+            return
+        self.closed = True
+        self._queue.clear()
+        self._latest.clear()
+        if self.writer_task is not asyncio.current_task():
+            self.writer_task.cancel()
+        if code is not None:
+            asyncio.create_task(self._close_socket(code))
+        if self.on_close:
+            self.on_close(self.websocket)
+
+    async def _close_socket(self, code):
+        try:
+            await self.websocket.close(code=code)
+        except Exception as e:
+            logger.debug(f"Error closing WebSocket {self.websocket.client}: {e}")
+
+    async def _writer(self):
+        while True:
+            if not self._queue:
+                self._ready.clear()
+                await self._ready.wait()
+                continue
+            message = self._pop()[0]
+            # No wait_for here: it costs a task per message. Stalls are detected in enqueue().
+            self._send_started = time.monotonic()
+            try:
+                frame = message.packed() if self.encoding == "msgpack" and isinstance(message, EncodedEvent) else None
+                if frame is not None:
+                    await self.websocket.send_bytes(frame)
+                else:
+                    await self.websocket.send_text(message)
+                self.sent += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error sending message to {self.websocket.client}: {e}")
+                # Disconnect problematic clients
+                self.close()
+                return
+            finally:
+                self._send_started = None
+
+    def stats(self):
+        return {
+            "client": str(self.websocket.client),
+            "topics": sorted(self.topics) if self.topics is not None else ["*"],
+            "encoding": self.encoding,
+            "queue_depth": len(self._queue),
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "coalesced": self.coalesced,
+        }
+
+
+class ConnectionManager:
+    """
+    Registry of connected WebSocket clients and the broadcast workers.
+
+    Args:
+        send_queue_size: Per-client queue bound (None = "websocket.send_queue_size" setting).
+        slow_consumer_policy: Per-client policy (None = "websocket.slow_consumer_policy" setting).
+        send_timeout: Per-send timeout in seconds (None = "websocket.send_timeout" setting).
+        chat_batch_window: Chat batch window in seconds, 0 disables batching
+            (None = "websocket.chat_batch_window_ms" setting).
+        chat_batch_max: Most chat messages per batch frame (None = "websocket.chat_batch_max" setting).
+        replay_buffer_size: Chat events kept for resuming clients (None = "websocket.replay_buffer_size" setting).
+        priority_weights: Priority class -> weight (None = "websocket.priority_weights" setting).
+        priority_queue_sizes: Priority class -> queue bound (None = "websocket.priority_queue_sizes" setting).
+        event_bus: Bus published events travel through (None = the "event_bus" settings).
+    """
+
+    def __init__(self, send_queue_size=None, slow_consumer_policy=None, send_timeout=None,
+                 chat_batch_window=None, chat_batch_max=None, replay_buffer_size=None,
+                 priority_weights=None, priority_queue_sizes=None, event_bus=None):
+        self.active_connections: list[WebSocket] = []
+        self._clients: dict[WebSocket, ClientConnection] = {}
+        self._all_topics: set[ClientConnection] = set()  # Clients receiving every topic
+        self._msgpack_clients = 0  # Connected clients receiving MessagePack frames
+        self._subscribers: defaultdict[str, set[ClientConnection]] = defaultdict(set)  # topic -> clients
+        self._send_queue_size = send_queue_size
+        self._slow_consumer_policy = slow_consumer_policy
+        self._send_timeout = send_timeout
+        self._loop = asyncio.get_running_loop()
+        if priority_weights is None:
+            priority_weights = settings.get_setting("websocket.priority_weights", None)
+        if priority_queue_sizes is None:
+            priority_queue_sizes = settings.get_setting("websocket.priority_queue_sizes", None)
+        self._scheduler = WeightedScheduler(
+            priority_weights if isinstance(priority_weights, dict) else None,
+            priority_queue_sizes if isinstance(priority_queue_sizes, dict) else None,
+        )
+        self._chat_batch_window = chat_batch_window
+        self._chat_batch_max = chat_batch_max
+        self.chat_frames = 0  # Chat frames broadcast (single messages or batches)
+        self.chat_messages = 0  # Chat messages broadcast
+        self.last_seq = 0  # Sequence number of the newest chat event published
+        self.refused_chat = 0  # Chat events dropped because this process does not publish chat
+        if replay_buffer_size is None:
+            try:
+                replay_buffer_size = int(settings.get_setting("websocket.replay_buffer_size", DEFAULT_REPLAY_BUFFER_SIZE))
+            except (TypeError, ValueError):
+                replay_buffer_size = DEFAULT_REPLAY_BUFFER_SIZE
+        self._chat_history = deque(maxlen=max(1, replay_buffer_size))  # (seq, message, type) of broadcast chat
+        if event_bus is None:
+            event_bus = create_event_bus(
+                settings.get_setting("event_bus.backend", "local"),
+                settings.get_setting("event_bus.address", DEFAULT_RELAY_ADDRESS),
+            )
+        self._bus = event_bus
+        self._bus.start(self._deliver)
+        # Start the broadcast worker
+        self._worker_tasks = [asyncio.create_task(self._dispatch_worker())]
+
+    def _client_options(self):
+        """Queue bound, policy and send timeout for a new client (explicit arguments win over settings)."""
+        max_queue = self._send_queue_size
+        if max_queue is None:
+            try:
+                max_queue = int(settings.get_setting("websocket.send_queue_size", DEFAULT_SEND_QUEUE_SIZE))
+            except (TypeError, ValueError):
+                max_queue = DEFAULT_SEND_QUEUE_SIZE
+        policy = self._slow_consumer_policy or settings.get_setting("websocket.slow_consumer_policy", DEFAULT_SLOW_CONSUMER_POLICY)
+        policy = SLOW_CONSUMER_POLICY_ALIASES.get(policy, policy)
+        if policy not in SLOW_CONSUMER_POLICIES:
+            logger.warning(f"Unknown slow consumer policy '{policy}', using '{DEFAULT_SLOW_CONSUMER_POLICY}'")
+            policy = DEFAULT_SLOW_CONSUMER_POLICY
+        send_timeout = self._send_timeout
+        if send_timeout is None:
+            try:
+                send_timeout = float(settings.get_setting("websocket.send_timeout", DEFAULT_SEND_TIMEOUT))
+            except (TypeError, ValueError):
+                send_timeout = DEFAULT_SEND_TIMEOUT
+        return max_queue, policy, send_timeout
+
+    def _chat_batch_options(self):
+        """Chat batch window (seconds) and maximum batch size (explicit arguments win over settings)."""
+        window = self._chat_batch_window
+        if window is None:
+            try:
+                window = float(settings.get_setting("websocket.chat_batch_window_ms", DEFAULT_CHAT_BATCH_WINDOW * 1000)) / 1000
+            except (TypeError, ValueError):
+                window = DEFAULT_CHAT_BATCH_WINDOW
+        max_batch = self._chat_batch_max
+        if max_batch is None:
+            try:
+                max_batch = int(settings.get_setting("websocket.chat_batch_max", DEFAULT_CHAT_BATCH_MAX))
+            except (TypeError, ValueError):
+                max_batch = DEFAULT_CHAT_BATCH_MAX
+        return max(0.0, window), max(1, max_batch)
+
+    async def connect(self, websocket: WebSocket, topics=None, encoding=DEFAULT_ENCODING, resume_from=None):
+        """
+        Accept a client and register it.
+
+        Args:
+            websocket: The WebSocket to accept.
+            topics: Topics to deliver to it (see parse_topics); None = every topic.
+            encoding: Frame encoding for it (see parse_encoding).
+            resume_from: Seq of the last chat event the client rendered before it
+                reconnected; the chat it missed is queued for it first (see _resume_chat).
+        """
+        await websocket.accept()
+        max_queue, policy, send_timeout = self._client_options()
+        client = ClientConnection(websocket, max_queue, policy, send_timeout, on_close=self.disconnect, encoding=encoding)
+        self._clients[websocket] = client
+        if encoding == "msgpack":
+            self._msgpack_clients += 1
+        self._set_client_topics(client, topics)
+        self.active_connections.append(websocket)
+        logger.info(f"WebSocket connected: {websocket.client} (topics: {', '.join(sorted(topics)) if topics else 'all'}, encoding: {encoding})")
+        if resume_from is not None and (client.topics is None or "chat" in client.topics):
+            self._resume_chat(client, resume_from)
+
+    def _resume_chat(self, client, resume_from):
+        """
+        Queue a chat_resume event and the buffered chat events after resume_from for a client.
+
+        Chat published but not broadcast yet is not in the buffer; the chat worker
+        delivers it to the client like to everyone else, after the replayed events.
+        """
+        history = self._chat_history
+        if resume_from > self.last_seq:
+            resume_from = 0  # Seq from before a server restart: replay everything buffered
+            complete = False
+        else:
+            complete = not history or history[0][0] <= resume_from + 1
+        missed = [(message, msg_type) for seq, message, msg_type in history if seq > resume_from]
+        client.enqueue(encode_event("chat_resume", {
+            "resume_from": resume_from,
+            "replayed": len(missed),
+            "last_seq": history[-1][0] if history else resume_from,
+            "complete": complete,  # False: some missed chat is older than the buffer
+        }), "chat_resume")
+        _, max_batch = self._chat_batch_options()
+        for start in range(0, len(missed), max_batch):
+            message, msg_type = self._chat_frame(missed[start:start + max_batch])
+            client.enqueue(message, msg_type)
+        logger.info(f"Resumed chat for {client.websocket.client} from seq {resume_from}: {len(missed)} events replayed")
+
+    def set_topics(self, websocket: WebSocket, topics):
+        """Replace a connected client's subscription (None = every topic). Returns False if it is not connected."""
+        client = self._clients.get(websocket)
+        if not client:
+            return False
+        self._set_client_topics(client, topics)
+        return True
+
+    def subscriber_count(self, topic):
+        """How many connected clients receive a topic (safe to call from other threads)."""
+        return len(self._all_topics) + len(self._subscribers.get(topic, ()))
+
+    def wants(self, websocket: WebSocket, event_type):
+        """Whether a connected client is subscribed to an event type's topic."""
+        client = self._clients.get(websocket)
+        return bool(client) and (client.topics is None or event_topic(event_type) in client.topics)
+
+    def _set_client_topics(self, client, topics):
+        self._remove_from_topics(client)
+        client.topics = frozenset(topics) if topics is not None else None
+        if client.topics is None:
+            self._all_topics.add(client)
+        else:
+            for topic in client.topics:
+                self._subscribers[topic].add(client)
+
+    def _remove_from_topics(self, client):
+        self._all_topics.discard(client)
+        for topic in client.topics or ():
+            self._subscribers[topic].discard(client)
+
+    def disconnect(self, websocket: WebSocket):
+        client = self._clients.pop(websocket, None)
+        if client:
+            if client.encoding == "msgpack":
+                self._msgpack_clients -= 1
+            self._remove_from_topics(client)
+            client.close()
+        if websocket in self.active_connections:
+            self.active_connections.remove(websocket)
+            logger.info(f"WebSocket disconnected: {websocket.client}")
+
+    async def send_personal_message(self, message: str, websocket: WebSocket, msg_type=None):
+        client = self._clients.get(websocket)
+        if client:
+            # Through the client's queue, so it stays ordered with broadcasts
+            client.enqueue(message, msg_type or _message_type(message))
+            return
+        try:
+            await websocket.send_text(message)
+        except Exception as e:
+            logger.error(f"Error sending personal message to {websocket.client}: {e}")
+            # Disconnect problematic client
+            self.disconnect(websocket)
+
+    async def publish(self, event_type: str, payload):
+        """
+        Send an event to every client.
+
+        Args:
+            event_type: The event "type" clients dispatch on (e.g. "kick_chat_message").
+            payload: The JSON-serializable event "data".
+        """
+        # Serialized once per event: JSON text, plus the MessagePack frame if anyone receives those
+        pack = self._msgpack_clients > 0
+        if is_chat_event(event_type):
+            if not self._bus.publishes_chat:
+                # Another process numbers the chat seqs: ours would collide with its
+                self.refused_chat += 1
+                if self.refused_chat == 1 or self.refused_chat % 100 == 0:
+                    logger.error("Dropping chat published by a process that does not host the event relay")
+                return
+            self.last_seq += 1
+            await self._bus.publish(encode_event(event_type, payload, self.last_seq, pack), event_type, self.last_seq)
+            return
+        await self._bus.publish(encode_event(event_type, payload, pack=pack), event_type)
+
+    def publish_threadsafe(self, event_type: str, payload, local=False):
+        """
+        Publish from a thread other than the event loop's (e.g. the screenshot thread).
+
+        The event is encoded in the calling thread and published on the manager's loop
+        (chat is encoded on the loop, where its sequence number is assigned).
+        Returns the concurrent.futures.Future of the publishing coroutine.
+
+        Args:
+            local: Deliver to this process's clients only, bypassing the event bus
+                (for events about state only this process holds; ignored for chat).
+        """
+        if is_chat_event(event_type):
+            return asyncio.run_coroutine_threadsafe(self.publish(event_type, payload), self._loop)
+        message = encode_event(event_type, payload, pack=self._msgpack_clients > 0)
+        deliver = self._deliver if local else self._bus.publish
+        return asyncio.run_coroutine_threadsafe(deliver(message, event_type), self._loop)
+
+    async def send_event(self, websocket: WebSocket, event_type: str, payload):
+        """Send an event to one client (the typed counterpart of send_personal_message)."""
+        await self.send_personal_message(encode_event(event_type, payload), websocket, event_type)
+
+    async def broadcast(self, message: str):
+        """Send a pre-serialized JSON message to every client (compatibility shim for publish)."""
+        msg_type = _message_type(message)
+        if is_chat_event(msg_type):
+            # Re-encoded with its sequence number
+            await self.publish(msg_type, json.loads(message).get("data"))
+            return
+        await self._bus.publish(message, msg_type)
+
+    async def _deliver(self, message: str, msg_type, seq=None):
+        """Route an event arriving from the bus (published by this or another process) to local clients."""
+        if seq is not None and seq > self.last_seq:
+            self.last_seq = seq  # Chat published elsewhere: keep resume_from checks in step
+        if not isinstance(message, EncodedEvent) and self._msgpack_clients:
+            # Arrived as text (another process, or broadcast()): decoded once here for all MessagePack clients
+            message = EncodedEvent.from_json(message) or message
+        await self._route(message, msg_type, seq)
+
+    async def _route(self, message: str, msg_type, seq=None):
+        """Queue an encoded message (and a chat event's seq) in its priority class."""
+        # Snapshots replace any older value of the same type that has not been broadcast yet
+        await self._scheduler.put(priority_class(msg_type), message, msg_type, seq, conflation_key(msg_type))
+
+    async def _direct_broadcast(self, message: str, msg_type=None):
+        """Immediately queue a message for every client subscribed to its topic (never waits on a client)."""
+        # Only log non-screenshot messages
+        if not is_latest_value(msg_type):
+            logger.debug(f"Direct broadcasting message: {message[:100]}...")
+        topic_subscribers = self._subscribers.get(event_topic(msg_type), ())
+        # Copies: a full queue may disconnect its client. A client is in exactly one of the two sets.
+        for client in [*self._all_topics, *topic_subscribers]:
+            client.enqueue(message, msg_type)
+
+    def stats(self):
+        """Per-client queue depth and counters."""
+        return [client.stats() for client in self._clients.values()]
+
+    def scheduler_stats(self):
+        """Per priority class queue depth, dispatch count and wait times."""
+        return self._scheduler.stats()
+
+    @property
+    def publishes_chat(self):
+        """Whether this process runs the chat ingest (always on the local bus; on a relay, only its host)."""
+        return self._bus.publishes_chat
+
+    @publishes_chat.setter
+    def publishes_chat(self, value):
+        self._bus.publishes_chat = value
+
+    def bus_stats(self):
+        """Event bus backend and counters."""
+        return self._bus.stats()
+
+    async def shutdown(self):
+        """Stop the broadcast worker and client writers (messages still queued are dropped)."""
+        writers = [client.writer_task for client in self._clients.values()]
+        for websocket in list(self._clients):
+            self.disconnect(websocket)
+        for task in self._worker_tasks:
+            task.cancel()
+        await self._bus.close()
+        await asyncio.gather(*self._worker_tasks, *writers, return_exceptions=True)
+
+    async def _dispatch_worker(self):
+        """Worker that broadcasts the scheduler's next entries, class by class according to their weights."""
+        chat = self._scheduler.classes["chat"]
+        while True:
+            try:
+                chat.batch_window, chat.batch_max = self._chat_batch_options()
+                class_name, entries = await self._scheduler.get()
+                if class_name == "chat":
+                    await self._broadcast_chat(entries)
+                else:
+                    for entry in entries:
+                        await self._direct_broadcast(entry[0], entry[1])
+                # Yield so producers and the client writers run between dispatches
+                await asyncio.sleep(0)
+            except Exception as e:
+                logger.error(f"Error in broadcast dispatch worker: {e}")
+                await asyncio.sleep(0.1)
+
+    async def _broadcast_chat(self, batch):
+        """Broadcast one chat message as is, or several as one kick_chat_batch frame, and keep them for replay."""
+        self.chat_frames += 1
+        self.chat_messages += len(batch)
+        for message, msg_type, seq, *_ in batch:
+            if seq is not None:
+                self._chat_history.append((seq, message, msg_type))
+        message, msg_type = self._chat_frame([(entry[0], entry[1]) for entry in batch])
+        await self._direct_broadcast(message, msg_type)
+
+    @staticmethod
+    def _chat_frame(events):
+        """One encoded chat event as is, or several as one kick_chat_batch frame."""
+        if len(events) == 1:
+            return events[0]
+        # The entries are already encoded events: join them instead of decoding and re-encoding
+        messages = [message for message, _ in events]
+        text = '{"type":"kick_chat_batch","data":{"messages":[' + ",".join(messages) + "]}}"
+        if all(isinstance(message, EncodedEvent) for message in messages):
+            return EncodedEvent(text, members=messages), "kick_chat_batch"
+        return text, "kick_chat_batch"
@@ -0,0 +1,142 @@
+"""
+Bounded, insertion-ordered deduplication cache used by the Kick chat ingest.
+
+Entries live in an OrderedDict, so membership checks, inserts and evictions of
+the oldest entry are all O(1), and eviction always removes the entry that was
+seen least recently (unlike trimming an unordered set).
+
+With a `window` (seconds), the cache is also a sliding time window: a key that
+has not been seen for longer than the window is forgotten, so it counts as new
+again the next time it appears.
+
+With a `sequence_window` (a number of new keys), add() also treats a key as new
+again once that many other new keys have arrived since it was last seen. The Kick
+ingest uses it for its (data-index, fingerprint) keys: a row still on screen is
+seen again every capture, while an identical message posted at the same index
+after the index wrapped can only come back after half the index range or more
+has scrolled past, however fast the chat is.
+"""
+
+import time
+from collections import OrderedDict
+
+
+class BoundedDedupCache:
+    """
+    An LRU-ordered key/value store capped at `maxsize` entries, with hit/miss counters.
+
+    `add()` is the dedup primitive: it records a key and reports whether it was new.
+    Item assignment and `get()` let the same structure hold small per-key values
+    (e.g. the last timestamp seen at a chat index).
+
+    Args:
+        maxsize: Maximum number of entries kept.
+        window: Optional sliding window in seconds. Entries not seen within the
+            window expire; None keeps entries until they are evicted by size.
+        clock: Time source for the window (monotonic seconds).
+        sequence_window: Optional number of new keys after which add() counts an
+            entry not seen in the meantime as new again.
+    """
+
+    def __init__(self, maxsize, window=None, clock=time.monotonic, sequence_window=None):
+        if maxsize < 1:
+            raise ValueError("maxsize must be at least 1")
+        self.maxsize = maxsize
+        self.window = window
+        self.sequence_window = sequence_window
+        self._clock = clock
+        self._entries = OrderedDict()  # key -> (value, last_seen, misses when last seen)
+        self.hits = 0  # add() calls for keys already present (duplicates)
+        self.misses = 0  # add() calls for new keys
+        self.evictions = 0  # Entries dropped because the cache was full
+        self.expirations = 0  # Entries dropped because they fell out of the window
+        self.reappeared = 0  # add() calls that found a key outside the sequence window (counted as new)
+
+    def _expire(self, now):
+        """Drop entries last seen before the window. They are ordered by last sighting, so stop at the first live one."""
+        if self.window is None:
+            return
+        cutoff = now - self.window
+        entries = self._entries
+        while entries:
+            key, (_, last_seen, _) = next(iter(entries.items()))
+            if last_seen >= cutoff:
+                break
+            del entries[key]
+            self.expirations += 1
+
+    def add(self, key, value=True):
+        """
+        Record `key`, refreshing its position (and window) if it is already present.
+
+        Returns:
+            bool: True if the key was new (a miss), False if it was a duplicate (a hit).
+        """
+        now = self._clock()
+        self._expire(now)
+        entries = self._entries
+        entry = entries.get(key)
+        if entry is not None:
+            if self.sequence_window is None or self.misses - entry[2] <= self.sequence_window:
+                entries[key] = (entry[0], now, self.misses)
+                entries.move_to_end(key)
+                self.hits += 1
+                return False
+            del entries[key]  # Out of the sequence window: a new occurrence of the same key
+            self.reappeared += 1
+        self.misses += 1
+        self._insert(key, value, now)
+        return True
+
+    def _insert(self, key, value, now):
+        self._entries[key] = (value, now, self.misses)
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)  # Drop the least recently seen entry
+            self.evictions += 1
+
+    def get(self, key, default=None):
+        self._expire(self._clock())
+        entry = self._entries.get(key)
+        return default if entry is None else entry[0]
+
+    def __setitem__(self, key, value):
+        now = self._clock()
+        self._expire(now)
+        if key in self._entries:
+            self._entries[key] = (value, now, self.misses)
+            self._entries.move_to_end(key)
+        else:
+            self._insert(key, value, now)
+
+    def __getitem__(self, key):
+        self._expire(self._clock())
+        return self._entries[key][0]
+
+    def __contains__(self, key):
+        self._expire(self._clock())
+        return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        """Drop all entries and reset the counters."""
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.reappeared = 0
+
+    def stats(self):
+        """Return the cache counters as a dict (for logging/metrics)."""
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "window": self.window,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "reappeared": self.reappeared,
+        }
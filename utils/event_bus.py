@@ -0,0 +1,297 @@
+"""
+Event bus backends for ConnectionManager.
+
+ConnectionManager.publish() hands every encoded event to its bus, and the bus
+delivers it back to the manager of every process that serves clients:
+
+- LocalEventBus (default): delivery is a direct call, for a single app process.
+- RelayEventBus: events go through an EventRelay that forwards every event to
+  every connected process, the publisher included. One ingest process can then
+  feed several uvicorn workers, or replicas behind a load balancer, each of
+  which serves its own dashboards and overlays.
+
+The relay listens on a Unix socket ("unix:/path") or TCP ("tcp://host:port").
+It can be hosted by one app process (event_bus.host_relay) or run standalone:
+
+    python -m utils.event_bus unix:/tmp/chattastic-events.sock
+
+Each event is sent as one line, "<type>\\t<seq>\\t<encoded event>\\n". Encoded
+events are JSON text, which never holds a raw newline or tab inside a string,
+so other whitespace can simply become spaces.
+
+Chat is published by one process only: the one hosting the relay. Chat seqs
+are counted per process and Kick push tokens live in that process's sessions,
+so a second publisher would reuse seqs and a page's ingest socket could reach
+a worker that does not know its token. RelayEventBus(publishes_chat=True) marks
+the hosting process; every other worker refuses Kick connects and ingest, and
+a standalone relay carries everything but chat.
+
+While the relay is unreachable, a RelayEventBus delivers its own events
+locally and keeps reconnecting, so a worker never goes silent for its clients.
+"""
+
+import argparse
+import asyncio
+import errno
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+EVENT_BUS_BACKENDS = ("local", "relay")
+DEFAULT_RELAY_ADDRESS = "unix:/tmp/chattastic-events.sock"
+RECONNECT_DELAYS = (0.5, 1, 2, 5)  # Seconds between attempts to reach the relay (the last one repeats)
+MAX_RELAY_BUFFER = 4 * 1024 * 1024  # Bytes a relay peer may have unsent before it is dropped as stuck
+
+
+def encode_frame(message, msg_type=None, seq=None):
+    """One bus line for an encoded event."""
+    if "\n" in message or "\t" in message:
+        message = message.replace("\n", " ").replace("\t", " ")
+    return f"{msg_type or ''}\t{'' if seq is None else seq}\t{message}\n".encode()
+
+
+def decode_frame(line):
+    """(message, type, seq) from a bus line."""
+    msg_type, seq, message = line.decode().rstrip("\n").split("\t", 2)
+    return message, msg_type or None, int(seq) if seq else None
+
+
+def parse_address(address):
+    """
+    Split a relay address into ("unix", path) or ("tcp", (host, port)).
+
+    Raises:
+        ValueError: For anything else.
+    """
+    address = address or DEFAULT_RELAY_ADDRESS
+    if address.startswith("unix:"):
+        return "unix", address[len("unix:"):]
+    if address.startswith("tcp://"):
+        host, _, port = address[len("tcp://"):].rpartition(":")
+        return "tcp", (host or "127.0.0.1", int(port))
+    raise ValueError(f"Relay address must be unix:<path> or tcp://<host>:<port>, got '{address}'")
+
+
+async def open_relay_connection(address):
+    kind, target = parse_address(address)
+    if kind == "unix":
+        return await asyncio.open_unix_connection(target)
+    return await asyncio.open_connection(*target)
+
+
+class LocalEventBus:
+    """In-process bus: publishing delivers straight to this process's manager."""
+
+    publishes_chat = True  # The only process, so it runs the chat ingest
+
+    def __init__(self):
+        self._deliver = None
+
+    def start(self, deliver):
+        """
+        Args:
+            deliver: Coroutine function (message, type, seq) routing an event to local clients.
+        """
+        self._deliver = deliver
+
+    async def publish(self, message, msg_type=None, seq=None):
+        await self._deliver(message, msg_type, seq)
+
+    async def close(self):
+        pass
+
+    def stats(self):
+        return {"backend": "local"}
+
+
+class RelayEventBus:
+    """
+    Bus through an EventRelay: published events reach every process connected to it.
+
+    Args:
+        address: The relay's address (see parse_address).
+        publishes_chat: Whether this process runs the chat ingest (only the one hosting the relay does).
+    """
+
+    def __init__(self, address=DEFAULT_RELAY_ADDRESS, publishes_chat=False):
+        parse_address(address)  # Fail early on a malformed address
+        self.address = address
+        self.publishes_chat = publishes_chat
+        self._deliver = None
+        self._writer = None
+        self._task = None
+        self.published = 0  # Events sent to the relay
+        self.received = 0  # Events delivered from the relay
+        self.local_fallbacks = 0  # Events delivered locally because the relay was unreachable
+
+    @property
+    def connected(self):
+        return self._writer is not None
+
+    def start(self, deliver):
+        """Start connecting to the relay (in the background, reconnecting whenever it drops)."""
+        self._deliver = deliver
+        self._task = asyncio.create_task(self._run())
+
+    async def publish(self, message, msg_type=None, seq=None):
+        if self._writer is None:
+            self.local_fallbacks += 1
+            if self.local_fallbacks == 1 or self.local_fallbacks % 100 == 0:
+                logger.warning(f"Event relay {self.address} unreachable; delivering events locally only")
+            await self._deliver(message, msg_type, seq)
+            return
+        self._writer.write(encode_frame(message, msg_type, seq))
+        self.published += 1
+        await self._writer.drain()
+
+    async def _run(self):
+        attempt = 0
+        while True:
+            try:
+                reader, writer = await open_relay_connection(self.address)
+            except OSError as e:
+                delay = RECONNECT_DELAYS[min(attempt, len(RECONNECT_DELAYS) - 1)]
+                if attempt == 0:
+                    logger.warning(f"Cannot reach event relay {self.address} ({e}); retrying")
+                attempt += 1
+                await asyncio.sleep(delay)
+                continue
+            logger.info(f"Connected to event relay {self.address}")
+            attempt = 0
+            self._writer = writer
+            try:
+                while line := await reader.readline():
+                    self.received += 1
+                    try:
+                        await self._deliver(*decode_frame(line))
+                    except Exception as e:
+                        logger.error(f"Error delivering event from relay: {e}")
+            except (OSError, asyncio.IncompleteReadError) as e:
+                logger.warning(f"Event relay connection error: {e}")
+            finally:
+                self._writer = None
+                writer.close()
+            logger.warning(f"Lost event relay {self.address}; reconnecting")
+
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        if self._writer:
+            self._writer.close()
+            self._writer = None
+
+    def stats(self):
+        return {
+            "backend": "relay",
+            "address": self.address,
+            "connected": self.connected,
+            "publishes_chat": self.publishes_chat,
+            "published": self.published,
+            "received": self.received,
+            "local_fallbacks": self.local_fallbacks,
+        }
+
+
+class EventRelay:
+    """
+    Forwards every line a connected process sends to all connected processes.
+
+    Args:
+        address: Where to listen (see parse_address). A stale Unix socket file is replaced.
+
+    start() raises OSError with errno EADDRINUSE when a live relay already
+    listens there, so only one process hosts it.
+    """
+
+    def __init__(self, address=DEFAULT_RELAY_ADDRESS):
+        self.address = address
+        self._server = None
+        self._peers = set()
+        self.forwarded = 0
+
+    async def start(self):
+        kind, target = parse_address(self.address)
+        if kind == "unix":
+            await _remove_stale_socket(target)
+            self._server = await asyncio.start_unix_server(self._handle_peer, target)
+        else:
+            self._server = await asyncio.start_server(self._handle_peer, *target)
+        logger.info(f"Event relay listening on {self.address}")
+        return self
+
+    async def _handle_peer(self, reader, writer):
+        self._peers.add(writer)
+        try:
+            while line := await reader.readline():
+                self.forwarded += 1
+                for peer in list(self._peers):
+                    if peer.transport.get_write_buffer_size() > MAX_RELAY_BUFFER:
+                        logger.warning("Dropping an event relay peer that stopped reading")
+                        self._peers.discard(peer)
+                        peer.close()
+                        continue
+                    peer.write(line)
+        except (OSError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self._peers.discard(writer)
+            writer.close()
+
+    async def close(self):
+        if self._server:
+            self._server.close()
+            for peer in list(self._peers):
+                peer.close()
+            await self._server.wait_closed()
+            kind, target = parse_address(self.address)
+            if kind == "unix" and os.path.exists(target):
+                os.unlink(target)
+
+    def stats(self):
+        return {"address": self.address, "peers": len(self._peers), "forwarded": self.forwarded}
+
+
+async def _remove_stale_socket(path):
+    """Unlink a Unix socket file left behind by a relay that has exited; refuse to replace a live one."""
+    try:
+        _, writer = await asyncio.open_unix_connection(path)
+    except (FileNotFoundError, ConnectionRefusedError):
+        pass  # Nothing there, or nobody listening behind the file
+    else:
+        writer.close()
+        raise OSError(errno.EADDRINUSE, f"An event relay is already listening on {path}")
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
+def create_event_bus(backend="local", address=None):
+    """The bus for an event_bus.backend setting ("local" for anything unknown)."""
+    if backend == "relay":
+        return RelayEventBus(address or DEFAULT_RELAY_ADDRESS)
+    if backend != "local":
+        logger.warning(f"Unknown event bus backend '{backend}', using 'local'")
+    return LocalEventBus()
+
+
+async def _serve_relay(address):
+    relay = await EventRelay(address).start()
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await relay.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the event relay shared by several Chattastic processes.")
+    parser.add_argument("address", nargs="?", default=DEFAULT_RELAY_ADDRESS,
+                        help=f"unix:<path> or tcp://<host>:<port> (default: {DEFAULT_RELAY_ADDRESS})")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    try:
+        asyncio.run(_serve_relay(args.address))
+    except KeyboardInterrupt:
+        pass
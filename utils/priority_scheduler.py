@@ -0,0 +1,214 @@
+"""
+Weighted priority scheduling for the events ConnectionManager broadcasts.
+
+Every broadcast event is put in one of a few priority classes (control, chat,
+status, bulk) and a single dispatcher takes them out by smooth weighted
+round-robin: among the classes with something ready, each gets a share of the
+dispatches proportional to its weight. A flood of screenshots can slow chat by
+at most bulk's share, and no class is ever starved.
+
+Each class queue is bounded (a producer waits while its class is full, like
+asyncio.Queue.put), holds at most one pending entry per conflation key (a newer
+snapshot replaces the one still waiting, keeping its place), and records how
+long entries waited, so stats() shows what is holding up which class.
+
+A class can also hold entries back to dispatch them together (chat bursts):
+with a batch window, a lone entry after a quiet period is ready at once, and
+otherwise entries are ready when the window after the oldest one ends or
+batch_max of them are queued.
+"""
+
+import asyncio
+import time
+from collections import deque
+
+PRIORITY_CLASSES = ("control", "chat", "status", "bulk")
+DEFAULT_PRIORITY_WEIGHTS = {"control": 8, "chat": 4, "status": 2, "bulk": 1}
+DEFAULT_PRIORITY_QUEUE_SIZES = {"control": 256, "chat": 2000, "status": 512, "bulk": 64}
+
+
+def _class_option(values, defaults, name):
+    """A class's integer option from a settings dict, or its default if missing or invalid."""
+    try:
+        return int((values or {}).get(name, defaults[name]))
+    except (TypeError, ValueError):
+        return defaults[name]
+
+
+class PriorityClass:
+    """
+    One priority class: a bounded FIFO of [message, type, seq, key, enqueued_at] entries.
+
+    Args:
+        name: Class name (one of PRIORITY_CLASSES).
+        weight: Relative share of dispatches when several classes are ready.
+        max_size: Entries allowed to wait before producers have to.
+        clock: Time source (monotonic seconds).
+    """
+
+    def __init__(self, name, weight=1, max_size=256, clock=time.monotonic):
+        self.name = name
+        self.weight = max(1, int(weight))
+        self.max_size = max(1, int(max_size))
+        self.batch_window = 0.0  # Seconds entries may be held to dispatch them together (0 = one at a time)
+        self.batch_max = 1  # Most entries dispatched together
+        self._clock = clock
+        self._entries = deque()
+        self._keyed = {}  # conflation key -> its entry still waiting
+        self._not_full = asyncio.Event()
+        self._not_full.set()
+        self._last_take = float("-inf")
+        self._current = 0  # Smooth weighted round-robin credit
+        self.dispatched = 0  # Entries taken for dispatch
+        self.conflated = 0  # Entries replaced by a newer value before dispatch
+        self.blocked = 0  # Puts that had to wait for room
+        self.wait_total = 0.0  # Seconds dispatched entries spent queued
+        self.wait_max = 0.0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def put_nowait(self, message, msg_type=None, seq=None, key=None):
+        """Queue an entry, or replace the waiting entry with the same key. Returns False if the class is full."""
+        if key is not None:
+            entry = self._keyed.get(key)
+            if entry is not None:
+                entry[0] = message
+                self.conflated += 1
+                return True
+        if len(self._entries) >= self.max_size:
+            self._not_full.clear()
+            return False
+        entry = [message, msg_type, seq, key, self._clock()]
+        self._entries.append(entry)
+        if key is not None:
+            self._keyed[key] = entry
+        return True
+
+    def ready_at(self):
+        """Time from which the class can be dispatched (None = nothing queued)."""
+        if not self._entries:
+            return None
+        oldest = self._entries[0][4]
+        if self.batch_window <= 0 or len(self._entries) >= self.batch_max:
+            return oldest
+        if len(self._entries) == 1 and oldest - self._last_take >= self.batch_window:
+            return oldest  # A lone entry after a quiet period is not held back
+        return oldest + self.batch_window
+
+    def take(self, now):
+        """Take the entries due for dispatch: the oldest one, or up to batch_max when batching."""
+        count = self.batch_max if self.batch_window > 0 else 1
+        batch = []
+        while self._entries and len(batch) < count:
+            entry = self._entries.popleft()
+            if entry[3] is not None:
+                del self._keyed[entry[3]]
+            waited = now - entry[4]
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+            batch.append(entry)
+        self.dispatched += len(batch)
+        self._last_take = now
+        self._not_full.set()
+        return batch
+
+    def stats(self, now=None):
+        now = self._clock() if now is None else now
+        return {
+            "class": self.name,
+            "weight": self.weight,
+            "depth": len(self._entries),
+            "max_size": self.max_size,
+            "dispatched": self.dispatched,
+            "conflated": self.conflated,
+            "blocked": self.blocked,
+            "avg_wait_ms": round(self.wait_total / self.dispatched * 1000, 3) if self.dispatched else 0.0,
+            "max_wait_ms": round(self.wait_max * 1000, 3),
+            "oldest_wait_ms": round((now - self._entries[0][4]) * 1000, 3) if self._entries else 0.0,
+        }
+
+
+class WeightedScheduler:
+    """
+    The priority classes and the smooth weighted round-robin between them.
+
+    Args:
+        weights: Class name -> weight (missing classes use DEFAULT_PRIORITY_WEIGHTS).
+        queue_sizes: Class name -> queue bound (missing classes use DEFAULT_PRIORITY_QUEUE_SIZES).
+        clock: Time source (monotonic seconds).
+    """
+
+    def __init__(self, weights=None, queue_sizes=None, clock=time.monotonic):
+        self._clock = clock
+        self.classes = {
+            name: PriorityClass(
+                name,
+                _class_option(weights, DEFAULT_PRIORITY_WEIGHTS, name),
+                _class_option(queue_sizes, DEFAULT_PRIORITY_QUEUE_SIZES, name),
+                clock=clock,
+            )
+            for name in PRIORITY_CLASSES
+        }
+        self._changed = asyncio.Event()  # Set when a class may have become ready sooner
+
+    async def put(self, class_name, message, msg_type=None, seq=None, key=None):
+        """Queue an entry in a class, waiting while the class is full."""
+        queue = self.classes[class_name]
+        if not queue.put_nowait(message, msg_type, seq, key):
+            queue.blocked += 1
+            while not queue.put_nowait(message, msg_type, seq, key):
+                await queue._not_full.wait()
+        # Wake the dispatcher only when this can make the class ready earlier
+        if queue.batch_window <= 0 or len(queue) == 1 or len(queue) >= queue.batch_max:
+            self._changed.set()
+
+    async def get(self):
+        """
+        Wait for a class to be ready and take its entries.
+
+        Returns:
+            (class name, [entry, ...]); entries are [message, type, seq, key, enqueued_at].
+        """
+        while True:
+            now = self._clock()
+            ready = []
+            next_at = None
+            for queue in self.classes.values():
+                at = queue.ready_at()
+                if at is None:
+                    continue
+                if at <= now:
+                    ready.append(queue)
+                elif next_at is None or at < next_at:
+                    next_at = at
+            if ready:
+                queue = self._pick(ready)
+                return queue.name, queue.take(now)
+            self._changed.clear()
+            if next_at is None:
+                await self._changed.wait()
+            else:
+                # Only a held-back batch is pending: wait for its window (or for news)
+                try:
+                    await asyncio.wait_for(self._changed.wait(), next_at - now)
+                except asyncio.TimeoutError:
+                    pass
+
+    @staticmethod
+    def _pick(ready):
+        """Smooth weighted round-robin: credit every ready class its weight, serve the richest."""
+        total = 0
+        best = None
+        for queue in ready:
+            queue._current += queue.weight
+            total += queue.weight
+            if best is None or queue._current > best._current:
+                best = queue
+        best._current -= total
+        return best
+
+    def stats(self):
+        """Depth, bound, dispatch count and wait times of every class."""
+        now = self._clock()
+        return [queue.stats(now) for queue in self.classes.values()]
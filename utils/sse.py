@@ -0,0 +1,149 @@
+"""
+Server-Sent Events transport for read-only consumers of the ConnectionManager bus.
+
+An SSEConnection stands in for a WebSocket: ConnectionManager registers it like
+any other client (topics, per-client queue, slow-consumer policy, chat resume)
+and the app streams what its writer sends as a text/event-stream response
+(/sse). Overlays only ever receive, so they can skip the bidirectional socket
+and its receive loop, and the stream passes through plain HTTP proxies.
+
+Chat events carry their seq as the SSE id, so a reconnecting EventSource sends
+it back as Last-Event-ID and ConnectionManager replays what it missed.
+
+Starlette stops iterating the response body when the client goes away but does
+not close the generator, so its cleanup would only run at garbage collection.
+The stream therefore also polls the request's is_disconnected() and
+unregisters the client itself.
+"""
+
+import asyncio
+import functools
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+SSE_KEEPALIVE_INTERVAL = 15.0  # Seconds of silence before a comment line keeps proxies from timing out
+SSE_RETRY_MS = 5000  # Reconnect delay suggested to EventSource (the overlays' WebSocket retry delay)
+SSE_DISCONNECT_POLL_INTERVAL = 1.0  # Seconds between checks that the client is still connected
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no",  # Stop nginx from buffering the stream
+}
+
+
+@functools.lru_cache(maxsize=512)
+def sse_frame(message):
+    """
+    Format an encoded event as an SSE frame.
+
+    The id is the event's seq (the last one for a kick_chat_batch frame); events
+    without one get no id, so EventSource keeps the last chat seq it saw.
+    Cached: the same message string is queued for every client.
+    """
+    seq = None
+    try:
+        event = json.loads(message)
+        if event.get("type") == "kick_chat_batch":
+            seq = event["data"]["messages"][-1].get("seq")
+        else:
+            seq = event.get("seq")
+    except (TypeError, ValueError, AttributeError, KeyError, IndexError):
+        pass
+    data = "".join(f"data: {line}\n" for line in message.split("\n"))
+    return (f"id: {seq}\n" if seq is not None else "") + data + "\n"
+
+
+def parse_last_event_id(value):
+    """The chat seq to resume from, from a Last-Event-ID header (None if absent or not a seq)."""
+    try:
+        return int(value) if value not in (None, "") else None
+    except (TypeError, ValueError):
+        logger.debug(f"Ignoring Last-Event-ID '{value}'")
+        return None
+
+
+class SSEConnection:
+    """
+    WebSocket stand-in whose sends become frames of an SSE response body.
+
+    A send waits until the response has taken the previous frame, so a slow
+    reader backs up into its ConnectionManager queue like a slow WebSocket does.
+
+    Args:
+        client: The peer address (for logs and stats).
+    """
+
+    def __init__(self, client=None):
+        self.client = client
+        self._frames = asyncio.Queue(maxsize=1)
+        self.closed = False
+        self._finished = False  # on_close has run
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, message):
+        await self._frames.put(sse_frame(message))
+
+    async def close(self, code=None):
+        """End the stream (the EventSource reconnects after SSE_RETRY_MS)."""
+        if self.closed:
+            return
+        self.closed = True
+        while not self._frames.empty():
+            self._frames.get_nowait()
+        self._frames.put_nowait(None)
+
+    async def stream(self, on_close=None, keepalive=SSE_KEEPALIVE_INTERVAL, is_disconnected=None,
+                     poll_interval=SSE_DISCONNECT_POLL_INTERVAL):
+        """
+        Yield the response body: the retry hint, then frames as they are sent.
+
+        Args:
+            on_close: Called once with this connection when the stream ends (client gone or closed).
+            keepalive: Seconds of silence before a keepalive comment is sent.
+            is_disconnected: Async callable telling whether the client has gone (Request.is_disconnected).
+            poll_interval: Seconds between is_disconnected checks.
+        """
+        watcher = None
+        if is_disconnected:
+            watcher = asyncio.create_task(self._watch_disconnect(is_disconnected, on_close, poll_interval))
+        try:
+            yield f"retry: {SSE_RETRY_MS}\n\n"
+            while True:
+                try:
+                    # asyncio.timeout, unlike wait_for, does not start a task per frame
+                    async with asyncio.timeout(keepalive):
+                        frame = await self._frames.get()
+                except TimeoutError:
+                    frame = ": keepalive\n\n"
+                if frame is None:
+                    return
+                yield frame
+        finally:
+            if watcher:
+                watcher.cancel()
+            self._finish(on_close)
+
+    async def _watch_disconnect(self, is_disconnected, on_close, poll_interval):
+        """Unregister as soon as the client has gone, even if the body generator is never closed."""
+        while not self.closed:
+            await asyncio.sleep(poll_interval)
+            try:
+                gone = await is_disconnected()
+            except Exception as e:
+                logger.debug(f"Could not check SSE client {self.client}: {e}")
+                gone = True
+            if gone:
+                await self.close()
+                self._finish(on_close)
+                return
+
+    def _finish(self, on_close):
+        self.closed = True
+        if self._finished:
+            return
+        self._finished = True
+        if on_close:
+            on_close(self)